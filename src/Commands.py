@@ -0,0 +1,128 @@
+"""
+Control commands of the vehicles. Commands are queued from any thread (ROS,
+local transport, GUI) with the wall time they were received at and applied
+by the physics thread at the start of the next tick, so a tick never sees a
+half written command. The queue measures the latency from receipt to the
+tick applying a command and to the first odometry reflecting it.
+"""
+import math
+import time
+import collections
+
+from Diagnostics import getChannel
+
+PHYSICS = getChannel("physics")
+
+#throttle and steering are None to keep the current value, steeringDelta is
+#added to the steering when applied, received is the time.perf_counter() of
+#the receipt
+Command = collections.namedtuple("Command",
+                                 ["vehicle", "throttle", "steering", "steeringDelta",
+                                  "received", "source"])
+
+class LatencyStats:
+    """
+    Latencies in seconds, the latest samples are kept for the percentiles
+    """
+    def __init__(self, capacity=1000):
+        self.samples = collections.deque(maxlen=capacity)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, latency):
+        self.samples.append(latency)
+        self.count += 1
+        self.total += latency
+        self.max = max(self.max, latency)
+
+    def percentile(self, fraction):
+        samples = sorted(self.samples)
+        if not samples:
+            return math.nan
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+    def summary(self):
+        """
+        Returns:
+            dict: count, mean, p50, p99 and max, in seconds
+        """
+        return {"count": self.count,
+                "mean": self.total / self.count if self.count else math.nan,
+                "p50": self.percentile(0.5),
+                "p99": self.percentile(0.99),
+                "max": self.max}
+
+class CommandQueue:
+    """
+    Lock free queue of Commands, deque.append and popleft are atomic in
+    CPython. Writers call submit, the physics thread drain.
+    """
+    def __init__(self):
+        self.pending = collections.deque()
+        #Receipt time of the oldest applied command per vehicle that no
+        #odometry reported yet, by id(vehicle)
+        self.awaitingOdometry = {}
+
+        self.applyLatency = LatencyStats()
+        self.odometryLatency = LatencyStats()
+
+    def submit(self, vehicle, throttle=None, steering=None, source="", steeringDelta=None):
+        """
+        Queue a command for the next tick.
+
+        Args:
+            vehicle (Vehicle): the vehicle to control
+            throttle (float): new throttle, None to keep it
+            steering (float): new steering in [-1, 1], None to keep it
+            source (str): origin of the command, e.g. "ros"
+            steeringDelta (float): change of the steering at the time the
+                command is applied, e.g. from a key press
+        """
+        self.pending.append(Command(vehicle, throttle, steering, steeringDelta,
+                                    time.perf_counter(), source))
+
+    def drain(self):
+        """
+        Apply the queued commands in the order they were received
+        """
+        if not self.pending:
+            return
+        now = time.perf_counter()
+        while self.pending:
+            command = self.pending.popleft()
+            vehicle = command.vehicle
+            if command.throttle is not None:
+                vehicle.setThrottle(command.throttle)
+            if command.steering is not None:
+                vehicle.setSteering(command.steering)
+            if command.steeringDelta is not None:
+                vehicle.setSteering(vehicle.getSteering() + command.steeringDelta)
+            self.applyLatency.add(now - command.received)
+            self.awaitingOdometry.setdefault(id(vehicle), command.received)
+
+    def odometryPublished(self, vehicle):
+        """
+        Called by the odometry publishers after they sent the state of a
+        vehicle
+        """
+        received = self.awaitingOdometry.pop(id(vehicle), None)
+        if received is not None:
+            self.odometryLatency.add(time.perf_counter() - received)
+
+    def getMetrics(self):
+        """
+        Returns:
+            dict: LatencyStats summaries of receipt to applying tick
+                ("apply") and receipt to first odometry ("odometry")
+        """
+        return {"apply": self.applyLatency.summary(),
+                "odometry": self.odometryLatency.summary()}
+
+    def report(self):
+        for name, stats in self.getMetrics().items():
+            if stats["count"]:
+                PHYSICS.info("Command to {name} latency: {count} commands, mean {mean:.2f} ms, "
+                             "p99 {p99:.2f} ms, max {max:.2f} ms", name=name,
+                             count=stats["count"], mean=stats["mean"] * 1e3,
+                             p99=stats["p99"] * 1e3, max=stats["max"] * 1e3)
@@ -0,0 +1,186 @@
+"""
+Structured diagnostics replacing the scattered prints. Every subsystem logs
+through its own Channel with an independent level and optional rate limit.
+Hot paths guard their calls with the channel flags (e.g. channel.debugOn) so
+a disabled channel costs a single attribute lookup.
+"""
+import time
+import collections
+
+OFF = 0
+ERROR = 1
+WARNING = 2
+INFO = 3
+DEBUG = 4
+
+LEVELS = {"off": OFF, "error": ERROR, "warning": WARNING,
+          "info": INFO, "debug": DEBUG}
+LEVEL_NAMES = {value: name for name, value in LEVELS.items()}
+
+SUBSYSTEMS = ("physics", "loader", "sensors", "render", "ros", "transport", "editor",
+              "gui")
+
+DEFAULT_LEVEL = INFO
+
+Record = collections.namedtuple("Record",
+                                ["time", "channel", "level", "message", "fields"])
+
+def formatRecord(record):
+    """
+    Human readable form of a record, the message template is only formatted
+    here so records that never reach a console stay cheap.
+    """
+    try:
+        text = record.message.format(**record.fields)
+    except (KeyError, IndexError, ValueError):
+        text = f"{record.message} {record.fields}"
+    return f"[{record.channel}:{LEVEL_NAMES[record.level]}] {text}"
+
+class MemorySink:
+    """
+    Bounded ring buffer of the latest records. deque.append with a maxlen is
+    atomic in CPython, writers from any thread never take a lock.
+    """
+    def __init__(self, capacity=10000):
+        self.records = collections.deque(maxlen=capacity)
+
+    def write(self, record):
+        self.records.append(record)
+
+    def snapshot(self):
+        return list(self.records)
+
+    def clear(self):
+        self.records.clear()
+
+class ConsoleSink:
+    """
+    Prints the records to stdout
+    """
+    def write(self, record):
+        print(formatRecord(record))
+
+class Channel:
+    """
+    Diagnostics of a single subsystem
+    """
+    def __init__(self, name, diagnostics, level=DEFAULT_LEVEL):
+        self.name = name
+        self.diagnostics = diagnostics
+
+        self.level = OFF
+        self.errorOn = False
+        self.warningOn = False
+        self.infoOn = False
+        self.debugOn = False
+
+        #Minimum seconds between two records of the same message, 0 disables
+        self.minInterval = 0.0
+        self.lastEmit = {}
+        self.suppressed = 0
+
+        self.setLevel(level)
+
+    def setLevel(self, level, rate=None):
+        """
+        Change the level of the channel.
+
+        Args:
+            level (int|str): one of the level constants or their names
+            rate (float): maximum records per second per message, None keeps
+                the current limit and 0 removes it
+        """
+        if isinstance(level, str):
+            level = LEVELS[level.lower()]
+        self.level = level
+        self.errorOn = level >= ERROR
+        self.warningOn = level >= WARNING
+        self.infoOn = level >= INFO
+        self.debugOn = level >= DEBUG
+
+        if rate is not None:
+            self.minInterval = 1.0 / rate if rate > 0 else 0.0
+            self.lastEmit = {}
+
+    def emit(self, level, message, fields):
+        """
+        Create a record and hand it to the sinks, unless the level is
+        disabled or the message exceeds the rate limit.
+        """
+        if level > self.level:
+            return
+
+        now = time.monotonic()
+        if self.minInterval:
+            last = self.lastEmit.get(message)
+            if last is not None and now - last < self.minInterval:
+                self.suppressed += 1
+                return
+            self.lastEmit[message] = now
+
+        record = Record(now, self.name, level, message, fields)
+        for sink in self.diagnostics.sinks:
+            sink.write(record)
+
+    def error(self, message, **fields):
+        self.emit(ERROR, message, fields)
+
+    def warning(self, message, **fields):
+        self.emit(WARNING, message, fields)
+
+    def info(self, message, **fields):
+        self.emit(INFO, message, fields)
+
+    def debug(self, message, **fields):
+        self.emit(DEBUG, message, fields)
+
+class Diagnostics:
+    """
+    Registry of all the channels and the sinks they write to
+    """
+    def __init__(self):
+        self.channels = {}
+        self.memory = MemorySink()
+        self.console = ConsoleSink()
+        self.sinks = (self.memory, self.console)
+
+        for name in SUBSYSTEMS:
+            self.getChannel(name)
+
+    def getChannel(self, name):
+        channel = self.channels.get(name)
+        if channel is None:
+            channel = self.channels.setdefault(name, Channel(name, self))
+        return channel
+
+    def setConsole(self, enabled):
+        #Replaced as a whole so emitting threads never see a half updated tuple
+        if enabled:
+            self.sinks = (self.memory, self.console)
+        else:
+            self.sinks = (self.memory,)
+
+    def configure(self, spec):
+        """
+        Apply a level specification such as "physics=debug@10,*=warning".
+        The optional @N limits every message of the channel to N per second,
+        "*" applies to every channel.
+        """
+        for item in spec.split(","):
+            item = item.strip()
+            if not item:
+                continue
+            name, _, value = item.partition("=")
+            level, _, rate = value.partition("@")
+            if level.lower() not in LEVELS:
+                raise ValueError(f"Unknown diagnostics level {level}")
+
+            rate = float(rate) if rate else None
+            names = list(self.channels) if name == "*" else [name]
+            for channelName in names:
+                self.getChannel(channelName).setLevel(level, rate)
+
+DIAGNOSTICS = Diagnostics()
+
+def getChannel(name):
+    return DIAGNOSTICS.getChannel(name)
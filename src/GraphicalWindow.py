@@ -2,14 +2,27 @@
 Module handling all Qt5 and graphical interface functionality
 """
 import math
+import time
 
 from PyQt5.QtWidgets import (
         QMainWindow, QAction, QWidget,
         QScrollArea, QHBoxLayout, QListWidget)
-from PyQt5.QtGui import QPainter, QMouseEvent, QColor
-from PyQt5.QtCore import Qt, QTimer, QPoint
+from PyQt5.QtGui import (QPainter, QMouseEvent, QColor, QRegion, QPainterPath,
+                         QPolygonF, QPen)
+from PyQt5.QtCore import Qt, QTimer, QPoint, QPointF, QRect, QRectF
 
 from SimEngine import RenderEngine
+from RenderCache import StaticTileCache
+from VehicleRender import RectangleBatch, LidarOverlayRender
+from Diagnostics import DIAGNOSTICS, DEBUG, DEFAULT_LEVEL, getChannel
+
+EDITOR = getChannel("editor")
+
+MAX_DIRTY_RECTS = 64
+
+#Zoom limits of the canvas, in screen pixels per world unit
+MIN_ZOOM = 1.0 / 32
+MAX_ZOOM = 8.0
 
 class UIController:
     """
@@ -24,13 +37,135 @@ class UIController:
 
         self.editMode = False
         self.selectedListObject = next(iter(self.aliases))
-        print(self.selectedListObject)
+        EDITOR.debug("Selected alias {alias}", alias=self.selectedListObject)
+
+        #Select mode: picking, rubber band selection, moving and deleting
+        #static objects instead of creating them
+        self.selectMode = False
+        self.selectedObjects = {}
+        #Outline of the selection and its bounds, rebuilt when it changes
+        self.selectionPath = None
+        self.selectionBounds = None
+        #"move" or "band" while dragging in select mode
+        self.dragAction = None
 
     def toggleEditMode(self):
         self.editMode = not self.editMode
         self.mainArea.selectionList.setVisible(self.editMode)
         return self.editMode
 
+    def toggleSelectMode(self):
+        self.selectMode = not self.selectMode
+        if not self.selectMode:
+            self.setSelection([])
+        return self.selectMode
+
+    def setSelection(self, objs):
+        """
+        Replace the selected objects and rebuild their outline
+        """
+        self.selectedObjects = {id(obj): obj for obj in objs}
+        if not objs:
+            self.selectionPath = None
+            self.selectionBounds = None
+            return
+
+        path = QPainterPath()
+        bounds = [obj.getBounds() for obj in objs]
+        for obj in objs:
+            path.addPolygon(QPolygonF([QPointF(x, y) for x, y in obj.getCorners()]))
+            path.closeSubpath()
+        self.selectionPath = path
+        self.selectionBounds = (min(b[0] for b in bounds), min(b[1] for b in bounds),
+                                max(b[2] for b in bounds), max(b[3] for b in bounds))
+
+    def getSelection(self):
+        return list(self.selectedObjects.values())
+
+    def getDragDelta(self):
+        p1 = self.drawArea.dragStartPosition
+        p2 = self.drawArea.dragPosition
+        if p1 is None or p2 is None:
+            return 0, 0
+        return p2.x() - p1.x(), p2.y() - p1.y()
+
+    def startDrag(self, modifiers):
+        """
+        Decide at mouse press whether the drag moves the selection or draws
+        a rubber band. Clicking an unselected object selects it, with Shift
+        it is added to the selection.
+        """
+        if not self.selectMode:
+            return
+
+        pos = self.drawArea.dragStartPosition
+        hits = self.simEngine.pickStatic(pos.x(), pos.y())
+        if not hits:
+            self.dragAction = "band"
+            return
+
+        if not any(id(obj) in self.selectedObjects for obj in hits):
+            if modifiers & Qt.ShiftModifier:
+                self.setSelection(self.getSelection() + hits[:1])
+            else:
+                self.setSelection(hits[:1])
+        self.dragAction = "move"
+
+    def finishDrag(self, modifiers):
+        """
+        Apply the gesture at mouse release
+        """
+        if not self.selectMode:
+            self.createObject()
+            return
+
+        if self.dragAction == "move":
+            dx, dy = self.getDragDelta()
+            if dx or dy:
+                self.moveSelection(dx, dy)
+        elif self.dragAction == "band" and self.drawArea.dragPosition is not None:
+            p1 = self.drawArea.dragStartPosition
+            p2 = self.drawArea.dragPosition
+            band = (min(p1.x(), p2.x()), min(p1.y(), p2.y()),
+                    max(p1.x(), p2.x()), max(p1.y(), p2.y()))
+            objs = self.simEngine.queryStatic(band)
+            if modifiers & Qt.ShiftModifier:
+                objs = self.getSelection() + [obj for obj in objs
+                                              if id(obj) not in self.selectedObjects]
+            self.setSelection(objs)
+            EDITOR.debug("Selected {count} objects", count=len(objs))
+        elif self.dragAction == "band" and not modifiers & Qt.ShiftModifier:
+            #A click on empty space
+            self.setSelection([])
+        self.dragAction = None
+
+    def moveSelection(self, dx, dy):
+        """
+        Move the selected objects, the engines are updated once for the
+        whole gesture
+        """
+        objs = self.getSelection()
+        for obj in objs:
+            obj.pos.x += dx
+            obj.pos.y += dy
+        self.simEngine.moveStaticObjects(objs)
+        self.renderEngine.moveStaticObjects(self.getRenders(objs))
+        self.setSelection(objs)
+        EDITOR.debug("Moved {count} objects by ({dx}, {dy})", count=len(objs), dx=dx, dy=dy)
+
+    def deleteSelection(self):
+        objs = self.getSelection()
+        if not objs:
+            return
+        self.renderEngine.unregisterObjects(self.getRenders(objs), static=True)
+        self.simEngine.unregisterStaticObjects(objs)
+        self.setSelection([])
+        EDITOR.debug("Deleted {count} objects", count=len(objs))
+
+    def getRenders(self, objs):
+        renders = [self.renderEngine.getRender(obj) for obj in objs]
+        return [render for render in renders if render is not None]
+
     def selectListObject(self, item):
         self.selectedListObject = item.text()
 
@@ -59,7 +194,8 @@ class UIController:
 
         centerX = int((p1.x() + x4) / 2)
         centerY = int((p1.y() + y4) / 2)
-        print (centerX, centerY, angle+90, length, width)
+        EDITOR.debug("Create object at ({x}, {y}) angle {angle} length {length} width {width}",
+                     x=centerX, y=centerY, angle=angle+90, length=length, width=width)
 
         if self.editMode:
             alias = self.aliases[self.selectedListObject]
@@ -68,7 +204,77 @@ class UIController:
                 tmp.setDimensions(width, length)
             tmp.setAlias(alias)
             self.simEngine.registerStaticObject(tmp)
-            self.renderEngine.registerObject(alias.genRender(tmp))
+            self.renderEngine.registerObject(alias.genRender(tmp), static=True)
+
+    def getOverlayBounds(self):
+        """
+        Area covered by the editor drawings of the current mode
+        """
+        if not self.selectMode:
+            return self.getShadowBounds()
+
+        bounds = []
+        if self.selectionBounds:
+            dx, dy = self.getDragDelta() if self.dragAction == "move" else (0, 0)
+            minX, minY, maxX, maxY = self.selectionBounds
+            bounds.append((minX + dx - 2, minY + dy - 2, maxX + dx + 2, maxY + dy + 2))
+        if self.dragAction == "band" and self.drawArea.dragPosition is not None:
+            p1 = self.drawArea.dragStartPosition
+            p2 = self.drawArea.dragPosition
+            bounds.append((min(p1.x(), p2.x()) - 2, min(p1.y(), p2.y()) - 2,
+                           max(p1.x(), p2.x()) + 2, max(p1.y(), p2.y()) + 2))
+        if not bounds:
+            return None
+        return (min(b[0] for b in bounds), min(b[1] for b in bounds),
+                max(b[2] for b in bounds), max(b[3] for b in bounds))
+
+    def drawOverlay(self, painter):
+        if self.selectMode:
+            self.drawSelection(painter)
+        else:
+            self.drawSelectionShadow(painter)
+
+    def drawSelection(self, painter):
+        """
+        Outline the selected objects, following the mouse while they are
+        dragged, and the rubber band
+        """
+        pen = QPen(QColor(0, 120, 255))
+        pen.setCosmetic(True)
+        pen.setWidth(2)
+
+        if self.selectionPath is not None:
+            painter.save()
+            painter.setPen(pen)
+            painter.setBrush(QColor(0, 120, 255, 48))
+            if self.dragAction == "move":
+                painter.translate(*self.getDragDelta())
+            painter.drawPath(self.selectionPath)
+            painter.restore()
+
+        if self.dragAction == "band" and self.drawArea.dragPosition is not None:
+            p1 = self.drawArea.dragStartPosition
+            p2 = self.drawArea.dragPosition
+            painter.save()
+            painter.setPen(pen)
+            painter.setBrush(QColor(0, 120, 255, 24))
+            painter.drawRect(QRectF(QPointF(p1), QPointF(p2)).normalized())
+            painter.restore()
+
+    def getShadowBounds(self):
+        """
+        Area covered by the selection shadow, None when not dragging
+        """
+        if (self.drawArea.dragStartPosition is None or
+                self.drawArea.dragPosition is None):
+            return None
+
+        p1 = self.drawArea.dragStartPosition
+        p2 = self.drawArea.dragPosition
+        #The rotated shadow extends its width past the drag line
+        margin = 12
+        return (min(p1.x(), p2.x()) - margin, min(p1.y(), p2.y()) - margin,
+                max(p1.x(), p2.x()) + margin, max(p1.y(), p2.y()) + margin)
 
     def drawSelectionShadow(self, painter):
         """
@@ -127,48 +333,140 @@ class DrawWidget(QWidget):
     """
     def __init__(self, renderEngine, controller):
         super().__init__()
-        self.setMinimumSize(2000,2000)
-
         self.renderEngine = renderEngine
 
+        #Screen pixels per world unit, the canvas covers worldSize * zoom
+        self.zoom = 1.0
+        self.worldSize = (2000, 2000)
+        self.updateSize()
+        self.scrollArea = None
+
         self.dragging = False
         self.dragStartPosition = None
         self.dragPosition = None
 
+        #Global mouse position and scroll values when panning started
+        self.panStart = None
+
         self.controller = controller
 
+    def updateSize(self):
+        """
+        Grow the world to the scene and resize the canvas to the zoom
+        """
+        bounds = self.renderEngine.sceneBounds
+        if bounds:
+            self.worldSize = (max(self.worldSize[0], math.ceil(bounds[2])),
+                              max(self.worldSize[1], math.ceil(bounds[3])))
+        self.setMinimumSize(int(self.worldSize[0] * self.zoom),
+                            int(self.worldSize[1] * self.zoom))
+
+    def toWorld(self, pos):
+        return QPoint(int(pos.x() / self.zoom), int(pos.y() / self.zoom))
+
+    def toCanvasRect(self, bounds):
+        """
+        Canvas rectangle covering the world bounds (minX, minY, maxX, maxY)
+        """
+        minX, minY, maxX, maxY = bounds
+        x = math.floor(minX * self.zoom)
+        y = math.floor(minY * self.zoom)
+        return QRect(x, y, math.ceil(maxX * self.zoom) - x + 1,
+                     math.ceil(maxY * self.zoom) - y + 1)
+
+    def setZoom(self, zoom, anchor=None):
+        """
+        Change the zoom keeping the world point under the anchor in place.
+
+        Args:
+            zoom (float): new zoom, clamped to MIN_ZOOM..MAX_ZOOM
+            anchor (QPoint): canvas position, None uses the visible center
+        """
+        zoom = min(MAX_ZOOM, max(MIN_ZOOM, zoom))
+        if zoom == self.zoom:
+            return
+
+        if anchor is None:
+            anchor = self.visibleRegion().boundingRect().center()
+        hBar = self.scrollArea.horizontalScrollBar()
+        vBar = self.scrollArea.verticalScrollBar()
+        viewX = anchor.x() - hBar.value()
+        viewY = anchor.y() - vBar.value()
+        worldX = anchor.x() / self.zoom
+        worldY = anchor.y() / self.zoom
+
+        self.zoom = zoom
+        self.updateSize()
+        viewport = self.scrollArea.viewport().size()
+        self.resize(max(viewport.width(), self.minimumWidth()),
+                    max(viewport.height(), self.minimumHeight()))
+        hBar.setValue(int(worldX * zoom - viewX))
+        vBar.setValue(int(worldY * zoom - viewY))
+        self.update()
+
     def paintEvent(self, event):
         """
         Main drawing function for the GUI
         """
-        # pylint: disable=unused-argument
         painter = QPainter(self)
         painter.setRenderHint(QPainter.Antialiasing)
 
-        self.renderEngine.draw(painter)
+        #Only the part exposed by the event and shown by the scroll area
+        rect = event.rect().intersected(self.visibleRegion().boundingRect())
+        if rect.isEmpty():
+            painter.end()
+            return
+
+        zoom = self.zoom
+        painter.scale(zoom, zoom)
+        self.renderEngine.draw(painter, (rect.left() / zoom, rect.top() / zoom,
+                                         (rect.right() + 1) / zoom,
+                                         (rect.bottom() + 1) / zoom), zoom)
 
-        self.controller.drawSelectionShadow(painter)
+        self.controller.drawOverlay(painter)
 
         painter.end()
 
+    def wheelEvent(self, event):
+        """
+        Ctrl+wheel zooms around the cursor, the plain wheel scrolls
+        """
+        if event.modifiers() & Qt.ControlModifier and self.scrollArea:
+            self.setZoom(self.zoom * 2 ** (event.angleDelta().y() / 480), event.pos())
+            event.accept()
+        else:
+            event.ignore()
+
     def mousePressEvent(self, event: QMouseEvent):
         if event.button() == Qt.LeftButton:
             self.dragging = True
-            self.dragStartPosition = event.pos()
+            self.dragStartPosition = self.toWorld(event.pos())
+            self.controller.startDrag(event.modifiers())
+        elif event.button() == Qt.MiddleButton and self.scrollArea:
+            self.panStart = (event.globalPos(),
+                             self.scrollArea.horizontalScrollBar().value(),
+                             self.scrollArea.verticalScrollBar().value())
 
     def mouseMoveEvent(self, event: QMouseEvent):
         if self.dragging:
-            self.dragPosition = event.pos()
+            self.dragPosition = self.toWorld(event.pos())
+        if self.panStart:
+            start, startX, startY = self.panStart
+            delta = event.globalPos() - start
+            self.scrollArea.horizontalScrollBar().setValue(startX - delta.x())
+            self.scrollArea.verticalScrollBar().setValue(startY - delta.y())
 
     def mouseReleaseEvent(self, event: QMouseEvent):
         """
         Handles mouse release events
         """
+        if event.button() == Qt.MiddleButton:
+            self.panStart = None
         if event.button() == Qt.LeftButton:
-            print(self.controller)
-            self.controller.createObject()
+            self.controller.finishDrag(event.modifiers())
             self.dragging = False
-            print(f"Start:{self.dragStartPosition}, End: {event.pos()}")
+            EDITOR.debug("Drag start: {start}, end: {end}",
+                         start=self.dragStartPosition, end=self.toWorld(event.pos()))
 
             self.dragStartPosition = None
             self.dragPosition = None
@@ -182,10 +480,14 @@ class MainWindow(QMainWindow):
         self.setGeometry(100, 100, 800, 800)
 
         self.vehicle = None
+        self.lidar = None
+        self.lidarOverlay = None
         self.scenario = scenario
         self.simEngine = simEngine
 
         self.renderEngine = RenderEngine()
+        self.renderEngine.setStaticBatch(RectangleBatch())
+        self.renderEngine.setStaticLayer(StaticTileCache(self.renderEngine.drawStatic))
 
         #Pylint is right this class contains a lot of attributes I need to
         #refactor all theses classes (the upper ones above as well)
@@ -198,11 +500,62 @@ class MainWindow(QMainWindow):
         editAction.triggered.connect(self.enableEditMode)
         fileMenu.addAction(editAction)
 
+        selectAction = QAction("Se&lect", self)
+        selectAction.setShortcut("Ctrl+L")
+        selectAction.setCheckable(True)
+        selectAction.toggled.connect(self.enableSelectMode)
+        fileMenu.addAction(selectAction)
+
         saveAction = QAction("&Save", self)
         saveAction.setShortcut("Ctrl+S")
         saveAction.triggered.connect(self.saveScenario)
         fileMenu.addAction(saveAction)
 
+        viewMenu = menuBar.addMenu("&View")
+
+        cacheAction = QAction("&Cache static layer", self)
+        cacheAction.setCheckable(True)
+        cacheAction.setChecked(True)
+        cacheAction.toggled.connect(self.setStaticCache)
+        viewMenu.addAction(cacheAction)
+
+        self.lidarAction = QAction("Show &lidar", self)
+        self.lidarAction.setCheckable(True)
+        self.lidarAction.setEnabled(False)
+        self.lidarAction.toggled.connect(self.showLidar)
+        viewMenu.addAction(self.lidarAction)
+
+        zoomInAction = QAction("Zoom &in", self)
+        zoomInAction.setShortcut("Ctrl++")
+        zoomInAction.triggered.connect(lambda: self.zoomBy(2.0))
+        viewMenu.addAction(zoomInAction)
+
+        zoomOutAction = QAction("Zoom &out", self)
+        zoomOutAction.setShortcut("Ctrl+-")
+        zoomOutAction.triggered.connect(lambda: self.zoomBy(0.5))
+        viewMenu.addAction(zoomOutAction)
+
+        zoomResetAction = QAction("&Reset zoom", self)
+        zoomResetAction.setShortcut("Ctrl+0")
+        zoomResetAction.triggered.connect(lambda: self.contentWidget.setZoom(1.0))
+        viewMenu.addAction(zoomResetAction)
+
+        diagMenu = menuBar.addMenu("&Diagnostics")
+        for name, channel in DIAGNOSTICS.channels.items():
+            debugAction = QAction(f"Debug {name}", self)
+            debugAction.setCheckable(True)
+            debugAction.setChecked(channel.debugOn)
+            debugAction.toggled.connect(
+                lambda checked, channel=channel:
+                    channel.setLevel(DEBUG if checked else DEFAULT_LEVEL))
+            diagMenu.addAction(debugAction)
+
+        consoleAction = QAction("Print to console", self)
+        consoleAction.setCheckable(True)
+        consoleAction.setChecked(True)
+        consoleAction.toggled.connect(DIAGNOSTICS.setConsole)
+        diagMenu.addAction(consoleAction)
+
         # Create a central widget and set it
         centralWidget = QWidget()
         self.setCentralWidget(centralWidget)
@@ -224,6 +577,7 @@ class MainWindow(QMainWindow):
 
         # Set the content widget to the scroll area
         self.scrollArea.setWidget(self.contentWidget)
+        self.contentWidget.scrollArea = self.scrollArea
 
         # Add the scroll area to the main layout
         layout.addWidget(self.scrollArea)
@@ -239,8 +593,15 @@ class MainWindow(QMainWindow):
         layout.addWidget(self.selectionList)
 
 
+        self.frameCount = 0
+        self.lastShadowBounds = None
+        self.statusText = ""
+        #Scene area the canvas was last sized for
+        self.sceneBounds = None
+
         # Create and setup the timer
         self.timer = QTimer(self)
+        self.timer.setTimerType(Qt.PreciseTimer)
         self.timer.timeout.connect(self.updateRotation)
         self.timer.start(16)  # 16ms = ~60 FPS
 
@@ -255,42 +616,124 @@ class MainWindow(QMainWindow):
     def setMainVehicle(self, vehicle):
         self.vehicle = vehicle
 
+    def setLidar(self, lidar):
+        """
+        Lidar whose scans can be shown from the View menu
+        """
+        self.lidar = lidar
+        self.lidarAction.setEnabled(lidar is not None)
+
+    def showLidar(self, enabled):
+        #The lidar is only sampled while its overlay is shown, or while
+        #other consumers want it
+        if self.lidarOverlay:
+            self.renderEngine.unregisterOverlay(self.lidarOverlay)
+            self.lidar.removeConsumer(self.lidarOverlay)
+            self.lidarOverlay = None
+        if enabled and self.lidar:
+            self.lidarOverlay = LidarOverlayRender(self.lidar.getScanBuffer())
+            self.renderEngine.registerOverlay(self.lidarOverlay)
+            self.lidar.addConsumer(self.lidarOverlay)
+
+    def setStaticCache(self, enabled):
+        self.renderEngine.setStaticLayer(
+            StaticTileCache(self.renderEngine.drawStatic) if enabled else None)
+
+    def zoomBy(self, factor):
+        self.contentWidget.setZoom(self.contentWidget.zoom * factor)
+
     def enableEditMode(self):
         status = self.controller.toggleEditMode()
-        print("Edit Mode Enabled", status)
+        EDITOR.info("Edit mode enabled: {status}", status=status)
+
+    def enableSelectMode(self):
+        status = self.controller.toggleSelectMode()
+        EDITOR.info("Select mode enabled: {status}", status=status)
 
     def saveScenario(self):
-        print("Save Scenario")
+        EDITOR.info("Save scenario")
         self.scenario.saveScenario(self.simEngine)
 
     def updateRotation(self):
-        self.contentWidget.update()    # Request repaint
+        #Physics runs at its own rate, draw the poses interpolated to now
+        self.renderEngine.updatePoses(self.simEngine.getSnapshots(), time.perf_counter())
+        if self.renderEngine.sceneBounds != self.sceneBounds:
+            self.sceneBounds = self.renderEngine.sceneBounds
+            self.contentWidget.updateSize()
+        self.repaintDirty()
+
+        #Culling statistics, refreshed twice per second
+        self.frameCount += 1
+        if self.frameCount % 30 == 0:
+            statusText = (f"Drawn: {self.renderEngine.drawnCount} "
+                          f"Culled: {self.renderEngine.culledCount}")
+            if not self.renderEngine.staticCounted:
+                #The tiles of the static cache do not know their objects
+                statusText += " (dynamic objects, statics cached)"
+            if statusText != self.statusText:
+                self.statusText = statusText
+                self.statusBar().showMessage(statusText)
 
         if self.vehicle is None:
             return
 
-        self.scrollArea.ensureVisible(int(self.vehicle.pos.x),
-                                      int(self.vehicle.pos.y),
+        zoom = self.contentWidget.zoom
+        self.scrollArea.ensureVisible(int(self.vehicle.pos.x * zoom),
+                                      int(self.vehicle.pos.y * zoom),
                                       300,
                                       300)
 
+    def repaintDirty(self):
+        """
+        Request a repaint of the areas that changed since the last frame,
+        nothing at all when the scene is idle
+        """
+        rects = self.renderEngine.collectDirtyRects()
+
+        shadowBounds = self.controller.getOverlayBounds()
+        if shadowBounds != self.lastShadowBounds:
+            for bounds in (self.lastShadowBounds, shadowBounds):
+                if bounds:
+                    rects.append(bounds)
+            self.lastShadowBounds = shadowBounds
+
+        if not rects:
+            return
+
+        #Uniting many rectangles in a QRegion is quadratic, e.g. after a bulk
+        #load, a single bounding rectangle is much cheaper
+        if len(rects) > MAX_DIRTY_RECTS:
+            rects = [(min(rect[0] for rect in rects), min(rect[1] for rect in rects),
+                      max(rect[2] for rect in rects), max(rect[3] for rect in rects))]
+
+        region = QRegion()
+        for bounds in rects:
+            region = region.united(self.contentWidget.toCanvasRect(bounds))
+        self.contentWidget.update(region)
+
     def keyPressEvent(self, event):
         """
         Handle GUI input events
         """
         #if event.isAutoRepeat():
         #    return  # Ignore auto-repeat events
+        if event.key() == Qt.Key_Delete and self.controller.selectMode:
+            self.controller.deleteSelection()
+            return
+
         if self.vehicle is None:
             return
 
+        #Applied by the physics thread at the start of the next tick
+        commands = self.simEngine.commands
         if event.key() == Qt.Key_W:
-            self.vehicle.setThrottle(1)
+            commands.submit(self.vehicle, throttle=1, source="gui")
         elif event.key() == Qt.Key_S:
-            self.vehicle.setThrottle(-1)
+            commands.submit(self.vehicle, throttle=-1, source="gui")
         elif event.key() == Qt.Key_A:
-            self.vehicle.setSteering(self.vehicle.getSteering()-1/16)
+            commands.submit(self.vehicle, steeringDelta=-1/16, source="gui")
         elif event.key() == Qt.Key_D:
-            self.vehicle.setSteering(self.vehicle.getSteering()+1/16)
+            commands.submit(self.vehicle, steeringDelta=1/16, source="gui")
         else:
             super().keyPressEvent(event)
 
@@ -304,12 +747,11 @@ class MainWindow(QMainWindow):
             return
 
         if event.key() == Qt.Key_W:
-            self.vehicle.setThrottle(0)
+            self.simEngine.commands.submit(self.vehicle, throttle=0, source="gui")
         elif event.key() == Qt.Key_S:
-            self.vehicle.setThrottle(0)
-        elif event.key() == Qt.Key_A:
-            self.vehicle.setAngle(0)
-        elif event.key() == Qt.Key_D:
-            self.vehicle.setAngle(0)
+            self.simEngine.commands.submit(self.vehicle, throttle=0, source="gui")
+        elif event.key() in (Qt.Key_A, Qt.Key_D):
+            #The steering stays where the key presses moved it
+            pass
         else:
             super().keyReleaseEvent(event)
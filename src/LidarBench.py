@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Measures the cost of a lidar scan, split into the ray casting kernel and the
+ROS publishing of the result, and the cost of a SensorManager pass over
+several lidars, once casting every ray and once reusing the scans of lidars
+whose surroundings did not change. Publishing is only measured when rclpy is available, nothing
+has to subscribe to the topic.
+
+Example:
+    PYTHONPATH=src python3 src/LidarBench.py --walls 20 --scans 200 --lidars 10
+"""
+import math
+import time
+import argparse
+
+from SimEngine import SimEngine
+from SceneObjects import SceneObject
+from Sensors import Lidar, SensorManager
+
+def makeScene(walls, radius=500.0):
+    """
+    Scan target: a ring of walls around the origin
+    """
+    simEngine = SimEngine()
+    for i in range(walls):
+        angle = 360.0 * i / walls
+        rads = math.radians(angle)
+        simEngine.registerStaticObject(SceneObject((math.cos(rads) * radius,
+                                                    math.sin(rads) * radius),
+                                                   angle,
+                                                   {"width": 10, "length": 100}))
+    return simEngine
+
+def timePerCall(function, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        function()
+    return (time.perf_counter() - start) / count
+
+def sampleFull(manager):
+    """
+    Sample every lidar from scratch, as after a move of each one
+    """
+    for sensor in manager.getSensors():
+        sensor.cacheKey = None
+    manager.sample(math.inf)
+
+def benchPublish(simEngine, lidar, scans):
+    """
+    Args:
+        simEngine (SimEngine): the scene providing the clock of the bridge
+        lidar (Lidar): the lidar whose scan is published
+        scans (int): number of publish calls to time
+
+    Returns:
+        float: seconds per publishLidar call, None without rclpy
+    """
+    try:
+        from RosNodes import RosBridge # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return None
+
+    bridge = RosBridge(simEngine)
+    bridge.addVehicle(lidar.vehicle, "bench")
+    bridge.start()
+    try:
+        return timePerCall(lambda: bridge.publishLidar(lidar.rosRanges, lidar, 1.5,
+                                                       lidar.interval), scans)
+    finally:
+        bridge.stop()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure lidar scan and publish cost")
+    parser.add_argument("--walls", type=int, default=20, help="Number of walls to scan")
+    parser.add_argument("--scans", type=int, default=100, help="Number of scans to time")
+    parser.add_argument("--lidars", type=int, default=10,
+                        help="Number of lidars sampled by the SensorManager")
+    args = parser.parse_args()
+
+    SIM_ENGINE = makeScene(args.walls)
+    #Any object can carry the lidar, the bridge only keys on it
+    LIDAR = Lidar(SceneObject((0, 0), 0, {"width": 10, "length": 10}))
+    OBJECTS = SIM_ENGINE.getAllObjects()
+
+    SCAN = timePerCall(lambda: LIDAR.scan(0.0, 0.0, 0.0, OBJECTS), args.scans)
+    print(f"scan:    {SCAN * 1e3:.3f} ms ({len(LIDAR.ranges)} rays, {args.walls} walls)")
+
+    MANAGER = SensorManager(SIM_ENGINE)
+    MANAGER.addSensors(Lidar(SceneObject((i * 10.0, 0), 0, {"width": 10, "length": 10}))
+                       for i in range(args.lidars))
+    for SENSOR in MANAGER.getSensors():
+        SENSOR.addConsumer("bench")
+    FULL = timePerCall(lambda: sampleFull(MANAGER), args.scans)
+    print(f"sample:  {FULL * 1e3:.3f} ms ({args.lidars} lidars, full scans)")
+    CACHED = timePerCall(lambda: MANAGER.sample(math.inf), args.scans)
+    print(f"cached:  {CACHED * 1e3:.3f} ms ({args.lidars} lidars, scans reused)")
+
+    PUBLISH = benchPublish(SIM_ENGINE, LIDAR, args.scans)
+    if PUBLISH is None:
+        print("publish: skipped, rclpy is not available")
+    else:
+        print(f"publish: {PUBLISH * 1e6:.1f} us")
@@ -0,0 +1,364 @@
+"""
+ROS free telemetry and control over a UNIX domain socket. The server mirrors
+the ROS topics of the vehicles (cmd_vel in, odom, pose, icr and lidar out)
+and LocalClient is a small client library, both only need the standard
+library so they also work on machines without ROS and from tests.
+
+Every frame is one SOCK_SEQPACKET record: a fixed header followed by the
+payload of the topic, little endian, units and angles as in the ROS topics
+(meters, radians). Records are sent whole or not at all, a subscriber that
+does not keep up loses frames instead of slowing down the simulation.
+"""
+import os
+import math
+import socket
+import struct
+import selectors
+import threading
+import collections
+from array import array
+
+from Diagnostics import getChannel
+
+TRANSPORT = getChannel("transport")
+
+#Topics
+CMD_VEL = 1
+ODOM = 2
+POSE = 3
+ICR = 4
+LIDAR = 5
+#Vehicle names, sent by the server on connect
+VEHICLES = 6
+#Topic mask and vehicle of a client
+SUBSCRIBE = 7
+
+#Vehicle index of messages about all vehicles
+ALL_VEHICLES = 0xFFFF
+
+#topic, vehicle index, stamp in seconds
+HEADER = struct.Struct("<BHd")
+CMD_VEL_DATA = struct.Struct("<dd")
+#x, y, yaw, speed, steering angle
+ODOM_DATA = struct.Struct("<5d")
+#x, y, yaw
+POSE_DATA = struct.Struct("<3d")
+#x, y
+ICR_DATA = struct.Struct("<2d")
+#x, y of the lidar and angle min in the vehicle frame, angle increment,
+#followed by the float32 ranges
+LIDAR_DATA = struct.Struct("<4d")
+#topic mask
+SUBSCRIBE_DATA = struct.Struct("<I")
+
+#Payloads of the frames a client sends
+PAYLOADS = {CMD_VEL: CMD_VEL_DATA, SUBSCRIBE: SUBSCRIBE_DATA}
+
+MAX_FRAME = 1 << 20
+
+OdomData = collections.namedtuple("OdomData", ["x", "y", "yaw", "speed", "steering"])
+PoseData = collections.namedtuple("PoseData", ["x", "y", "yaw"])
+IcrData = collections.namedtuple("IcrData", ["x", "y"])
+ScanData = collections.namedtuple("ScanData", ["x", "y", "angleMin", "angleIncrement", "ranges"])
+#A received frame, data is one of the tuples above
+Message = collections.namedtuple("Message", ["topic", "vehicle", "stamp", "data"])
+
+def topicMask(topics):
+    mask = 0
+    for topic in topics:
+        mask |= 1 << topic
+    return mask
+
+STATE_TOPICS = topicMask((ODOM, POSE, ICR))
+
+class Subscriber:
+    """
+    A connected client and what it subscribed to
+    """
+    def __init__(self, sock):
+        self.sock = sock
+        self.mask = 0
+        self.vehicle = ALL_VEHICLES
+        self.dropped = 0
+
+    def wants(self, topic, vehicle):
+        return (self.mask >> topic) & 1 and self.vehicle in (ALL_VEHICLES, vehicle)
+
+class LocalTransport:
+    """
+    Server side of the local transport. Vehicle state is published after
+    every physics tick, scans when the lidar produces them, cmd_vel frames
+    are queued for the next tick.
+    """
+    def __init__(self, simEngine, path):
+        """
+        Args:
+            simEngine (SimEngine): the simulation providing state and clock
+            path (str): path of the socket file, replaced if it exists
+        """
+        self.simEngine = simEngine
+        self.path = path
+
+        #(name, vehicle), the index in this list identifies a vehicle
+        self.vehicles = []
+        self.vehicleIndex = {}
+
+        #Replaced as a whole on connect and disconnect, publishers iterate it
+        #without a lock
+        self.clients = ()
+        self.clientsLock = threading.Lock()
+        #Union of the subscribed topics, nothing is encoded without readers
+        self.mask = 0
+
+        self.sock = None
+        self.thread = None
+        self.running = False
+
+    def addVehicle(self, vehicle, name):
+        self.vehicleIndex[id(vehicle)] = len(self.vehicles)
+        self.vehicles.append((name, vehicle))
+
+    def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        self.sock.bind(self.path)
+        self.sock.listen()
+
+        self.running = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.start()
+        self.simEngine.addTickListener(self.publishState)
+
+    def stop(self):
+        self.simEngine.removeTickListener(self.publishState)
+        self.running = False
+        self.thread.join()
+        for client in self.clients:
+            client.sock.close()
+        self.clients = ()
+        self.sock.close()
+        os.unlink(self.path)
+
+    def run(self):
+        selector = selectors.DefaultSelector()
+        selector.register(self.sock, selectors.EVENT_READ)
+        while self.running:
+            for key, _ in selector.select(timeout=0.1):
+                if key.fileobj is self.sock:
+                    client = self.accept()
+                    selector.register(client.sock, selectors.EVENT_READ, client)
+                    continue
+
+                client = key.data
+                try:
+                    data = client.sock.recv(MAX_FRAME)
+                except OSError:
+                    data = b""
+                if data:
+                    self.handleFrame(client, data)
+                else:
+                    selector.unregister(client.sock)
+                    self.removeClient(client)
+        selector.close()
+
+    def accept(self):
+        sock, _ = self.sock.accept()
+        client = Subscriber(sock)
+        names = "\n".join(name for name, _ in self.vehicles).encode()
+        sock.sendall(HEADER.pack(VEHICLES, ALL_VEHICLES, self.simEngine.simTime) + names)
+        sock.setblocking(False)
+        with self.clientsLock:
+            self.clients = self.clients + (client,)
+        return client
+
+    def removeClient(self, client):
+        with self.clientsLock:
+            self.clients = tuple(other for other in self.clients if other is not client)
+            self.updateMask()
+        client.sock.close()
+
+    def updateMask(self):
+        mask = 0
+        for client in self.clients:
+            mask |= client.mask
+        self.mask = mask
+
+    def handleFrame(self, client, data):
+        if len(data) < HEADER.size:
+            TRANSPORT.warning("Dropping a truncated local transport frame")
+            return
+        topic, index, _ = HEADER.unpack_from(data)
+        payload = PAYLOADS.get(topic)
+        if payload is not None and len(data) < HEADER.size + payload.size:
+            TRANSPORT.warning("Dropping a truncated frame of topic {topic}, {size} bytes",
+                              topic=topic, size=len(data))
+            return
+        if topic == SUBSCRIBE:
+            client.mask, = SUBSCRIBE_DATA.unpack_from(data, HEADER.size)
+            client.vehicle = index
+            with self.clientsLock:
+                self.updateMask()
+        elif topic == CMD_VEL and index < len(self.vehicles):
+            linear, angular = CMD_VEL_DATA.unpack_from(data, HEADER.size)
+            self.simEngine.commands.submit(self.vehicles[index][1], linear, angular*2, "local")
+
+    def send(self, topic, index, buffers):
+        """
+        Send a frame made of buffers to the clients subscribed to it
+        """
+        for client in self.clients:
+            if not client.wants(topic, index):
+                continue
+            try:
+                client.sock.sendmsg(buffers)
+            except BlockingIOError:
+                client.dropped += 1
+            except OSError:
+                #Disconnected, the server thread removes it
+                pass
+
+    def publishState(self, simTime):
+        """
+        Tick listener publishing odom, pose and ICR of every vehicle
+        """
+        mask = self.mask
+        if not mask & STATE_TOPICS:
+            return
+
+        for index, (_, vehicle) in enumerate(self.vehicles):
+            x = vehicle.pos.x / 100
+            y = vehicle.pos.y / 100
+            yaw = math.radians(vehicle.getAngle())
+            if (mask >> ODOM) & 1:
+                self.send(ODOM, index, (HEADER.pack(ODOM, index, simTime),
+                                        ODOM_DATA.pack(x, y, yaw, vehicle.getSpeed(),
+                                                       math.radians(vehicle.steeringAngle))))
+                self.simEngine.commands.odometryPublished(vehicle)
+            if (mask >> POSE) & 1:
+                self.send(POSE, index, (HEADER.pack(POSE, index, simTime),
+                                        POSE_DATA.pack(x, y, yaw)))
+            icr = vehicle.getIcr() if (mask >> ICR) & 1 else None
+            if icr is not None:
+                self.send(ICR, index, (HEADER.pack(ICR, index, simTime),
+                                       ICR_DATA.pack(icr[0] / 100, icr[1] / 100)))
+
+    def wantsLidar(self, lidar):
+        """
+        Returns:
+            bool: a client is subscribed to the scans of the lidar
+        """
+        index = self.vehicleIndex.get(id(lidar.vehicle))
+        if index is None or not (self.mask >> LIDAR) & 1:
+            return False
+        return any(client.wants(LIDAR, index) for client in self.clients)
+
+    def publishLidar(self, ranges, lidar, stamp, scanTime):
+        """
+        Publish a scan of a lidar on a registered vehicle, same arguments as
+        RosBridge.publishLidar. The ranges are sent without a copy, the
+        mounting offset and angle of the lidar turn them into the vehicle
+        frame.
+        """
+        # pylint: disable=unused-argument
+        index = self.vehicleIndex.get(id(lidar.vehicle))
+        if index is None or not (self.mask >> LIDAR) & 1:
+            return
+        self.send(LIDAR, index, (HEADER.pack(LIDAR, index, stamp),
+                                 LIDAR_DATA.pack(lidar.offset.x / 100, lidar.offset.y / 100,
+                                                 math.radians(lidar.mountAngle + lidar.angleMin),
+                                                 math.radians(lidar.rayAngleIncrement)),
+                                 memoryview(ranges)))
+
+class LocalClient:
+    """
+    Client of a LocalTransport, e.g.:
+
+        with LocalClient("/tmp/truck-sim.sock") as client:
+            client.subscribe([ODOM, LIDAR], "MainVehicle")
+            client.sendCmdVel("MainVehicle", 0.5, 0.0)
+            message = client.receive(timeout=1.0)
+    """
+    def __init__(self, path, timeout=5.0):
+        """
+        Args:
+            path (str): socket file of the server
+            timeout (float): seconds to wait for the server greeting
+        """
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        self.sock.connect(path)
+        self.buffer = bytearray(MAX_FRAME)
+
+        self.sock.settimeout(timeout)
+        size = self.sock.recv_into(self.buffer)
+        names = bytes(self.buffer[HEADER.size:size]).decode()
+        self.vehicles = names.split("\n") if names else []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.sock.close()
+
+    def getVehicles(self):
+        return self.vehicles
+
+    def getIndex(self, vehicle):
+        if vehicle is None:
+            return ALL_VEHICLES
+        if isinstance(vehicle, str):
+            return self.vehicles.index(vehicle)
+        return vehicle
+
+    def subscribe(self, topics, vehicle=None):
+        """
+        Replace the subscription of this client.
+
+        Args:
+            topics (list): topics to receive, e.g. [ODOM, LIDAR]
+            vehicle (str): name or index of the vehicle, None for all
+        """
+        self.sock.sendall(HEADER.pack(SUBSCRIBE, self.getIndex(vehicle), 0.0) +
+                          SUBSCRIBE_DATA.pack(topicMask(topics)))
+
+    def sendCmdVel(self, vehicle, linear, angular):
+        """
+        Same as a Twist on cmd_vel with linear.x and angular.z
+        """
+        self.sock.sendall(HEADER.pack(CMD_VEL, self.getIndex(vehicle), 0.0) +
+                          CMD_VEL_DATA.pack(linear, angular))
+
+    def receive(self, timeout=None):
+        """
+        Wait for the next frame.
+
+        Returns:
+            Message: the frame, None if the timeout expired
+        """
+        self.sock.settimeout(timeout)
+        try:
+            size = self.sock.recv_into(self.buffer)
+        except socket.timeout:
+            return None
+        if size == 0:
+            raise ConnectionError("Local transport server closed the connection")
+
+        topic, index, stamp = HEADER.unpack_from(self.buffer)
+        offset = HEADER.size
+        if topic == ODOM:
+            data = OdomData._make(ODOM_DATA.unpack_from(self.buffer, offset))
+        elif topic == POSE:
+            data = PoseData._make(POSE_DATA.unpack_from(self.buffer, offset))
+        elif topic == ICR:
+            data = IcrData._make(ICR_DATA.unpack_from(self.buffer, offset))
+        elif topic == LIDAR:
+            x, y, angleMin, angleIncrement = LIDAR_DATA.unpack_from(self.buffer, offset)
+            ranges = array('f')
+            ranges.frombytes(self.buffer[offset + LIDAR_DATA.size:size])
+            data = ScanData(x, y, angleMin, angleIncrement, ranges)
+        else:
+            data = bytes(self.buffer[offset:size])
+        return Message(topic, index, stamp, data)
@@ -1,31 +1,70 @@
 #!/usr/bin/env python3
 """
-Main function for simulation startup
+Main function for simulation startup. Heavy subsystems (Qt, ROS) are only
+imported when the feature using them is enabled, headless runs never pay for
+them.
 """
+import time
+IMPORT_START = time.perf_counter()
+
+# pylint: disable=wrong-import-position
+import os
 import sys
 import signal
 import argparse
+import importlib
+from contextlib import contextmanager
 
-from PyQt5.QtWidgets import QApplication
-
-from VehicleImporter import easyImport
-from Sensors import Lidar
-from Utils import Vector2D
 from SimEngine import SimEngine
-from GraphicalWindow import MainWindow
 from ScenarioLoader import ScenarioLoader
+from Diagnostics import DIAGNOSTICS
 
-try:
-    from RosNodes import RosNode
-except ImportError as e:
-    print(f"Module RosNodes could not be imported: {e}")
+IMPORT_END = time.perf_counter()
 
 DEFAULT_MODEL = "models/car.yaml"
 DEFAULT_SCENARIO = "scenarios/default.yaml"
 
 SIM_ENGINE = None
-LIDAR = None
-ROS_NODE = None
+SENSORS = None
+RECORDER = None
+ROS_BRIDGE = None
+LOCAL_TRANSPORT = None
+APP = None
+
+class StartupProfiler:
+    """
+    Collects the duration of each startup phase, reported with
+    --startup-profile
+    """
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.start = IMPORT_START
+        self.phases = [("import core modules", IMPORT_END - IMPORT_START)]
+
+    @contextmanager
+    def phase(self, name):
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - begin))
+
+    def importModule(self, name):
+        with self.phase(f"import {name}"):
+            return importlib.import_module(name)
+
+    def report(self):
+        """
+        Print the duration of all the phases and the total startup time
+        """
+        if not self.enabled:
+            return
+
+        total = time.perf_counter() - self.start
+        print("Startup profile:")
+        for name, duration in self.phases:
+            print(f"  {name:<32}{duration * 1000:10.1f} ms")
+        print(f"  {'total':<32}{total * 1000:10.1f} ms")
 
 # Define a signal handler function
 def handleSigint(signalReceived, frame):
@@ -34,62 +73,233 @@ def handleSigint(signalReceived, frame):
     """
     # pylint: disable=unused-argument
     print("Ctrl+C pressed. Exiting the application...")
-    QApplication.quit()  # Gracefully quit the application
+    if APP:
+        APP.quit()  # Gracefully quit the application
 
     SIM_ENGINE.stop()
-    LIDAR.stop()
+    if SENSORS:
+        SENSORS.stop()
+    if RECORDER:
+        RECORDER.stop()
+
+def handleSigusr1(signalReceived, frame):
+    """
+    Toggle debug diagnostics of every channel, for headless runs
+    """
+    # pylint: disable=unused-argument
+    enable = not all(channel.debugOn for channel in DIAGNOSTICS.channels.values())
+    if enable:
+        DIAGNOSTICS.configure("*=debug")
+    else:
+        DIAGNOSTICS.configure(DIAG_SPEC)
+
+DIAG_SPEC = "*=info"
 
 if __name__ == '__main__':
     signal.signal(signal.SIGINT, handleSigint)
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, handleSigusr1)
 
     parser = argparse.ArgumentParser(description="A 2d truck/vehicle simulator")
     parser.add_argument("--scenario", default=DEFAULT_SCENARIO, help="The default map to load")
     parser.add_argument("--graphics", action="store_true", help="Start Qt5 window")
     parser.add_argument("--ros", action="store_true", help="Start ROS nodes (requires sourced ros)")
+    parser.add_argument("--sprite-step", type=float, default=1.0,
+                        help="Rotation step in degrees of the cached vehicle sprites, 0 disables the cache")
+    parser.add_argument("--sprite-cache-size", type=int, default=1024,
+                        help="Maximum number of cached vehicle sprites")
+    parser.add_argument("--startup-profile", action="store_true",
+                        help="Report import and scenario loading times")
+    parser.add_argument("--physics-rate", type=float, default=60.0,
+                        help="Fixed physics tick rate in Hz, rendering interpolates in between")
+    parser.add_argument("--real-time-factor", type=float, default=1.0,
+                        help="Simulated seconds per wall second, 0 runs as fast as possible")
+    parser.add_argument("--odom-rate", type=float, default=None, metavar="HZ",
+                        help="Odometry and TF updates per simulated second, every physics "
+                             "tick by default")
+    parser.add_argument("--ros-wall-time", action="store_true",
+                        help="Stamp ROS messages with the wall clock instead of the "
+                             "simulation time published on /clock")
+    parser.add_argument("--local-transport", default=None, metavar="SOCKET",
+                        help="Serve cmd_vel, odom, pose, icr and lidar on a UNIX socket, "
+                             "see LocalTransport.LocalClient")
+    parser.add_argument("--duration", type=float, default=None,
+                        help="Stop a headless simulation after this many seconds")
+    parser.add_argument("--map-resolution", type=float, default=10.0,
+                        help="Cell size of the occupancy grid in simulation units")
+    parser.add_argument("--export-map", default=None, metavar="PATH",
+                        help="Write the static scene as PATH.pgm/PATH.yaml for map_server")
+    parser.add_argument("--diag", default="",
+                        help="Diagnostics levels, e.g. physics=debug@10,loader=warning "
+                             "(SIGUSR1 toggles debug at runtime)")
+    parser.add_argument("--diag-quiet", action="store_true",
+                        help="Keep diagnostics in memory only, do not print them")
+    parser.add_argument("--record", default=None, metavar="PATH",
+                        help="Render frames offscreen: a PNG pattern (frames/f_%%05d.png), "
+                             "a directory or a .raw RGBA video file")
+    parser.add_argument("--record-size", default="800x600",
+                        help="Frame size of the recording, WIDTHxHEIGHT")
+    parser.add_argument("--record-fps", type=float, default=30.0,
+                        help="Frame rate of the recording")
+    parser.add_argument("--record-follow", action="store_true",
+                        help="Center the recording on the MainVehicle instead of fitting the scene")
+    parser.add_argument("--record-lidar", action="store_true",
+                        help="Draw the scans of the MainVehicle lidar into the recording")
     parser.add_argument("model", type=str, nargs='?', default=DEFAULT_MODEL,
                             help="Model of the vehicle")
 
     args = parser.parse_args()
+    profiler = StartupProfiler(args.startup_profile)
 
-    #Simulation Engine
-    SIM_ENGINE = SimEngine()
+    DIAG_SPEC = "*=info," + args.diag
+    DIAGNOSTICS.configure(DIAG_SPEC)
+    DIAGNOSTICS.setConsole(not args.diag_quiet)
 
-    scenario = ScenarioLoader(args.scenario)
+    #Simulation Engine
+    SIM_ENGINE = SimEngine(interval=1.0 / args.physics_rate,
+                           gridResolution=args.map_resolution,
+                           realTimeFactor=args.real_time_factor)
 
-    #Create Vehicle
-    #truck, truckRender = easyImport(args.model)
-    #truck.pos = Vector2D(100, 100)
+    with profiler.phase("parse scenario"):
+        scenario = ScenarioLoader(args.scenario)
 
-    #SIM_ENGINE.registerDynamicObject(truck)
-    #if args.graphics:
-    #    window.getRenderEngine().registerVehicle(truckRender)
+    window = None
+    if args.record and not args.graphics:
+        #Painting QImages needs a QGuiApplication, but never a display
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        QtGui = profiler.importModule("PyQt5.QtGui")
+        APP = QtGui.QGuiApplication(sys.argv)
 
     if args.graphics:
-        app = QApplication(sys.argv)
-        window = MainWindow(scenario, SIM_ENGINE)
+        QtWidgets = profiler.importModule("PyQt5.QtWidgets")
+        GraphicalWindow = profiler.importModule("GraphicalWindow")
+        VehicleRender = profiler.importModule("VehicleRender")
+        VehicleRender.configureSpriteCache(args.sprite_step, args.sprite_cache_size,
+                                           enabled=args.sprite_step > 0)
+        with profiler.phase("create window"):
+            APP = QtWidgets.QApplication(sys.argv)
+            window = GraphicalWindow.MainWindow(scenario, SIM_ENGINE)
+
+    with profiler.phase("instantiate scenario"):
+        scenario.instantiateScenario(SIM_ENGINE,
+                                     window.getRenderEngine() if window else None)
+
+    if args.export_map:
+        with profiler.phase("occupancy grid"):
+            SIM_ENGINE.getOccupancyGrid().savePgm(args.export_map)
 
-    scenario.instantiateScenario(SIM_ENGINE, window.getRenderEngine())
     vehicle = scenario.getNamedObject("MainVehicle")
     if vehicle is None:
         print("No MainVehicle was found.")
-        exit
+    elif window:
+        window.setMainVehicle(vehicle)
 
-    window.setMainVehicle(vehicle)
+    if args.record:
+        OffscreenRenderer = profiler.importModule("OffscreenRenderer")
+        with profiler.phase("create recorder"):
+            width, height = (int(value) for value in args.record_size.split("x"))
+            RECORDER = OffscreenRenderer.OffscreenRenderer(
+                SIM_ENGINE, OffscreenRenderer.FrameWriter(args.record),
+                size=(width, height), fps=args.record_fps,
+                follow=vehicle if args.record_follow else None)
+            staticRenders, dynamicRenders = scenario.genSceneRenders(SIM_ENGINE)
+            RECORDER.addRenders(staticRenders, static=True)
+            RECORDER.addRenders(dynamicRenders)
+
+    dynamicIds = {id(obj) for obj in SIM_ENGINE.getDynamicObjects()}
+    namedVehicles = [(name, obj) for name, obj in scenario.getNamedObjects().items()
+                     if id(obj) in dynamicIds and hasattr(obj, "setThrottle")]
 
     if args.ros:
-        ROS_NODE = RosNode(vehicle, "vehicle1")
-    #Lidar
-    LIDAR = Lidar(SIM_ENGINE, vehicle, rosNode=ROS_NODE)
+        try:
+            RosNodes = profiler.importModule("RosNodes")
+            ROS_BRIDGE = RosNodes.RosBridge(SIM_ENGINE, useSimTime=not args.ros_wall_time,
+                                            odomRate=args.odom_rate)
+            #The MainVehicle keeps its vehicle1 namespace and unprefixed frames,
+            #every other named vehicle is exposed under its own name
+            for name, obj in namedVehicles:
+                if obj is vehicle:
+                    ROS_BRIDGE.addVehicle(obj, "vehicle1")
+                else:
+                    ROS_BRIDGE.addVehicle(obj, name, framePrefix=name + "/")
+        except ImportError as e:
+            print(f"Module RosNodes could not be imported: {e}")
+
+    if args.local_transport:
+        LocalTransport = profiler.importModule("LocalTransport")
+        LOCAL_TRANSPORT = LocalTransport.LocalTransport(SIM_ENGINE, args.local_transport)
+        for name, obj in namedVehicles:
+            LOCAL_TRANSPORT.addVehicle(obj, name)
+
+    #Sensors of every named vehicle, sampled together from one thread. The
+    #MainVehicle always has a lidar
+    if namedVehicles:
+        Sensors = profiler.importModule("Sensors")
+        SENSORS = Sensors.SensorManager(SIM_ENGINE)
+        recordedLidar = False
+        for _, obj in namedVehicles:
+            sensors = Sensors.createSensors(obj)
+            if obj is vehicle and not any(isinstance(sensor, Sensors.Lidar)
+                                          for sensor in sensors):
+                sensors.append(Sensors.Lidar(obj))
+            for sensor in sensors:
+                if not isinstance(sensor, Sensors.Lidar):
+                    continue
+                for output in (ROS_BRIDGE, LOCAL_TRANSPORT):
+                    if output:
+                        sensor.addOutput(output)
+                if window and obj is vehicle and window.lidar is None:
+                    window.setLidar(sensor)
+                if RECORDER and args.record_lidar and obj is vehicle and not recordedLidar:
+                    #The recorder keeps the lidar sampled for its overlay
+                    recordedLidar = True
+                    VehicleRender = profiler.importModule("VehicleRender")
+                    RECORDER.getRenderEngine().registerOverlay(
+                        VehicleRender.LidarOverlayRender(sensor.getScanBuffer()))
+                    sensor.addConsumer(RECORDER)
+            SENSORS.addSensors(sensors)
+
+    profiler.report()
 
     SIM_ENGINE.startThreaded()
-    if ROS_NODE:
-        ROS_NODE.start()
-    LIDAR.startThreaded()
+    if ROS_BRIDGE:
+        ROS_BRIDGE.start()
+    if LOCAL_TRANSPORT:
+        LOCAL_TRANSPORT.start()
+    if SENSORS:
+        SENSORS.startThreaded()
+    if RECORDER:
+        RECORDER.startThreaded()
 
-    if args.graphics:
+    if window:
         window.show()
-        sys.exit(app.exec_())
+        status = APP.exec_()
+        SIM_ENGINE.commands.report()
+        if RECORDER:
+            RECORDER.stop()
+            RECORDER.wait()
+        if ROS_BRIDGE:
+            ROS_BRIDGE.stop()
+        if LOCAL_TRANSPORT:
+            LOCAL_TRANSPORT.stop()
+        sys.exit(status)
+
+    if args.duration is not None:
+        time.sleep(args.duration)
+        SIM_ENGINE.stop()
+        if SENSORS:
+            SENSORS.stop()
+        if RECORDER:
+            RECORDER.stop()
 
     #Terminate
-    LIDAR.wait()
+    if SENSORS:
+        SENSORS.wait()
+    if RECORDER:
+        RECORDER.wait()
     SIM_ENGINE.wait()
+    SIM_ENGINE.commands.report()
+    if ROS_BRIDGE:
+        ROS_BRIDGE.stop()
+    if LOCAL_TRANSPORT:
+        LOCAL_TRANSPORT.stop()
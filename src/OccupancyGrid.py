@@ -0,0 +1,381 @@
+"""
+Rasterization of the static scene into an occupancy grid with a Euclidean
+distance map. The grid is built once per scenario and patched locally when
+static objects are added or removed, it can be exported in the PGM + YAML
+format of the ROS map_server.
+"""
+import math
+from array import array
+
+import yaml
+
+from Diagnostics import getChannel
+
+PHYSICS = getChannel("physics")
+
+#Squared distance used for cells without an obstacle in the transform
+INF = 1e20
+
+def spanInStrip(corners, y0, y1):
+    """
+    Horizontal extent of a convex polygon clipped to the strip y0 <= y <= y1.
+
+    Returns:
+        tuple: (minX, maxX) or None when the polygon misses the strip
+    """
+    xs = []
+    count = len(corners)
+    for i in range(count):
+        ax, ay = corners[i]
+        bx, by = corners[(i + 1) % count]
+        if y0 <= ay <= y1:
+            xs.append(ax)
+        for y in (y0, y1):
+            if (ay - y) * (by - y) < 0:
+                xs.append(ax + (y - ay) * (bx - ax) / (by - ay))
+    if not xs:
+        return None
+    return min(xs), max(xs)
+
+def distanceTransform1D(f, n):
+    """
+    One dimensional squared Euclidean distance transform (Felzenszwalb and
+    Huttenlocher), linear in the number of samples.
+    """
+    d = [0.0] * n
+    v = [0] * n
+    z = [0.0] * (n + 1)
+    k = 0
+    z[0] = -INF
+    z[1] = INF
+    for q in range(1, n):
+        s = ((f[q] + q * q) - (f[v[k]] + v[k] * v[k])) / (2 * q - 2 * v[k])
+        while s <= z[k]:
+            k -= 1
+            s = ((f[q] + q * q) - (f[v[k]] + v[k] * v[k])) / (2 * q - 2 * v[k])
+        k += 1
+        v[k] = q
+        z[k] = s
+        z[k + 1] = INF
+
+    k = 0
+    for q in range(n):
+        while z[k + 1] < q:
+            k += 1
+        d[q] = (q - v[k]) ** 2 + f[v[k]]
+    return d
+
+class OccupancyGrid:
+    """
+    Occupancy grid and distance map of the static objects.
+
+    Each cell counts the objects covering it, so removing an object only
+    decrements its own footprint. Distances are saturated at maxDistance,
+    which bounds the area that has to be recomputed after an edit. Objects
+    added or moved outside of the grid grow it.
+    """
+    def __init__(self, bounds, resolution=10.0, maxDistance=500.0):
+        """
+        Args:
+            bounds (tuple): (minX, minY, maxX, maxY) area covered by the grid
+            resolution (float): cell size in simulation units
+            maxDistance (float): distances above this value are clamped
+        """
+        minX, minY, maxX, maxY = bounds
+        self.resolution = float(resolution)
+        self.maxDistance = float(maxDistance)
+        self.originX = minX
+        self.originY = minY
+        self.cols = max(1, int(math.ceil((maxX - minX) / self.resolution)))
+        self.rows = max(1, int(math.ceil((maxY - minY) / self.resolution)))
+
+        self.counts = array('H', [0]) * (self.cols * self.rows)
+        self.distances = array('f', [self.maxDistance]) * (self.cols * self.rows)
+
+        #Cell spans of every rasterized object: id -> [(row, col0, col1)]
+        self.footprints = {}
+        #Free space kept around objects outside of the grid when it grows
+        self.margin = 2 * self.resolution
+
+    @classmethod
+    def fromObjects(cls, objects, resolution=10.0, maxDistance=500.0, margin=None):
+        """
+        Build the grid covering all objects (plus a margin) and compute the
+        distance map once.
+        """
+        if margin is None:
+            margin = 2 * resolution
+        bounds = [obj.getBounds() for obj in objects]
+        if bounds:
+            area = (min(b[0] for b in bounds) - margin,
+                    min(b[1] for b in bounds) - margin,
+                    max(b[2] for b in bounds) + margin,
+                    max(b[3] for b in bounds) + margin)
+        else:
+            area = (0.0, 0.0, resolution, resolution)
+
+        grid = cls(area, resolution, maxDistance)
+        grid.margin = margin
+        for obj in objects:
+            grid.rasterize(obj)
+        grid.computeRegion(0, 0, grid.cols, grid.rows)
+        return grid
+
+    def toCell(self, x, y):
+        return (int(math.floor((x - self.originX) / self.resolution)),
+                int(math.floor((y - self.originY) / self.resolution)))
+
+    def covers(self, bounds):
+        minX, minY, maxX, maxY = bounds
+        return (minX >= self.originX and minY >= self.originY and
+                maxX < self.originX + self.cols * self.resolution and
+                maxY < self.originY + self.rows * self.resolution)
+
+    def grow(self, bounds):
+        """
+        Extend the grid by whole cells to cover bounds plus the margin. The
+        occupancy is kept and the distance map recomputed.
+        """
+        res = self.resolution
+        minX, minY, maxX, maxY = bounds
+        left = max(0, int(math.ceil((self.originX - (minX - self.margin)) / res)))
+        bottom = max(0, int(math.ceil((self.originY - (minY - self.margin)) / res)))
+        originX = self.originX - left * res
+        originY = self.originY - bottom * res
+        cols = max(self.cols + left, int(math.ceil((maxX + self.margin - originX) / res)))
+        rows = max(self.rows + bottom, int(math.ceil((maxY + self.margin - originY) / res)))
+
+        counts = array('H', [0]) * (cols * rows)
+        for row in range(self.rows):
+            base = (row + bottom) * cols + left
+            counts[base:base + self.cols] = self.counts[row * self.cols:(row + 1) * self.cols]
+        self.footprints = {key: [(row + bottom, col0 + left, col1 + left)
+                                 for row, col0, col1 in spans]
+                           for key, spans in self.footprints.items()}
+
+        PHYSICS.warning("Occupancy grid grown from {old} to {cols}x{rows} cells",
+                        old=f"{self.cols}x{self.rows}", cols=cols, rows=rows)
+        self.originX = originX
+        self.originY = originY
+        self.cols = cols
+        self.rows = rows
+        self.counts = counts
+        self.distances = array('f', [self.maxDistance]) * (cols * rows)
+        self.computeRegion(0, 0, cols, rows)
+
+    def rasterize(self, obj):
+        """
+        Mark the cells overlapped by the object, growing the grid when the
+        object lies outside of it.
+
+        Returns:
+            tuple: cell window (col0, row0, col1, row1) touched, or None
+        """
+        bounds = obj.getBounds()
+        if not self.covers(bounds):
+            self.grow(bounds)
+        corners = obj.getCorners()
+        res = self.resolution
+        minY = min(corner[1] for corner in corners)
+        maxY = max(corner[1] for corner in corners)
+
+        row0 = max(0, int(math.floor((minY - self.originY) / res)))
+        row1 = min(self.rows - 1, int(math.floor((maxY - self.originY) / res)))
+
+        spans = []
+        for row in range(row0, row1 + 1):
+            y0 = self.originY + row * res
+            span = spanInStrip(corners, y0, y0 + res)
+            if span is None:
+                continue
+            col0 = max(0, int(math.floor((span[0] - self.originX) / res)))
+            col1 = min(self.cols - 1, int(math.floor((span[1] - self.originX) / res)))
+            if col0 > col1:
+                continue
+            spans.append((row, col0, col1))
+            base = row * self.cols
+            for index in range(base + col0, base + col1 + 1):
+                self.counts[index] += 1
+
+        self.footprints[id(obj)] = spans
+        return self.spanWindow(spans)
+
+    def unrasterize(self, obj):
+        spans = self.footprints.pop(id(obj), [])
+        for row, col0, col1 in spans:
+            base = row * self.cols
+            for index in range(base + col0, base + col1 + 1):
+                self.counts[index] -= 1
+        return self.spanWindow(spans)
+
+    @staticmethod
+    def spanWindow(spans):
+        if not spans:
+            return None
+        return (min(span[1] for span in spans), spans[0][0],
+                max(span[2] for span in spans) + 1, spans[-1][0] + 1)
+
+    def addObject(self, obj):
+        window = self.rasterize(obj)
+        if window:
+            self.updateRegion(*window)
+
+    def removeObject(self, obj):
+        window = self.unrasterize(obj)
+        if window:
+            self.updateRegion(*window)
+
+    def addObjects(self, objs):
+        self.updateWindows([self.rasterize(obj) for obj in objs])
+
+    def removeObjects(self, objs):
+        self.updateWindows([self.unrasterize(obj) for obj in objs])
+
+    def moveObjects(self, objs):
+        """
+        Batch version of moveObject, the distances are recomputed once for
+        all the objects
+        """
+        windows = []
+        for obj in objs:
+            windows.append(self.unrasterize(obj))
+            windows.append(self.rasterize(obj))
+        self.updateWindows(windows)
+
+    def updateWindows(self, windows):
+        """
+        Recompute the distances of the union of the cell windows (None
+        entries are ignored)
+        """
+        windows = [window for window in windows if window]
+        if windows:
+            self.updateRegion(min(window[0] for window in windows),
+                              min(window[1] for window in windows),
+                              max(window[2] for window in windows),
+                              max(window[3] for window in windows))
+
+    def moveObject(self, obj):
+        """
+        Update the grid after the object changed pose or size
+        """
+        old = self.unrasterize(obj)
+        new = self.rasterize(obj)
+        for window in (old, new):
+            if window:
+                self.updateRegion(*window)
+
+    def updateRegion(self, col0, row0, col1, row1):
+        """
+        Recompute the distances affected by a change of occupancy inside the
+        cell window. Only cells within maxDistance of the window can change
+        and their nearest obstacle lies within maxDistance of them.
+        """
+        reach = int(math.ceil(self.maxDistance / self.resolution)) + 1
+        self.computeRegion(max(0, col0 - 2 * reach), max(0, row0 - 2 * reach),
+                           min(self.cols, col1 + 2 * reach),
+                           min(self.rows, row1 + 2 * reach),
+                           (max(0, col0 - reach), max(0, row0 - reach),
+                            min(self.cols, col1 + reach), min(self.rows, row1 + reach)))
+
+    def computeRegion(self, col0, row0, col1, row1, writeWindow=None):
+        """
+        Run the distance transform over a cell window and store the result,
+        restricted to writeWindow when given.
+        """
+        width = col1 - col0
+        height = row1 - row0
+        if width <= 0 or height <= 0:
+            return
+
+        counts = self.counts
+        cols = self.cols
+        columns = []
+        for col in range(col0, col1):
+            f = [0.0 if counts[row * cols + col] else INF for row in range(row0, row1)]
+            columns.append(distanceTransform1D(f, height))
+
+        wCol0, wRow0, wCol1, wRow1 = writeWindow or (col0, row0, col1, row1)
+        res = self.resolution
+        maxDistance = self.maxDistance
+        distances = self.distances
+        for row in range(wRow0, wRow1):
+            local = row - row0
+            f = [column[local] for column in columns]
+            d = distanceTransform1D(f, width)
+            base = row * cols
+            for col in range(wCol0, wCol1):
+                distances[base + col] = min(math.sqrt(d[col - col0]) * res, maxDistance)
+
+    def isOccupied(self, x, y):
+        col, row = self.toCell(x, y)
+        if 0 <= col < self.cols and 0 <= row < self.rows:
+            return self.counts[row * self.cols + col] > 0
+        return False
+
+    def clearance(self, x, y):
+        """
+        Distance from the point to the nearest static obstacle, 0 for points
+        outside of the grid.
+        """
+        col, row = self.toCell(x, y)
+        if 0 <= col < self.cols and 0 <= row < self.rows:
+            return self.distances[row * self.cols + col]
+        return 0.0
+
+    def clearances(self, points):
+        """
+        Batch version of clearance.
+
+        Args:
+            points (iterable): (x, y) tuples
+
+        Returns:
+            list: clearance of every point
+        """
+        res = self.resolution
+        originX = self.originX
+        originY = self.originY
+        cols = self.cols
+        rows = self.rows
+        distances = self.distances
+        result = []
+        for x, y in points:
+            col = int(math.floor((x - originX) / res))
+            row = int(math.floor((y - originY) / res))
+            if 0 <= col < cols and 0 <= row < rows:
+                result.append(distances[row * cols + col])
+            else:
+                result.append(0.0)
+        return result
+
+    def savePgm(self, basePath, unitScale=0.01):
+        """
+        Export the occupancy as a map_server map: basePath.pgm and basePath.yaml.
+
+        Args:
+            basePath (str): path without extension
+            unitScale (float): meters per simulation unit
+        """
+        pgmPath = basePath + ".pgm"
+        pixels = bytearray(self.cols * self.rows)
+        #Image rows go top to bottom, the map y axis goes up
+        for imageRow in range(self.rows):
+            row = self.rows - 1 - imageRow
+            base = row * self.cols
+            out = imageRow * self.cols
+            for col in range(self.cols):
+                pixels[out + col] = 0 if self.counts[base + col] else 254
+
+        with open(pgmPath, "wb") as file:
+            file.write(f"P5\n{self.cols} {self.rows}\n255\n".encode("ascii"))
+            file.write(pixels)
+
+        metadata = {"image": pgmPath.rsplit("/", 1)[-1],
+                    "mode": "trinary",
+                    "resolution": self.resolution * unitScale,
+                    "origin": [self.originX * unitScale, self.originY * unitScale, 0.0],
+                    "negate": 0,
+                    "occupied_thresh": 0.65,
+                    "free_thresh": 0.196}
+        with open(basePath + ".yaml", "w", encoding="utf-8") as file:
+            yaml.dump(metadata, file, default_flow_style=None, sort_keys=False)
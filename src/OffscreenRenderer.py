@@ -0,0 +1,227 @@
+"""
+Headless rendering of the simulation into QImages, for CI artifacts and for
+recording runs without a display (QT_QPA_PLATFORM=offscreen). Frames are
+painted by a worker thread and handed to a thread pool that encodes and
+writes them, so capturing never blocks the physics loop.
+"""
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtGui import QImage, QPainter, QColor
+
+from SimEngine import RenderEngine
+from VehicleRender import SpriteCache, RectangleBatch
+from Diagnostics import getChannel
+
+RENDER = getChannel("render")
+
+def unionBounds(a, b):
+    if a is None:
+        return b
+    return min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])
+
+class FrameWriter:
+    """
+    Writes frames on a thread pool, either as a PNG sequence or appended to
+    a single raw RGBA video file. Frames arriving while too many writes are
+    pending are dropped instead of queued.
+
+    A raw file can be encoded afterwards with:
+        ffmpeg -f rawvideo -pix_fmt rgba -s WxH -r FPS -i frames.raw out.mp4
+    """
+    def __init__(self, path, workers=2, maxPending=8, pngQuality=80):
+        """
+        Args:
+            path (str): PNG file pattern with a %d field (e.g.
+                frames/frame_%05d.png), a directory, or a .raw file
+            workers (int): PNG encoding threads, raw output uses a single one
+                to keep the frames in order
+            maxPending (int): frames waiting to be written before dropping
+            pngQuality (int): Qt PNG quality, high values compress less but
+                encode faster
+        """
+        self.raw = path.endswith(".raw")
+        if not self.raw and "%" not in path:
+            path = os.path.join(path, "frame_%06d.png")
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.file = open(path, "wb") if self.raw else None # pylint: disable=consider-using-with
+        self.executor = ThreadPoolExecutor(max_workers=1 if self.raw else workers,
+                                           thread_name_prefix="FrameWriter")
+
+        self.maxPending = maxPending
+        self.pngQuality = pngQuality
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+
+    def submit(self, image, index):
+        """
+        Queue a frame, the writer takes ownership of the image.
+
+        Returns:
+            bool: False if the frame was dropped
+        """
+        with self.lock:
+            if self.pending >= self.maxPending:
+                self.dropped += 1
+                return False
+            self.pending += 1
+
+        future = self.executor.submit(self.write, image, index)
+        future.add_done_callback(self.frameDone)
+        return True
+
+    def write(self, image, index):
+        if self.raw:
+            image = image.convertToFormat(QImage.Format_RGBA8888)
+            data = image.constBits()
+            data.setsize(image.sizeInBytes())
+            self.file.write(bytes(data))
+        else:
+            image.save(self.path % index, "PNG", self.pngQuality)
+
+    def frameDone(self, future):
+        with self.lock:
+            self.pending -= 1
+            if future.exception() is None:
+                self.written += 1
+        if future.exception() is not None:
+            RENDER.error("Writing frame failed: {error}", error=future.exception())
+
+    def close(self):
+        """
+        Wait for the queued frames and release the output
+        """
+        self.executor.shutdown(wait=True)
+        if self.file:
+            self.file.close()
+            self.file = None
+
+class OffscreenRenderer:
+    """
+    Paints the scene at a fixed frame rate into QImages. It keeps its own
+    RenderEngine and renderers, sprites are QImages since pixmaps can not be
+    used outside of the GUI thread.
+    """
+    def __init__(self, simEngine, writer, size=(800, 600), fps=30.0,
+                 follow=None, background=QColor(255, 255, 255)):
+        """
+        Args:
+            simEngine (SimEngine): the simulation to capture
+            writer (FrameWriter): receives the finished frames
+            size (tuple): (width, height) of the frames in pixels
+            fps (float): frames per second
+            follow (SceneObject): keep this object centered at 1:1 scale,
+                None fits the whole scene into the frame
+            background (QColor): fill color of the frames
+        """
+        self.simEngine = simEngine
+        self.writer = writer
+        self.width, self.height = size
+        self.interval = 1.0 / fps
+        self.follow = follow
+        self.background = background
+
+        self.spriteCache = SpriteCache(usePixmaps=False)
+        self.renderEngine = RenderEngine()
+        self.renderEngine.setStaticBatch(RectangleBatch())
+
+        self.frameIndex = 0
+        self.thread = None
+        self.running = False
+
+    def getRenderEngine(self):
+        return self.renderEngine
+
+    def addRenders(self, renders, static=False):
+        """
+        Register renderers, switching them to the thread safe sprite cache
+        """
+        for render in renders:
+            render.setSpriteCache(self.spriteCache)
+        self.renderEngine.registerObjects(renders, static)
+
+    def getView(self):
+        """
+        Visible world rectangle and scale of the next frame.
+
+        Returns:
+            tuple: ((minX, minY, maxX, maxY), scale)
+        """
+        if self.follow is not None:
+            pose = self.follow.getPose()
+            minX = pose.x - self.width / 2
+            minY = pose.y - self.height / 2
+            return (minX, minY, minX + self.width, minY + self.height), 1.0
+
+        bounds = self.renderEngine.sceneBounds
+        for obj in self.renderEngine.dynamicObjects:
+            bounds = unionBounds(bounds, obj.getBounds())
+        if bounds is None:
+            return (0.0, 0.0, float(self.width), float(self.height)), 1.0
+        minX, minY, maxX, maxY = bounds
+        scale = min(self.width / max(maxX - minX, 1.0), self.height / max(maxY - minY, 1.0))
+        return (minX, minY, minX + self.width / scale, minY + self.height / scale), scale
+
+    def renderFrame(self, now=None):
+        """
+        Paint the current state of the simulation.
+
+        Returns:
+            QImage: the frame
+        """
+        if now is None:
+            now = time.perf_counter()
+        self.renderEngine.updatePoses(self.simEngine.getSnapshots(), now)
+        rect, scale = self.getView()
+
+        image = QImage(self.width, self.height, QImage.Format_ARGB32_Premultiplied)
+        image.fill(self.background)
+        painter = QPainter(image)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.scale(scale, scale)
+        painter.translate(-rect[0], -rect[1])
+        self.renderEngine.draw(painter, rect, scale)
+        painter.end()
+        return image
+
+    def capture(self):
+        """
+        Render a frame and hand it to the writer. Dropped frames do not use
+        up an index, the PNG sequence stays without gaps.
+        """
+        if self.writer.submit(self.renderFrame(), self.frameIndex):
+            self.frameIndex += 1
+
+    def run(self):
+        nextFrame = time.perf_counter()
+        while self.running:
+            self.capture()
+            nextFrame += self.interval
+            delay = nextFrame - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                #Rendering is too slow for the frame rate, skip ahead
+                nextFrame = time.perf_counter()
+
+    def stop(self):
+        self.running = False
+
+    def wait(self):
+        self.thread.join()
+        self.writer.close()
+        RENDER.info("Recorded {written} frames, {dropped} dropped",
+                    written=self.writer.written, dropped=self.writer.dropped)
+
+    def startThreaded(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.start()
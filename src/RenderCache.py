@@ -0,0 +1,106 @@
+"""
+Module containing the caches used to avoid repainting content that does not
+change between frames
+"""
+import math
+from collections import OrderedDict
+
+from PyQt5.QtGui import QPixmap, QPainter
+from PyQt5.QtCore import Qt, QRectF
+
+class StaticTileCache:
+    """
+    Pyramid of pre-rendered tiles of the static objects. Level 0 tiles are
+    drawn at 1:1 scale, every following level covers twice the area with the
+    same amount of pixels. Tiles are rendered lazily on first use and evicted
+    least recently used first.
+    """
+    def __init__(self, drawStatic, tileSize=256, levels=6, maxTiles=256):
+        """
+        Args:
+            drawStatic (callable): drawStatic(painter, rect, scale) paints the
+                static objects of a world rectangle, see RenderEngine.drawStatic
+            tileSize (int): tile size in pixels
+            levels (int): number of zoom levels
+            maxTiles (int): maximum number of cached tiles
+        """
+        self.drawStatic = drawStatic
+        self.tileSize = tileSize
+        self.levels = levels
+        self.maxTiles = maxTiles
+
+        self.tiles = OrderedDict()
+
+    def tileRange(self, bounds, worldTile):
+        minX, minY, maxX, maxY = bounds
+        return (int(math.floor(minX / worldTile)), int(math.floor(minY / worldTile)),
+                int(math.floor(maxX / worldTile)), int(math.floor(maxY / worldTile)))
+
+    def invalidate(self, bounds):
+        """
+        Drop the tiles, on every level, that overlap the bounds
+        """
+        for level in range(self.levels):
+            worldTile = self.tileSize * (1 << level)
+            tx0, ty0, tx1, ty1 = self.tileRange(bounds, worldTile)
+            for tx in range(tx0, tx1 + 1):
+                for ty in range(ty0, ty1 + 1):
+                    self.tiles.pop((level, tx, ty), None)
+
+    def clear(self):
+        self.tiles.clear()
+
+    def levelForScale(self, scale):
+        if scale >= 1.0:
+            return 0
+        return min(self.levels - 1, int(math.floor(-math.log2(scale))))
+
+    def renderTile(self, level, tx, ty):
+        worldTile = self.tileSize * (1 << level)
+        scale = 1.0 / (1 << level)
+        pixmap = QPixmap(self.tileSize, self.tileSize)
+        pixmap.fill(Qt.transparent)
+
+        painter = QPainter(pixmap)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.scale(scale, scale)
+        painter.translate(-tx * worldTile, -ty * worldTile)
+        self.drawStatic(painter, (tx * worldTile, ty * worldTile,
+                                  (tx + 1) * worldTile, (ty + 1) * worldTile), scale)
+        painter.end()
+
+        return pixmap
+
+    def getTile(self, level, tx, ty):
+        """
+        Get a cached tile, rendering it on a miss
+        """
+        key = (level, tx, ty)
+        pixmap = self.tiles.get(key)
+        if pixmap is None:
+            pixmap = self.renderTile(level, tx, ty)
+            self.tiles[key] = pixmap
+            while len(self.tiles) > self.maxTiles:
+                self.tiles.popitem(last=False)
+        else:
+            self.tiles.move_to_end(key)
+        return pixmap
+
+    def draw(self, painter, rect, scale=1.0):
+        """
+        Blit the tiles covering the rectangle.
+
+        Args:
+            painter (QPainter): the painter to draw with, in world coordinates
+            rect (tuple): (minX, minY, maxX, maxY) visible world area
+            scale (float): screen pixels per world unit
+        """
+        level = self.levelForScale(scale)
+        worldTile = self.tileSize * (1 << level)
+        tx0, ty0, tx1, ty1 = self.tileRange(rect, worldTile)
+
+        source = QRectF(0, 0, self.tileSize, self.tileSize)
+        for tx in range(tx0, tx1 + 1):
+            for ty in range(ty0, ty1 + 1):
+                target = QRectF(tx * worldTile, ty * worldTile, worldTile, worldTile)
+                painter.drawPixmap(target, self.getTile(level, tx, ty), source)
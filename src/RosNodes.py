@@ -3,12 +3,20 @@ import math
 import threading
 import rclpy
 from rclpy.node import Node
+from rclpy.parameter import Parameter
+from rclpy.executors import MultiThreadedExecutor
+from rclpy.callback_groups import ReentrantCallbackGroup
+from rosgraph_msgs.msg import Clock
 from geometry_msgs.msg import Twist, Pose, PoseStamped
 from std_msgs.msg import Header
 from sensor_msgs.msg import LaserScan
 from nav_msgs.msg import Odometry
 from geometry_msgs.msg import TransformStamped
-from tf2_ros import TransformBroadcaster
+from tf2_ros import TransformBroadcaster, StaticTransformBroadcaster
+
+from Diagnostics import getChannel
+
+ROS = getChannel("ros")
 
 def euler_to_quaternion(roll, pitch, yaw):
     """Convert Euler angles to quaternion."""
@@ -18,81 +26,120 @@ def euler_to_quaternion(roll, pitch, yaw):
     qw = math.cos(roll / 2) * math.cos(pitch / 2) * math.cos(yaw / 2) + math.sin(roll / 2) * math.sin(pitch / 2) * math.sin(yaw / 2)
     return (qx, qy, qz, qw)
 
-class TwistSubscriber(Node):
-    def __init__(self, vehicle, topicPrefix):
-        super().__init__('twist_subscriber')
+def yawToQuaternion(yaw):
+    """
+    Quaternion (x, y, z, w) of a rotation about z only, what every pose of
+    the simulation is
+    """
+    return (0.0, 0.0, math.sin(yaw / 2), math.cos(yaw / 2))
+
+def setStamp(stamp, seconds):
+    """
+    Write a time in seconds into a builtin_interfaces/Time in place
+    """
+    sec = int(seconds)
+    stamp.sec = sec
+    stamp.nanosec = int((seconds - sec) * 1e9)
+
+class VehicleTopics:
+    """
+    ROS interface of one vehicle under its namespace: cmd_vel in, odom,
+    icr and lidar out, all created on the shared node of the bridge. The
+    odometry and transform messages are allocated once and updated in place,
+    the bridge broadcasts the transforms of all the vehicles together.
+    """
+    def __init__(self, bridge, vehicle, namespace, framePrefix, callbackGroup):
+        """
+        Args:
+            bridge (RosBridge): the bridge owning the node
+            vehicle (Vehicle): the vehicle to expose
+            namespace (str): topic namespace, e.g. vehicle1 for vehicle1/cmd_vel
+            framePrefix (str): prefix of the TF frames, e.g. "truck2/"
+            callbackGroup (CallbackGroup): group of the cmd_vel subscription
+        """
+        self.bridge = bridge
         self.vehicle = vehicle
-        self.subscription = self.create_subscription(
+        self.framePrefix = framePrefix
+        self.odomFrame = framePrefix + "odom"
+        self.baseFrame = framePrefix + "base_link"
+
+        node = bridge.node
+        topicPrefix = namespace + "/"
+        self.subscription = node.create_subscription(
             Twist,
-            topicPrefix + '/cmd_vel',
+            topicPrefix + 'cmd_vel',
             self.listener_callback,
-            10)
+            10,
+            callback_group=callbackGroup)
 
-        self.posePublisher = self.create_publisher(
+        self.posePublisher = node.create_publisher(
             Pose,
-            topicPrefix + '/pose',
+            topicPrefix + 'pose',
             10)
 
-        self.icrPublisher = self.create_publisher(
+        self.icrPublisher = node.create_publisher(
             PoseStamped,
-            topicPrefix + '/icr',
+            topicPrefix + 'icr',
             10)
 
-
-        self.odomPublisher = self.create_publisher(
+        self.odomPublisher = node.create_publisher(
             Odometry,
-            topicPrefix + '/odom',
+            topicPrefix + 'odom',
             10)
 
-        self.lidarPublisher = self.create_publisher(
+        self.node = node
+        self.topicPrefix = topicPrefix
+        #Publisher per lidar name, a vehicle may carry several lidars
+        self.lidarPublishers = {'lidar': node.create_publisher(
             LaserScan,
-            topicPrefix + '/lidar',
-            10)
-
-        self.tf_broadcaster = TransformBroadcaster(self)
-
-        self.timer = self.create_timer(0.5, self.timerCallback)
-
-    def broadcastTransform(self):
-        # Broadcast TF
-        transform = TransformStamped()
-        transform.header.frame_id = 'odom'
-        transform.child_frame_id = 'base_link'
-        transform.header.stamp = self.get_clock().now().to_msg()
-
-        transform.transform.translation.x = self.vehicle.pos.x/100
-        transform.transform.translation.y = self.vehicle.pos.y/100
-        transform.transform.translation.z = 0.0
-
-        # Set rotation
-        q = euler_to_quaternion(0, 0, math.radians(self.vehicle.getAngle()))
-        transform.transform.rotation.x = q[0]
-        transform.transform.rotation.y = q[1]
-        transform.transform.rotation.z = q[2]
-        transform.transform.rotation.w = q[3]
-
-        # Broadcast the transform
-        self.tf_broadcaster.sendTransform(transform)
-
-    def publishOdometry(self):
-        msg = Odometry()
-
-        msg.header = Header()
-        msg.header.stamp = self.get_clock().now().to_msg()
-        msg.header.frame_id = "base_link"
-        msg.child_frame_id = "odom"
-
-        msg.pose.pose.position.x = self.vehicle.pos.x/100
-        msg.pose.pose.position.y = self.vehicle.pos.y/100
-        msg.pose.pose.position.z = float(0)
-
-        q = euler_to_quaternion(0, 0, math.radians(self.vehicle.getAngle()))
-        msg.pose.pose.orientation.x = q[0]
-        msg.pose.pose.orientation.y = q[1]
-        msg.pose.pose.orientation.z = q[2]
-        msg.pose.pose.orientation.w = q[3]
-
+            topicPrefix + 'lidar',
+            10)}
+
+        #Preallocated LaserScan per lidar, see publishLidar
+        self.lidarMessages = {}
+
+        self.odomMsg = Odometry()
+        self.odomMsg.header.frame_id = self.odomFrame
+        self.odomMsg.child_frame_id = self.baseFrame
+        self.transform = TransformStamped()
+        self.transform.header.frame_id = self.odomFrame
+        self.transform.child_frame_id = self.baseFrame
+
+    def publishState(self, simTime):
+        """
+        Publish the odometry and update the transform of the vehicle, which
+        the bridge broadcasts.
+
+        Args:
+            simTime (float): simulation time of the state
+        """
+        vehicle = self.vehicle
+        x = vehicle.pos.x/100
+        y = vehicle.pos.y/100
+        _, _, qz, qw = yawToQuaternion(math.radians(vehicle.getAngle()))
+
+        msg = self.odomMsg
+        if self.bridge.useSimTime:
+            setStamp(msg.header.stamp, simTime)
+        else:
+            self.bridge.setNow(msg.header.stamp)
+        pose = msg.pose.pose
+        pose.position.x = x
+        pose.position.y = y
+        pose.orientation.z = qz
+        pose.orientation.w = qw
+        #Velocities in the vehicle frame
+        msg.twist.twist.linear.x = float(vehicle.getSpeed())
+        msg.twist.twist.angular.z = vehicle.getYawRate()
         self.odomPublisher.publish(msg)
+        self.bridge.simEngine.commands.odometryPublished(vehicle)
+
+        transform = self.transform
+        transform.header.stamp = msg.header.stamp
+        transform.transform.translation.x = x
+        transform.transform.translation.y = y
+        transform.transform.rotation.z = qz
+        transform.transform.rotation.w = qw
 
     def publishPose(self):
         msg = Pose()
@@ -100,33 +147,24 @@ class TwistSubscriber(Node):
         msg.position.y = self.vehicle.pos.y/100
         msg.position.z = float(0)
 
-        q = euler_to_quaternion(0, 0, math.radians(self.vehicle.getAngle()))
-        msg.orientation.x = q[0]
-        msg.orientation.y = q[1]
-        msg.orientation.z = q[2]
-        msg.orientation.w = q[3]
+        _, _, msg.orientation.z, msg.orientation.w = yawToQuaternion(
+            math.radians(self.vehicle.getAngle()))
 
         self.posePublisher.publish(msg)
 
     def publishIcr(self):
         msg = PoseStamped()
         msg.header = Header()
-        msg.header.stamp = self.get_clock().now().to_msg()
-        msg.header.frame_id = "odom"
+        self.bridge.setNow(msg.header.stamp)
+        msg.header.frame_id = self.odomFrame
 
-        radSteering = math.radians(self.vehicle.steeringAngle)
-        if radSteering == 0:
+        icr = self.vehicle.getIcr()
+        if icr is None:
             return
-        icrY = self.vehicle.wheelBase / math.tan(radSteering)
-
-        rads = math.radians(self.vehicle.angle)
-        pIcrX = 0 * math.cos(rads) - icrY * math.sin(rads)
-        pIcrY = 0 * math.sin(rads) + icrY * math.cos(rads)
-        print(f"ICR: {pIcrX}, {pIcrY}")
-        #msg.pose.position.x = pIcrY/100
-        #msg.pose.position.y = pIcrX/100
-        msg.pose.position.x = (self.vehicle.pos.x + pIcrX)/100
-        msg.pose.position.y = (self.vehicle.pos.y + pIcrY)/100
+        if ROS.debugOn:
+            ROS.debug("ICR: {x}, {y}", x=icr[0], y=icr[1])
+        msg.pose.position.x = icr[0]/100
+        msg.pose.position.y = icr[1]/100
         msg.pose.position.z = float(0)
 
         q = euler_to_quaternion(0, math.radians(-90), 0)
@@ -137,55 +175,235 @@ class TwistSubscriber(Node):
 
         self.icrPublisher.publish(msg)
 
-    def publishLidar(self, scan, lidar, angle, scanTime):
+    def makeLaserScan(self, lidar, scanTime):
+        """
+        Create the message of a lidar with the fields that never change and
+        broadcast the static transform of its frame
+        """
         msg = LaserScan()
-        msg.header = Header()
-        #TODO: Timestamp this properlly
-        msg.header.stamp = self.get_clock().now().to_msg()
-        #msg.header.stamp.nanosec = 0
-        msg.header.frame_id = "base_link"
-        #msg.header.frame_id = "odom"
-
-        msg.angle_min = math.radians(0)
-        msg.angle_max = math.radians(lidar.numRays * lidar.rayAngleIncrement)
+        msg.header.frame_id = self.framePrefix + lidar.name
+        self.bridge.addStaticTransform(self.makeMountTransform(lidar, msg.header.frame_id))
+
+        msg.angle_min = math.radians(lidar.angleMin)
+        msg.angle_max = math.radians(lidar.angleMin + (lidar.numRays - 1) * lidar.rayAngleIncrement)
         msg.angle_increment = math.radians(lidar.rayAngleIncrement)
 
-        msg.time_increment = 0.0
+        #A rotating lidar casts its rays spread over the whole scan
+        msg.time_increment = scanTime / lidar.numRays if lidar.rotating else 0.0
         msg.scan_time = scanTime
 
         msg.range_min = 0.0
-        msg.range_max = float('inf')
-
-        msg.ranges = scan
+        msg.range_max = lidar.maxRange / 100
         msg.intensities = []
+        return msg
 
-        self.lidarPublisher.publish(msg)
-
-    def timerCallback(self):
-        #self.publishPose()
-        self.publishIcr()
-        self.publishOdometry()
-        self.broadcastTransform()
+    def makeMountTransform(self, lidar, frame):
+        """
+        Transform from base_link to the frame of a lidar, placed at its
+        mounting offset and angle
+        """
+        transform = TransformStamped()
+        self.bridge.setNow(transform.header.stamp)
+        transform.header.frame_id = self.baseFrame
+        transform.child_frame_id = frame
+        transform.transform.translation.x = lidar.offset.x/100
+        transform.transform.translation.y = lidar.offset.y/100
+        _, _, transform.transform.rotation.z, transform.transform.rotation.w = yawToQuaternion(
+            math.radians(lidar.mountAngle))
+        return transform
+
+    def publishLidar(self, ranges, lidar, stamp, scanTime):
+        """
+        Publish a scan, reusing one message per lidar. The message is
+        serialized before publish returns, so the caller may overwrite the
+        ranges right after.
+
+        Args:
+            ranges (array): array('f') of ranges in meters, used without a copy
+            lidar (Lidar): the sensor that produced the scan
+            stamp (float): simulation time the scan was taken at
+            scanTime (float): time between scans in seconds
+        """
+        msg = self.lidarMessages.get(id(lidar))
+        if msg is None:
+            msg = self.makeLaserScan(lidar, scanTime)
+            self.lidarMessages[id(lidar)] = msg
+
+        if self.bridge.useSimTime:
+            setStamp(msg.header.stamp, stamp)
+        else:
+            self.bridge.setNow(msg.header.stamp)
+        msg.ranges = ranges
+
+        self.getLidarPublisher(lidar).publish(msg)
+
+    def getLidarPublisher(self, lidar):
+        publisher = self.lidarPublishers.get(lidar.name)
+        if publisher is None:
+            publisher = self.node.create_publisher(LaserScan, self.topicPrefix + lidar.name, 10)
+            self.lidarPublishers[lidar.name] = publisher
+        return publisher
 
     def listener_callback(self, msg):
-        self.vehicle.setThrottle(msg.linear.x)
-        self.vehicle.setSteering(msg.angular.z*2)
-        self.get_logger().info(f'Received twist message: linear={msg.linear.x, msg.linear.y, msg.linear.z}, angular={msg.angular.x, msg.angular.y, msg.angular.z}')
+        self.bridge.simEngine.commands.submit(self.vehicle, msg.linear.x, msg.angular.z*2, "ros")
+
+class RosBridge:
+    """
+    Exposes any number of vehicles over ROS from a single node. rclpy is
+    initialized once and one MultiThreadedExecutor thread serves every
+    vehicle. Odometry and TF follow the physics ticks, the transforms of all
+    vehicles are sent in one batch, the ICRs by a slower timer.
+
+    The bridge publishes /clock from the simulation and, with use_sim_time,
+    stamps messages and runs its timer on simulation time, so the simulation
+    and its consumers can run faster or slower than real time together.
+    """
+    def __init__(self, simEngine, useSimTime=True, period=0.5, odomRate=None):
+        """
+        Args:
+            simEngine (SimEngine): the simulation providing the clock
+            useSimTime (bool): stamp with simulation time instead of wall time
+            period (float): seconds between ICR updates
+            odomRate (float): odometry and TF updates per simulated second,
+                rounded to a whole number of physics ticks. None for every tick
+        """
+        self.simEngine = simEngine
+        self.useSimTime = useSimTime
+        self.period = period
+        self.stateTicks = simEngine.ticksPerPeriod(odomRate)
+        self.ticksUntilState = 1
 
-class RosNode:
-    def __init__(self, vehicle, topicPrefix):
         self.node = None
+        self.executor = None
         self.thread = None
-        self.vehicle = vehicle
-        self.topicPrefix = topicPrefix
+        self.callbackGroup = None
+        self.timer = None
+        self.clockMsg = None
+        self.clockPublisher = None
+        self.tf_broadcaster = None
+        #Transforms of the sensor frames, all sent again when one is added
+        self.staticBroadcaster = None
+        self.staticTransforms = []
+
+        #(vehicle, namespace, framePrefix) registered before start
+        self.pending = []
+        self.vehicles = {}
+        #VehicleTopics and their transforms, replaced as a whole when a
+        #vehicle is added, the physics thread iterates them unlocked
+        self.topics = ()
+        self.transforms = []
+
+    def addVehicle(self, vehicle, namespace, framePrefix=""):
+        """
+        Expose a vehicle, its topics are created when the bridge starts
+        """
+        self.pending.append((vehicle, namespace, framePrefix))
+        if self.node is not None:
+            self.createVehicles()
+
+    def createVehicles(self):
+        for vehicle, namespace, framePrefix in self.pending:
+            self.vehicles[id(vehicle)] = VehicleTopics(self, vehicle, namespace,
+                                                       framePrefix, self.callbackGroup)
+        self.pending = []
+        self.topics = tuple(self.vehicles.values())
+        self.transforms = [topics.transform for topics in self.topics]
+
+    def getVehicleTopics(self, vehicle):
+        return self.vehicles.get(id(vehicle))
 
     def start(self):
-        rclpy.init()
-        self.node = TwistSubscriber(self.vehicle, self.topicPrefix)
-
-        self.thread = threading.Thread(target=self.startNode)
+        if not rclpy.ok():
+            rclpy.init()
+        self.node = Node('truck_simulator',
+                         parameter_overrides=[Parameter('use_sim_time',
+                                                        Parameter.Type.BOOL,
+                                                        self.useSimTime)])
+        #cmd_vel callbacks never wait behind the batched timer
+        self.callbackGroup = ReentrantCallbackGroup()
+
+        self.clockPublisher = self.node.create_publisher(Clock, '/clock', 10)
+        self.clockMsg = Clock()
+        self.tf_broadcaster = TransformBroadcaster(self.node)
+        self.staticBroadcaster = StaticTransformBroadcaster(self.node)
+        self.createVehicles()
+
+        #Runs on the node clock, which follows /clock with use_sim_time
+        self.timer = self.node.create_timer(self.period, self.timerCallback)
+        self.simEngine.addTickListener(self.publishClock)
+        self.simEngine.addTickListener(self.publishState)
+
+        self.executor = MultiThreadedExecutor(num_threads=2)
+        self.executor.add_node(self.node)
+        self.thread = threading.Thread(target=self.executor.spin)
         self.thread.start()
 
-    def startNode(self):
-        rclpy.spin(self.node)
+    def stop(self):
+        self.simEngine.removeTickListener(self.publishClock)
+        self.simEngine.removeTickListener(self.publishState)
+        self.executor.shutdown()
+        self.thread.join()
+        self.node.destroy_node()
+        rclpy.try_shutdown()
+
+    def publishClock(self, simTime):
+        setStamp(self.clockMsg.clock, simTime)
+        self.clockPublisher.publish(self.clockMsg)
+
+    def publishState(self, simTime):
+        """
+        Tick listener publishing the odometry of every vehicle and all their
+        transforms in one message, every stateTicks physics ticks
+        """
+        self.ticksUntilState -= 1
+        if self.ticksUntilState > 0:
+            return
+        self.ticksUntilState = self.stateTicks
+
+        for topics in self.topics:
+            topics.publishState(simTime)
+        if self.transforms:
+            self.tf_broadcaster.sendTransform(self.transforms)
+
+    def addStaticTransform(self, transform):
+        """
+        Publish a transform that never changes on /tf_static
+        """
+        self.staticTransforms = self.staticTransforms + [transform]
+        self.staticBroadcaster.sendTransform(self.staticTransforms)
+
+    def setNow(self, stamp):
+        """
+        Set a header stamp to the current simulation time, or to the wall
+        clock without use_sim_time
+        """
+        if self.useSimTime:
+            setStamp(stamp, self.simEngine.simTime)
+        else:
+            nanoseconds = self.node.get_clock().now().nanoseconds
+            stamp.sec = nanoseconds // 1000000000
+            stamp.nanosec = nanoseconds % 1000000000
+
+    def wantsLidar(self, lidar):
+        """
+        Returns:
+            bool: the topic of the lidar has subscribers
+        """
+        topics = self.vehicles.get(id(lidar.vehicle))
+        if topics is None:
+            return False
+        return topics.getLidarPublisher(lidar).get_subscription_count() > 0
+
+    def publishLidar(self, ranges, lidar, stamp, scanTime):
+        """
+        Publish a scan on the topic of the vehicle carrying the lidar, see
+        VehicleTopics.publishLidar
+        """
+        topics = self.vehicles.get(id(lidar.vehicle))
+        if topics is not None:
+            topics.publishLidar(ranges, lidar, stamp, scanTime)
 
+    def timerCallback(self):
+        for topics in self.topics:
+            #topics.publishPose()
+            topics.publishIcr()
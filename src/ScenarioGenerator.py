@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Procedural generator of scenario files. Produces large, reproducible inputs
+(mazes, parking lots, warehouse aisles and random clutter) that follow the
+same alias/objects.static/objects.dynamic schema as the hand made scenarios.
+"""
+import math
+import random
+import argparse
+
+import yaml
+
+WALL_THICKNESS = 10.0
+
+DEFAULT_ALIASES = [
+    {"name": "Wall",
+     "type": "SceneObject",
+     "render": "RectangleRender",
+     "model": "models/wall.yaml"},
+    {"name": "Car",
+     "type": "Vehicle",
+     "render": "RectangleRender",
+     "model": "models/car.yaml"},
+    {"name": "DrivableCar",
+     "type": "Vehicle",
+     "render": "SimpleVehicleRender",
+     "model": "models/car.yaml"},
+]
+
+#Footprint of models/car.yaml, used for placing parked and moving cars
+CAR_WIDTH = 80.0
+CAR_LENGTH = 150.0
+
+MAIN_VEHICLE = "MainVehicle"
+
+def makeObject(alias, x, y, angle, width, length, name=None):
+    """
+    Create a single object entry as it is stored in a scenario file
+    """
+    obj = {"alias": alias,
+           "loc": [round(x, 2), round(y, 2)],
+           "angle": round(angle, 3),
+           "dim": [round(width, 2), round(length, 2)]}
+    if name:
+        obj["name"] = name
+    return obj
+
+def makeWall(x1, y1, x2, y2, thickness=WALL_THICKNESS):
+    """
+    Create a wall spanning the segment (x1, y1) - (x2, y2)
+    """
+    length = math.hypot(x2 - x1, y2 - y1)
+    angle = math.degrees(math.atan2(y2 - y1, x2 - x1))
+    return makeObject("Wall", (x1 + x2) / 2, (y1 + y2) / 2, angle,
+                      thickness, length)
+
+def boundaryWalls(width, height):
+    """
+    Four walls enclosing the area [0, width] x [0, height]
+    """
+    return [makeWall(0, 0, width, 0),
+            makeWall(width, 0, width, height),
+            makeWall(width, height, 0, height),
+            makeWall(0, height, 0, 0)]
+
+def generateMaze(rng, count, cellSize=250.0):
+    """
+    Perfect maze built with an iterative recursive backtracker. A maze of n
+    cells keeps roughly n walls, so the grid is sized from the requested count.
+
+    Returns:
+        tuple: (walls, spawn points, (width, height))
+    """
+    cols = max(2, int(math.ceil(math.sqrt(count))))
+    rows = max(2, int(math.ceil(count / cols)))
+
+    #Each cell owns its east and south walls
+    east = [[True] * cols for _ in range(rows)]
+    south = [[True] * cols for _ in range(rows)]
+    visited = [[False] * cols for _ in range(rows)]
+
+    stack = [(0, 0)]
+    visited[0][0] = True
+    while stack:
+        r, c = stack[-1]
+        neighbours = []
+        for dr, dc in ((-1, 0), (1, 0), (0, -1), (0, 1)):
+            nr, nc = r + dr, c + dc
+            if 0 <= nr < rows and 0 <= nc < cols and not visited[nr][nc]:
+                neighbours.append((nr, nc))
+        if not neighbours:
+            stack.pop()
+            continue
+        nr, nc = rng.choice(neighbours)
+        if nr == r:
+            east[r][min(c, nc)] = False
+        else:
+            south[min(r, nr)][c] = False
+        visited[nr][nc] = True
+        stack.append((nr, nc))
+
+    walls = []
+    for r in range(rows):
+        for c in range(cols):
+            x = c * cellSize
+            y = r * cellSize
+            if east[r][c] and c < cols - 1:
+                walls.append(makeWall(x + cellSize, y, x + cellSize, y + cellSize))
+            if south[r][c] and r < rows - 1:
+                walls.append(makeWall(x, y + cellSize, x + cellSize, y + cellSize))
+
+    width, height = cols * cellSize, rows * cellSize
+    spawns = [((c + 0.5) * cellSize, (r + 0.5) * cellSize, 0.0)
+              for r in range(rows) for c in range(cols)]
+    return walls + boundaryWalls(width, height), spawns, (width, height)
+
+def generateParkingLot(rng, count, fill=0.5, spotWidth=110.0,
+                       spotDepth=200.0, aisleWidth=400.0):
+    """
+    Rows of parking spots separated by driving aisles. Every spot has a
+    divider wall and a share of them is taken by parked (static) cars.
+
+    Returns:
+        tuple: (objects, spawn points, (width, height))
+    """
+    spotsPerRow = max(2, int(math.ceil(math.sqrt(count * 2))))
+    rowPairs = max(1, int(math.ceil(count / (2 * spotsPerRow))))
+
+    width = spotsPerRow * spotWidth + 2 * aisleWidth
+    pairDepth = 2 * spotDepth + aisleWidth
+    height = rowPairs * pairDepth + aisleWidth
+
+    objects = []
+    spawns = []
+    for pair in range(rowPairs):
+        top = aisleWidth + pair * pairDepth
+        #Two back to back rows of spots facing opposite aisles
+        for side, rowTop in ((0, top), (1, top + spotDepth)):
+            facing = -90.0 if side == 0 else 90.0
+            for i in range(spotsPerRow + 1):
+                x = aisleWidth + i * spotWidth
+                objects.append(makeWall(x, rowTop, x, rowTop + spotDepth))
+            for i in range(spotsPerRow):
+                if rng.random() >= fill:
+                    continue
+                x = aisleWidth + (i + 0.5) * spotWidth
+                y = rowTop + spotDepth / 2
+                objects.append(makeObject("Car", x, y,
+                                          facing + rng.uniform(-3, 3),
+                                          CAR_WIDTH, CAR_LENGTH))
+        objects.append(makeWall(aisleWidth, top + spotDepth,
+                                width - aisleWidth, top + spotDepth))
+        aisleY = top + 2 * spotDepth + aisleWidth / 2
+        spawns.extend((x, aisleY, 0.0)
+                      for x in range(int(aisleWidth), int(width - aisleWidth),
+                                     int(CAR_LENGTH * 2)))
+
+    spawns.extend((x, aisleWidth / 2, 0.0)
+                  for x in range(int(aisleWidth), int(width - aisleWidth),
+                                 int(CAR_LENGTH * 2)))
+    return objects + boundaryWalls(width, height), spawns, (width, height)
+
+def generateWarehouse(rng, count, rackLength=300.0, rackDepth=100.0,
+                      aisleWidth=300.0):
+    """
+    Long rows of racks split in segments with occasional cross aisles.
+
+    Returns:
+        tuple: (objects, spawn points, (width, height))
+    """
+    segmentsPerRow = max(2, int(math.ceil(math.sqrt(count))))
+    rows = max(1, int(math.ceil(count / segmentsPerRow)))
+
+    width = segmentsPerRow * rackLength + 2 * aisleWidth
+    height = rows * (rackDepth + aisleWidth) + aisleWidth
+
+    objects = []
+    spawns = []
+    crossAisles = set(rng.sample(range(segmentsPerRow),
+                                 max(1, segmentsPerRow // 8)))
+    for row in range(rows):
+        y = aisleWidth + row * (rackDepth + aisleWidth) + rackDepth / 2
+        for seg in range(segmentsPerRow):
+            if seg in crossAisles:
+                continue
+            x = aisleWidth + (seg + 0.5) * rackLength
+            objects.append(makeObject("Wall", x, y, 0.0,
+                                      rackDepth, rackLength - 10))
+        aisleY = y + (rackDepth + aisleWidth) / 2
+        spawns.extend((aisleWidth + (seg + 0.5) * rackLength, aisleY, 0.0)
+                      for seg in range(segmentsPerRow))
+
+    return objects + boundaryWalls(width, height), spawns, (width, height)
+
+def generateClutter(rng, count, density=0.02, minLength=20.0,
+                    maxLength=200.0, vehicles=0):
+    """
+    Randomly placed and rotated walls. The area grows with the count so the
+    density (occupied area ratio) stays roughly constant. Vehicle spawn points
+    are reserved first and kept clear of clutter.
+
+    Returns:
+        tuple: (objects, spawn points, (width, height))
+    """
+    meanArea = WALL_THICKNESS * (minLength + maxLength) / 2
+    side = max(1000.0, math.sqrt(count * meanArea / density))
+
+    clearance = CAR_LENGTH
+    spawns = [(rng.uniform(clearance, side - clearance),
+               rng.uniform(clearance, side - clearance),
+               rng.uniform(-180, 180)) for _ in range(vehicles)]
+
+    #Bucket the spawn points so each wall only checks its neighbourhood
+    cell = 2 * clearance + maxLength
+    buckets = {}
+    for sx, sy, _ in spawns:
+        buckets.setdefault((int(sx // cell), int(sy // cell)), []).append((sx, sy))
+
+    objects = []
+    while len(objects) < count:
+        x = rng.uniform(0, side)
+        y = rng.uniform(0, side)
+        length = rng.uniform(minLength, maxLength)
+        key = (int(x // cell), int(y // cell))
+        blocked = False
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for sx, sy in buckets.get((key[0] + dx, key[1] + dy), ()):
+                    if math.hypot(sx - x, sy - y) < clearance + length / 2:
+                        blocked = True
+        if blocked:
+            continue
+        objects.append(makeObject("Wall", x, y, rng.uniform(0, 180),
+                                  WALL_THICKNESS, length))
+
+    return objects + boundaryWalls(side, side), spawns, (side, side)
+
+LAYOUTS = {
+    "maze": generateMaze,
+    "parking": generateParkingLot,
+    "warehouse": generateWarehouse,
+    "clutter": generateClutter,
+}
+
+def placeVehicles(rng, spawns, vehicles):
+    """
+    Pick spawn points for the dynamic vehicles. The first vehicle is the
+    drivable MainVehicle, the rest are named so they can be addressed.
+    """
+    if vehicles > len(spawns):
+        raise ValueError(f"Layout offers only {len(spawns)} spawn points "
+                         f"for {vehicles} vehicles")
+
+    dynamic = []
+    for i, (x, y, angle) in enumerate(rng.sample(spawns, vehicles)):
+        if i == 0:
+            dynamic.append(makeObject("DrivableCar", x, y, angle,
+                                      CAR_WIDTH, CAR_LENGTH, MAIN_VEHICLE))
+        else:
+            dynamic.append(makeObject("Car", x, y, angle,
+                                      CAR_WIDTH, CAR_LENGTH, f"vehicle{i + 1}"))
+    return dynamic
+
+def generateScenario(layout, count, vehicles=1, seed=0, **options):
+    """
+    Generate a complete scenario structure.
+
+    Args:
+        layout (str): one of LAYOUTS
+        count (int): approximate number of static objects to generate
+        vehicles (int): number of dynamic vehicles
+        seed (int): seed for the random generator, same seed same scenario
+        options: extra keyword arguments for the layout function
+
+    Returns:
+        dict: the scenario, ready to be dumped as yaml
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown layout {layout}, expected one of {list(LAYOUTS)}")
+
+    rng = random.Random(seed)
+    if layout == "clutter":
+        options["vehicles"] = vehicles
+    static, spawns, _ = LAYOUTS[layout](rng, count, **options)
+
+    return {"aliases": [dict(alias) for alias in DEFAULT_ALIASES],
+            "objects": {"static": static,
+                        "dynamic": placeVehicles(rng, spawns, vehicles)}}
+
+def writeScenario(scenario, path):
+    """
+    Dump a scenario to a yaml file, with the C dumper when available since
+    pure python yaml is slow for very large scenarios.
+    """
+    dumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+    with open(path, "w", encoding="utf-8") as file:
+        yaml.dump(scenario, file, Dumper=dumper, default_flow_style=False)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate large scenario files")
+    parser.add_argument("layout", choices=sorted(LAYOUTS), help="Layout to generate")
+    parser.add_argument("--count", type=int, default=1000,
+                        help="Approximate number of static objects")
+    parser.add_argument("--vehicles", type=int, default=1,
+                        help="Number of dynamic vehicles")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--fill", type=float, default=0.5,
+                        help="Ratio of taken parking spots (parking only)")
+    parser.add_argument("--density", type=float, default=0.02,
+                        help="Occupied area ratio (clutter only)")
+    parser.add_argument("-o", "--output", required=True, help="Output scenario file")
+
+    args = parser.parse_args()
+
+    extra = {}
+    if args.layout == "parking":
+        extra["fill"] = args.fill
+    elif args.layout == "clutter":
+        extra["density"] = args.density
+
+    data = generateScenario(args.layout, args.count, args.vehicles, args.seed, **extra)
+    writeScenario(data, args.output)
+    print(f"Wrote {len(data['objects']['static'])} static and "
+          f"{len(data['objects']['dynamic'])} dynamic objects to {args.output}")
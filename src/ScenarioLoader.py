@@ -3,12 +3,67 @@ This module contains all the necessary fuctionality to load a scenario from a
 yaml file
 """
 
+import importlib
+
 import yaml
-# pylint: disable=wildcard-import
-# pylint: disable=unused-wildcard-import
-from SceneObjects import *
-from VehicleRender import *
-from Vehicle import Vehicle # pylint: disable=unused-import
+
+from Diagnostics import getChannel
+
+LOADER = getChannel("loader")
+
+#Registries of the types that can be referenced by an alias. Entries are
+#either classes or "module:Class" strings that get imported on first use, so
+#loading a headless scenario never pulls in Qt for the renderers.
+OBJECT_TYPES = {
+    "SceneObject": "SceneObjects:SceneObject",
+    "Vehicle": "Vehicle:Vehicle",
+}
+
+RENDER_TYPES = {
+    "RectangleRender": "VehicleRender:RectangleRender",
+    "SimpleVehicleRender": "VehicleRender:SimpleVehicleRender",
+}
+
+def registerObjectType(name, cls):
+    """
+    Register a scene object type so aliases can reference it by name
+    """
+    OBJECT_TYPES[name] = cls
+
+def registerRenderType(name, cls):
+    """
+    Register a renderer type so aliases can reference it by name
+    """
+    RENDER_TYPES[name] = cls
+
+def resolveType(registry, name):
+    """
+    Look up a type in a registry, importing it if needed. Names that are not
+    registered but have the "module:Class" form are imported directly, which
+    allows plugin types without registering them first.
+    """
+    entry = registry.get(name)
+    if entry is None:
+        if ":" not in name:
+            raise ValueError(f"Unknown type {name}")
+        entry = name
+
+    if isinstance(entry, str):
+        moduleName, className = entry.split(":")
+        entry = getattr(importlib.import_module(moduleName), className)
+        registry[name] = entry
+
+    return entry
+
+def loadYaml(file):
+    """
+    Parse yaml with the C loader when available, large scenarios take
+    several times longer with the pure python one.
+    """
+    return yaml.load(file, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+
+def reportProgress(stage, done, total):
+    LOADER.info("{stage}: {done}/{total} objects", stage=stage, done=done, total=total)
 
 class Alias:
     """
@@ -19,6 +74,9 @@ class Alias:
         self.aliasData = aliasData
         self.data = None
 
+        self.objectClass = None
+        self.renderClass = None
+
     def isValid(self):
         """
         Minimum viable configuration
@@ -36,20 +94,71 @@ class Alias:
     def getModelData(self):
         if self.data is None:
             with open(self.aliasData['model'], "r", encoding="utf-8") as file:
-                self.data = yaml.safe_load(file)
+                self.data = loadYaml(file)
         return self.data
 
+    def getObjectClass(self):
+        if self.objectClass is None:
+            self.objectClass = resolveType(OBJECT_TYPES, self.aliasData['type'])
+        return self.objectClass
+
+    def getRenderClass(self):
+        if self.renderClass is None:
+            self.renderClass = resolveType(RENDER_TYPES, self.aliasData['render'])
+        return self.renderClass
+
     def genObject(self, loc, angle):
         modelData = self.getModelData()
         if modelData:
-            return globals()[self.aliasData['type']](loc, angle, data=modelData)
-        return globals()[self.aliasData['type']](loc, angle)
+            return self.getObjectClass()(loc, angle, data=modelData)
+        return self.getObjectClass()(loc, angle)
+
+    def genObjects(self, entries):
+        """
+        Construct the objects of several scenario entries of this alias in a
+        single pass.
+
+        Args:
+            entries (list): object dictionaries as stored in the scenario
+
+        Returns:
+            list: the created objects, in the same order as the entries
+        """
+        cls = self.getObjectClass()
+        modelData = self.getModelData()
+
+        objects = []
+        for entry in entries:
+            if modelData:
+                obj = cls(entry['loc'], entry['angle'], data=modelData)
+            else:
+                obj = cls(entry['loc'], entry['angle'])
+
+            width, length = entry['dim']
+            if width:
+                obj.width = width
+            if length:
+                obj.length = length
+            obj.alias = self
+            if 'name' in entry:
+                obj.objectName = entry['name']
+
+            objects.append(obj)
+
+        return objects
 
     def genRender(self, obj):
         modelData = self.getModelData()
         if modelData:
-            return globals()[self.aliasData['render']](obj, data=modelData)
-        return globals()[self.aliasData['render']](obj)
+            return self.getRenderClass()(obj, data=modelData)
+        return self.getRenderClass()(obj)
+
+    def genRenders(self, objects):
+        cls = self.getRenderClass()
+        modelData = self.getModelData()
+        if modelData:
+            return [cls(obj, data=modelData) for obj in objects]
+        return [cls(obj) for obj in objects]
 
     def getName(self):
         return self.aliasData['name']
@@ -64,11 +173,11 @@ class ScenarioLoader:
     def __init__(self, scenarioName):
         self.scenarioName = scenarioName
         with open(scenarioName, 'r', encoding="utf-8") as file:
-            self.data = yaml.safe_load(file)
+            self.data = loadYaml(file)
         self.aliases = {}
 
-        self.createAliases()
         self.loadingErrors = False
+        self.createAliases()
 
         self.namedObjects = {}
 
@@ -84,7 +193,7 @@ class ScenarioLoader:
             if aliasObj.isValid():
                 self.aliases[aliasObj.getName()] = aliasObj
             else:
-                self.loadingError = True
+                self.loadingErrors = True
 
     def getAliases(self):
         return self.aliases
@@ -94,6 +203,9 @@ class ScenarioLoader:
             return self.namedObjects[name]
         return None
 
+    def getNamedObjects(self):
+        return self.namedObjects
+
     def getYamlAliasses(self):
         """
         Generate yaml structure for all the aliases
@@ -140,7 +252,7 @@ class ScenarioLoader:
 
         #In case of a loading error prevent saving that could corrupt the scenario
         if scenarioName == self.scenarioName and self.loadingErrors:
-            print("Scenario contains loading errors, saving on the same file is not permitted!")
+            LOADER.error("Scenario contains loading errors, saving on the same file is not permitted!")
             return
 
         with open(scenarioName, 'w', encoding="utf-8") as file:
@@ -158,26 +270,82 @@ class ScenarioLoader:
 
         return tmp, alias
 
-    def instantiateScenario(self, simEngine, renderEngine):
+    def loadObjects(self, entries, stage, progress):
+        """
+        Build the objects of a list of scenario entries, one batch per alias.
+
+        Returns:
+            list: the created objects, in the order of the entries
+        """
+        byAlias = {}
+        for index, entry in enumerate(entries):
+            byAlias.setdefault(entry['alias'], []).append(index)
+
+        objects = [None] * len(entries)
+        done = 0
+        for aliasName, indices in byAlias.items():
+            alias = self.aliases[aliasName]
+            for index, obj in zip(indices,
+                                  alias.genObjects([entries[i] for i in indices])):
+                objects[index] = obj
+                if obj.objectName:
+                    self.namedObjects[obj.objectName] = obj
+
+            done += len(indices)
+            if progress:
+                progress(stage, done, len(entries))
+
+        return objects
+
+    def genRenders(self, objects):
+        """
+        Create the renderers of the objects, batched per alias
+        """
+        byAlias = {}
+        for index, obj in enumerate(objects):
+            byAlias.setdefault(obj.getAlias(), []).append(index)
+
+        renders = [None] * len(objects)
+        for alias, indices in byAlias.items():
+            for index, render in zip(indices,
+                                     alias.genRenders([objects[i] for i in indices])):
+                renders[index] = render
+        return renders
+
+    def genSceneRenders(self, simEngine):
+        """
+        Create a second set of renderers for the objects already in the
+        simulation, e.g. for an offscreen renderer next to the window.
+
+        Returns:
+            tuple: (static renderers, dynamic renderers)
+        """
+        return (self.genRenders(simEngine.getStaticObjects()),
+                self.genRenders(simEngine.getDynamicObjects()))
+
+    def instantiateScenario(self, simEngine, renderEngine, progress=reportProgress):
         """
         Loads all the objects of the scenario into the engines
+
+        Args:
+            simEngine (SimEngine): engine receiving the objects
+            renderEngine (RenderEngine): engine receiving the renderers, can be
+                None for headless runs
+            progress (callable): called as progress(stage, done, total) after
+                each alias batch, None to stay silent
         """
         assert(simEngine is not None), "Simulation engine can't be None"
         assert('objects' in self.data), "Sceanrio file requires objects element"
-        if 'static' in self.data['objects']:
-            for obj in self.data['objects']['static']:
-                print (obj)
-                tmp, alias = self.loadObject(obj)
-                simEngine.registerStaticObject(tmp)
-                if renderEngine is None:
-                    continue
-                renderEngine.registerObject(alias.genRender(tmp))
-        if 'dynamic' in self.data['objects']:
-            for obj in self.data['objects']['dynamic']:
-                print (obj)
-                tmp, alias = self.loadObject(obj)
-                simEngine.registerDynamicObject(tmp)
-                if renderEngine is None:
-                    continue
-                renderEngine.registerObject(alias.genRender(tmp))
+        objects = self.data['objects']
+
+        if objects.get('static'):
+            static = self.loadObjects(objects['static'], "static", progress)
+            simEngine.registerStaticObjects(static)
+            if renderEngine is not None:
+                renderEngine.registerObjects(self.genRenders(static), static=True)
+        if objects.get('dynamic'):
+            dynamic = self.loadObjects(objects['dynamic'], "dynamic", progress)
+            simEngine.registerDynamicObjects(dynamic)
+            if renderEngine is not None:
+                renderEngine.registerObjects(self.genRenders(dynamic))
         #TODO:Load dynamic but how to bind the hotkeys????
@@ -2,9 +2,13 @@
 This module contains the description of the objects in the simulation
 """
 import math
+import collections
 
 from Utils import Vector2D
 
+#Snapshot of the drawable state of an object, see SceneObject.getPose
+Pose = collections.namedtuple("Pose", ["x", "y", "angle", "steeringAngle"])
+
 class SceneObject:
     """
     The basic object of the simulation
@@ -56,6 +60,9 @@ class SceneObject:
     def getAngle(self):
         return self.angle
 
+    def getPose(self):
+        return Pose(self.pos.x, self.pos.y, self.angle, 0.0)
+
     def isResizable(self):
         return self.resizable
 
@@ -78,6 +85,13 @@ class SceneObject:
         Returns:
             list: A list of (x, y) tuples representing the corners.
         """
+        return self.getCornersAt(self.pos.x, self.pos.y, self.angle)
+
+    def getCornersAt(self, x, y, angle):
+        """
+        Corners of the rectangle if it was placed at another pose, used for
+        drawing interpolated poses.
+        """
         # Half dimensions
         halfWidth = self.width / 2
         halfLength = self.length / 2
@@ -91,7 +105,7 @@ class SceneObject:
         ]
 
         # Convert angle from degrees to radians
-        rad = math.radians(self.angle)
+        rad = math.radians(angle)
         rotatedOffsetX, rotatedOffsetY = self.boundOffset.rotate(rad).extract()
 
         # Rotate corners around the center
@@ -99,11 +113,29 @@ class SceneObject:
         for corner in corners:
             rotatedX = corner[0] * math.cos(rad) - corner[1] * math.sin(rad)
             rotatedY = corner[0] * math.sin(rad) + corner[1] * math.cos(rad)
-            rotatedCorners.append((rotatedX + self.pos.x + rotatedOffsetX,
-                                    rotatedY + self.pos.y + rotatedOffsetY))
+            rotatedCorners.append((rotatedX + x + rotatedOffsetX,
+                                    rotatedY + y + rotatedOffsetY))
 
         return rotatedCorners
 
+    def getBounds(self, pose=None):
+        """
+        Axis aligned bounding box of the object.
+
+        Args:
+            pose (Pose): compute the box at this pose instead of the current
+
+        Returns:
+            tuple: (minX, minY, maxX, maxY)
+        """
+        if pose is None:
+            corners = self.getCorners()
+        else:
+            corners = self.getCornersAt(pose.x, pose.y, pose.angle)
+        xs = [corner[0] for corner in corners]
+        ys = [corner[1] for corner in corners]
+        return min(xs), min(ys), max(xs), max(ys)
+
     def getAxes(self):
         """
         Get the axes to test for the Separating Axis Theorem (SAT).
@@ -1,6 +1,44 @@
 import math
-import time
 import threading
+import collections
+from array import array
+
+from Utils import Vector2D
+from SpatialIndex import SpatialIndex, boundsIntersect
+from Diagnostics import getChannel
+
+SENSORS = getChannel("sensors")
+
+#Simulation units (cm) per meter, ROS ranges are published in meters
+ROS_UNITS = 100.0
+
+#A completed lidar scan. Ranges are in simulation units (inf without a hit),
+#ray i points at angle + i * angleIncrement degrees from (x, y). The stamp is
+#the simulation time the scan was taken at
+Scan = collections.namedtuple("Scan", ["sequence", "stamp", "x", "y", "angle",
+                                       "angleIncrement", "ranges"])
+
+class ScanBuffer:
+    """
+    Latest completed scan of a sensor, for any number of readers. There is a
+    single writer that publishes immutable scans by replacing the reference,
+    readers never block it and never see a partially written scan.
+    """
+    def __init__(self):
+        self.latest = None
+        self.sequence = 0
+
+    def publish(self, stamp, x, y, angle, angleIncrement, ranges):
+        self.sequence += 1
+        self.latest = Scan(self.sequence, stamp, x, y, angle,
+                           angleIncrement, tuple(ranges))
+
+    def getLatest(self):
+        """
+        Returns:
+            Scan: the last published scan, None before the first one
+        """
+        return self.latest
 
 def lineLineIntersection(x1, y1, x2, y2, x3, y3, x4, y4):
     # Line-line intersection formula
@@ -43,7 +81,7 @@ def projectRay(rayOrigin, rayDirection, axis):
     # Ray extends infinitely in the negative direction
     return (float('-inf'), projectionOrigin)
 
-def calculateIntersection(x, y, dirX, dirY, obj):
+def calculateIntersection(x, y, dirX, dirY, obj, maxRange=1000):
     corners = obj.getCorners()
     lidarEnd = (x + dirX, y + dirY)
 
@@ -64,7 +102,7 @@ def calculateIntersection(x, y, dirX, dirY, obj):
 
         if intersection:
             dist = distanceBetweenPoints(x, y, intersection[0], intersection[1])
-            if dist < minDistance and dist <= 1000: #maxLen
+            if dist < minDistance and dist <= maxRange:
                 minDistance = dist
                 collisionPoint = intersection
 
@@ -72,62 +110,648 @@ def calculateIntersection(x, y, dirX, dirY, obj):
         return minDistance
     return None
 
-class Lidar:
-    def __init__(self, simEngine, vehicle, rosNode=None,
-                 numRays=360, rayAngleIncrement=1, interval=1/60):
-        self.numRays = numRays
-        self.rayAngleIncrement = rayAngleIncrement
+def collectEdges(x, y, maxRange, objects, ignoreObjects=()):
+    """
+    Edges of the objects within range of (x, y), see castRays
+    """
+    ignore = {id(obj) for obj in ignoreObjects}
+    rect = (x - maxRange, y - maxRange, x + maxRange, y + maxRange)
+    edges = []
+    for obj in objects:
+        if id(obj) not in ignore and boundsIntersect(obj.getBounds(), rect):
+            appendEdges(edges, x, y, objectEdges(obj))
+    return edges
+
+def objectEdges(obj):
+    """
+    Returns:
+        tuple: (ax, ay, ex, ey) per edge of the object, with a the start
+            corner and e the vector to the next corner
+    """
+    corners = obj.getCorners()
+    return tuple((corners[i][0], corners[i][1],
+                  corners[(i + 1) % 4][0] - corners[i][0],
+                  corners[(i + 1) % 4][1] - corners[i][1]) for i in range(4))
+
+def appendEdges(edges, x, y, absolute):
+    for ax, ay, ex, ey in absolute:
+        wx = ax - x
+        wy = ay - y
+        edges.append((wx, wy, ex, ey, wx * ey - wy * ex))
+
+def bucketEdges(edges, angle, sensor, first, last):
+    """
+    Sort the edges by the rays first to last - 1 that can hit them, using
+    the angle each edge covers as seen from the sensor.
 
+    Returns:
+        list: edge list per ray, starting at ray first
+    """
+    numRays = sensor.numRays
+    increment = sensor.rayAngleIncrement
+    fullCircle = sensor.fov >= 360.0
+    base = angle + sensor.angleMin
+    buckets = [[] for _ in range(first, last)]
+    #Edges seen under (almost) 180 degrees, tested by every ray
+    everywhere = []
+    for edge in edges:
+        wx, wy, ex, ey, _ = edge
+        start = math.degrees(math.atan2(wy, wx)) - base
+        span = (math.degrees(math.atan2(wy + ey, wx + ex)) - base - start + 180.0) % 360.0 - 180.0
+        if span < 0:
+            start += span
+            span = -span
+        if span > 179.0:
+            everywhere.append(edge)
+            continue
+        start %= 360.0
+        if start + span > 360.0:
+            start -= 360.0
+
+        #One extra ray on both sides absorbs rounding
+        lo = int(math.floor(start / increment))
+        hi = int(math.ceil((start + span) / increment))
+        if fullCircle:
+            indices = (k % numRays for k in range(lo, hi + 1))
+        else:
+            indices = range(max(lo, 0), min(hi, numRays - 1) + 1)
+        for i in indices:
+            if first <= i < last:
+                buckets[i - first].append(edge)
+
+    if everywhere:
+        for bucket in buckets:
+            bucket.extend(everywhere)
+    return buckets
+
+def castRays(edges, angle, sensor, first, last, rays=None, base=None, out=None):
+    """
+    Cast rays first to last - 1 of a sensor facing angle, writing the ranges
+    in simulation units and in meters. Rays without a hit within range are
+    inf. Every ray only tests the edges inside its angle, see bucketEdges.
+
+    Args:
+        edges (list): (wx, wy, ex, ey, cross) per edge, with w the edge start
+            relative to the sensor, e the edge vector and cross = w x e
+        angle (float): sensor angle in degrees
+        sensor (Sensor): provides the ray tables, maxRange and the ranges
+            and rosRanges buffers
+        rays (iterable): cast only these rays of first to last - 1
+        base (array): per ray distance to start from, e.g. the ranges of the
+            static objects, inf by default
+        out (array): write the ranges in simulation units only, to this
+            array instead of the sensor buffers
+    """
+    buckets = bucketEdges(edges, angle, sensor, first, last)
+    rads = math.radians(angle)
+    cosA = math.cos(rads)
+    sinA = math.sin(rads)
+    rayCos = sensor.rayCos
+    raySin = sensor.raySin
+    maxRange = sensor.maxRange
+    scanData = sensor.ranges if out is None else out
+    rosData = sensor.rosRanges if out is None else None
+    rosScale = 1.0 / ROS_UNITS
+    for i in range(first, last) if rays is None else rays:
+        dx = rayCos[i] * cosA - raySin[i] * sinA
+        dy = raySin[i] * cosA + rayCos[i] * sinA
+
+        #Distance along the ray t and position on the edge u of the
+        #intersection, for a unit ray t is the range
+        closestDist = math.inf if base is None else base[i]
+        for wx, wy, ex, ey, cross in buckets[i - first]:
+            denom = dx * ey - dy * ex
+            if denom == 0:
+                continue
+            t = cross / denom
+            if 0 <= t < closestDist:
+                u = (dy * wx - dx * wy) / denom
+                if 0 <= u <= 1:
+                    closestDist = t
+        if closestDist > maxRange:
+            closestDist = math.inf
+        scanData[i] = closestDist
+        if rosData is not None:
+            rosData[i] = closestDist * rosScale
+
+class RayCaster:
+    """
+    Resolves the rays of all the sensors of a tick in one pass. Edges of
+    static objects are kept in a spatial index that is rebuilt when the
+    static scene changes, the edges of dynamic objects are computed once per
+    pass and shared by every sensor.
+
+    Full scans are incremental. Every sensor keeps the ranges of the static
+    objects alone, valid while its pose and the static scene are unchanged.
+    Then only dynamic objects in range are cast again, and only the rays
+    covering where moved objects were and are now. Nothing is cast when
+    nothing in range moved.
+    """
+    def __init__(self, simEngine):
         self.simEngine = simEngine
+        self.staticIndex = None
+        self.staticVersion = None
+
+        #Statistics: full scans, incremental scans, reused scans and rays cast
+        #by incremental scans
+        self.fullScans = 0
+        self.partialScans = 0
+        self.reusedScans = 0
+        self.recastRays = 0
+
+    def updateStatic(self):
+        """
+        Rebuild the static edge index after the static scene changed. The
+        index is private to the caster thread, edits of the scene never touch
+        it while it is queried.
+        """
+        version = self.simEngine.staticVersion
+        if version == self.staticVersion:
+            return
+        self.staticVersion = version
+        self.staticIndex = SpatialIndex()
+        for obj in self.simEngine.getStaticObjects():
+            self.staticIndex.insert(objectEdges(obj), obj.getBounds())
+
+    def cast(self, requests):
+        """
+        Args:
+            requests (list): (sensor, (x, y, angle), sectors) per sensor, the
+                sectors are (first, last) ray ranges to cast
+        """
+        self.updateStatic()
+        dynamic = [(obj, obj.getBounds(), objectEdges(obj))
+                   for obj in self.simEngine.getDynamicObjects()]
+
+        for sensor, pose, sectors in requests:
+            x, y, angle = pose
+            maxRange = sensor.maxRange
+            rect = (x - maxRange, y - maxRange, x + maxRange, y + maxRange)
+            #Edges of the dynamic objects in range by object
+            nearby = {id(obj): absolute for obj, bounds, absolute in dynamic
+                      if obj is not sensor.vehicle and boundsIntersect(bounds, rect)}
+
+            if sectors == [(0, sensor.numRays)]:
+                self.castFull(sensor, pose, rect, nearby)
+                continue
+
+            sensor.cacheKey = None
+            edges = []
+            for absolute in self.staticIndex.query(rect):
+                appendEdges(edges, x, y, absolute)
+            for absolute in nearby.values():
+                appendEdges(edges, x, y, absolute)
+            for first, last in sectors:
+                castRays(edges, angle, sensor, first, last)
+
+    def castFull(self, sensor, pose, rect, nearby):
+        """
+        Cast all the rays of a sensor, reusing what is still valid from its
+        previous scan
+        """
+        x, y, angle = pose
+        numRays = sensor.numRays
+        key = (pose, self.staticVersion)
+        previous = sensor.cachedDynamic
+        sensor.cachedDynamic = nearby
+
+        edges = []
+        if key != sensor.cacheKey:
+            self.fullScans += 1
+            sensor.cacheKey = key
+            for absolute in self.staticIndex.query(rect):
+                appendEdges(edges, x, y, absolute)
+            castRays(edges, angle, sensor, 0, numRays, out=sensor.staticRanges)
+
+            edges = []
+            for absolute in nearby.values():
+                appendEdges(edges, x, y, absolute)
+            castRays(edges, angle, sensor, 0, numRays, base=sensor.staticRanges)
+            return
+
+        #Objects that moved, appeared or left, at their old and new place
+        moved = []
+        for objId, absolute in nearby.items():
+            if previous.get(objId) != absolute:
+                appendEdges(moved, x, y, absolute)
+                if objId in previous:
+                    appendEdges(moved, x, y, previous[objId])
+        for objId, absolute in previous.items():
+            if objId not in nearby:
+                appendEdges(moved, x, y, absolute)
+        if not moved:
+            self.reusedScans += 1
+            return
+
+        rays = [i for i, bucket in enumerate(bucketEdges(moved, angle, sensor, 0, numRays))
+                if bucket]
+        self.partialScans += 1
+        self.recastRays += len(rays)
+        for absolute in nearby.values():
+            appendEdges(edges, x, y, absolute)
+        castRays(edges, angle, sensor, 0, numRays, rays=rays, base=sensor.staticRanges)
+
+class Sensor:
+    """
+    Base of the ray based sensors mounted on a vehicle. A sensor casts a fan
+    of rays, their directions relative to the sensor are computed once. The
+    SensorManager asks every sensor which rays are due, casts the rays of
+    all sensors together and hands the results back with update.
+
+    Sensors are sampled on demand only, while a consumer registered with
+    addConsumer wants their samples or after request.
+    """
+    #Configuration keys, overridden by the model data. Angles are in degrees,
+    #lengths in simulation units
+    DEFAULTS = {
+        "name": "sensor",
+        "fov": 30.0,          #Field of view, centered on the mounting angle
+        "resolution": 1.0,    #Angle between rays
+        "range": 100.0,       #Maximum distance
+        "offset": [0.0, 0.0], #Mounting position in the vehicle frame
+        "angle": 0.0,         #Mounting angle relative to the vehicle
+        "rate": 10.0,         #Samples per second
+    }
+
+    def __init__(self, vehicle, data=None):
+        """
+        Args:
+            vehicle (SceneObject): the object carrying the sensor
+            data (dict): configuration, see DEFAULTS
+        """
+        config = dict(self.DEFAULTS)
+        config.update(data or {})
+        self.config = config
+        self.name = config["name"]
+        self.fov = float(config["fov"])
+        self.rayAngleIncrement = float(config["resolution"])
+        self.maxRange = float(config["range"])
+        self.offset = Vector2D(config["offset"][0], config["offset"][1])
+        self.mountAngle = float(config["angle"])
+        self.interval = 1.0 / config["rate"]
+
+        #A full circle starts ahead, partial fields of view are centered on
+        #the mounting angle and include both edges
+        steps = max(1, int(round(self.fov / self.rayAngleIncrement)))
+        if self.fov >= 360.0:
+            self.numRays = steps
+            self.angleMin = 0.0
+        else:
+            self.numRays = steps + 1
+            self.angleMin = -steps * self.rayAngleIncrement / 2
+
+        #Unit directions of the rays relative to the sensor
+        angles = [math.radians(self.angleMin + i * self.rayAngleIncrement)
+                  for i in range(self.numRays)]
+        self.rayCos = array('d', [math.cos(rad) for rad in angles])
+        self.raySin = array('d', [math.sin(rad) for rad in angles])
+
         self.vehicle = vehicle
-        self.rosNode = rosNode
+        self.nextSample = None
+
+        #Preallocated ranges, overwritten by every sample. ranges holds
+        #simulation units, rosRanges the same distances in meters
+        self.ranges = array('f', [math.inf]) * self.numRays
+        self.rosRanges = array('f', [math.inf]) * self.numRays
+
+        #Incremental scans, see RayCaster.castFull: ranges of the static
+        #objects alone, the (pose, static version) they are valid for and the
+        #edges of the dynamic objects in range at the last scan
+        self.staticRanges = array('f', [math.inf]) * self.numRays
+        self.cacheKey = None
+        self.cachedDynamic = {}
+
+        #(consumer, demand) pairs, replaced as a whole when changed, the
+        #sensor thread iterates it unlocked
+        self.consumers = ()
+        #A single sample was asked for with request
+        self.requested = False
+
+    def addConsumer(self, consumer, demand=None):
+        """
+        Register interest in the samples of this sensor. Consumers of the
+        same sensor share its samples, it is never sampled twice per tick.
+
+        Args:
+            consumer: object identifying the consumer, e.g. an overlay
+            demand (callable): returns whether the consumer wants samples
+                right now, e.g. while a topic has subscribers. None for as
+                long as it is registered
+        """
+        self.consumers = self.consumers + ((consumer, demand),)
+
+    def removeConsumer(self, consumer):
+        self.consumers = tuple(entry for entry in self.consumers if entry[0] is not consumer)
+
+    def request(self):
+        """
+        Sample at the next due time even without consumers, e.g. for a one
+        off observation. The result is read from the sensor as usual.
+        """
+        self.requested = True
+
+    def isDemanded(self):
+        if self.requested:
+            return True
+        for _, demand in self.consumers:
+            if demand is None or demand():
+                return True
+        return False
+
+    def idle(self):
+        """
+        Called instead of getSectors at ticks without demand
+        """
+
+    def getSensorPose(self):
+        """
+        Returns:
+            tuple: (x, y, angle) of the sensor in world coordinates
+        """
+        angle = self.vehicle.getAngle()
+        origin = self.vehicle.pos + self.offset.rotate(math.radians(angle))
+        return origin.x, origin.y, angle + self.mountAngle
+
+    def getSectors(self, simTime):
+        """
+        Rays to cast at this tick, by default all of them every interval.
+
+        Returns:
+            list: (first, last) ray ranges, empty if the sensor is not due
+        """
+        if self.nextSample is not None and simTime < self.nextSample:
+            return []
+        if self.nextSample is None or self.nextSample + self.interval <= simTime:
+            #First sample, or the sensor fell behind
+            self.nextSample = simTime
+        self.nextSample += self.interval
+        return [(0, self.numRays)]
+
+    def update(self, stamp, pose):
+        """
+        Called after the rays returned by getSectors were cast, the results
+        are in ranges. Subclasses publish them, the base class ignores them.
+
+        Args:
+            stamp (float): simulation time of the sample
+            pose (tuple): (x, y, angle) the rays were cast from
+        """
+
+class RangeSensor(Sensor):
+    """
+    Sensor reporting the closest hit of its rays, e.g. an ultrasonic parking
+    sensor. Readers get the latest Reading without locking.
+    """
+    def __init__(self, vehicle, data=None):
+        super().__init__(vehicle, data)
+        self.latest = None
+        self.sequence = 0
+
+    def getLatest(self):
+        """
+        Returns:
+            Reading: the last sample, None before the first one
+        """
+        return self.latest
+
+    def update(self, stamp, pose):
+        self.requested = False
+        self.sequence += 1
+        self.latest = Reading(self.sequence, stamp, self.measure(min(self.ranges)))
+
+    def measure(self, distance):
+        return distance
+
+#A sample of a RangeSensor, the value depends on the sensor type
+Reading = collections.namedtuple("Reading", ["sequence", "stamp", "value"])
+
+class Ultrasonic(RangeSensor):
+    """
+    Parking sensor with a wide beam, the value is the distance to the
+    closest object in simulation units, inf without one in range
+    """
+    DEFAULTS = dict(Sensor.DEFAULTS, name="ultrasonic", fov=30.0, resolution=7.5,
+                    range=250.0, rate=20.0)
+
+class Bumper(RangeSensor):
+    """
+    Proximity switch covering a bumper, the value is True while an object is
+    within range
+    """
+    DEFAULTS = dict(Sensor.DEFAULTS, name="bumper", fov=180.0, resolution=15.0,
+                    range=20.0, rate=60.0)
+
+    def measure(self, distance):
+        return not math.isinf(distance)
+
+class Lidar(Sensor):
+    """
+    Scanning lidar, completed scans are published to its ScanBuffer and
+    outputs.
+
+    In full mode every ray is cast at once, 'rate' times per second. In
+    rotating mode the sensor spins 'rate' times per second and after every
+    physics tick only the sector swept since the previous tick is cast, like
+    a real spinning sensor. A scan is published after every revolution.
+    """
+    DEFAULTS = dict(Sensor.DEFAULTS, name="lidar", fov=360.0, resolution=1.0,
+                    range=1000.0, rate=60.0,
+                    #full: all rays at once, rotating: spread over the ticks
+                    mode="full")
+
+    def __init__(self, vehicle, data=None, rosBridge=None):
+        """
+        Args:
+            vehicle (SceneObject): the object carrying the sensor
+            data (dict): configuration, see DEFAULTS
+            rosBridge (RosBridge): optional receiver of the scans
+        """
+        super().__init__(vehicle, data)
+        self.rotating = self.config["mode"] == "rotating"
+
+        #Rotating mode state
+        self.lastTime = None
+        self.revolutionStart = 0.0
+        self.cursor = 0
+        self.sweep = 0.0
+        self.sectorRays = 0
+
+        #Receivers of the scans in meters, e.g. RosBridge or LocalTransport
+        self.outputs = ()
+        self.buffer = ScanBuffer()
+        if rosBridge:
+            self.addOutput(rosBridge)
+
+    def getScanBuffer(self):
+        return self.buffer
+
+    def addOutput(self, output):
+        """
+        Args:
+            output: object with publishLidar(ranges, lidar, stamp, scanTime)
+                and wantsLidar(lidar), the lidar is sampled while the latter
+                is true
+        """
+        self.outputs = self.outputs + (output,)
+        self.addConsumer(output, lambda: output.wantsLidar(self))
+
+    def scan(self, x, y, angle, objects, ignoreObjects=[], first=0, last=None):
+        """
+        Cast the rays first to last - 1 from (x, y) against the objects,
+        without a RayCaster.
+
+        Returns:
+            array: self.ranges, overwritten by the next scan
+        """
+        edges = collectEdges(x, y, self.maxRange, objects, ignoreObjects)
+        castRays(edges, angle, self, first, self.numRays if last is None else last)
+        return self.ranges
+
+    def getSectors(self, simTime):
+        if not self.rotating:
+            return super().getSectors(simTime)
+
+        if self.lastTime is None:
+            self.lastTime = simTime
+            self.revolutionStart = simTime
+            return []
+        #A sensor falling behind skips rays instead of catching up
+        self.sweep = min(self.sweep + (simTime - self.lastTime) * self.numRays / self.interval,
+                         float(self.numRays))
+        self.lastTime = simTime
+        #A tick ends at the end of a revolution at the latest, so it can be
+        #published before its first rays are overwritten
+        count = min(int(self.sweep), self.numRays - self.cursor)
+        self.sweep -= count
+        self.sectorRays = count
+        if count == 0:
+            return []
+        return [(self.cursor, self.cursor + count)]
+
+    def idle(self):
+        #A revolution starts over when the lidar is wanted again
+        self.lastTime = None
+        self.cursor = 0
+        self.sweep = 0.0
+
+    def update(self, stamp, pose):
+        if self.rotating:
+            self.cursor += self.sectorRays
+            if self.cursor < self.numRays:
+                return
+            self.cursor = 0
+            stamp, self.revolutionStart = self.revolutionStart, stamp
+        self.publish(stamp, *pose)
+
+    def publish(self, stamp, x, y, angle):
+        self.requested = False
+        self.buffer.publish(stamp, x, y, angle + self.angleMin,
+                            self.rayAngleIncrement, self.ranges)
+
+        #Published synchronously, rosRanges is free again afterwards
+        for output in self.outputs:
+            output.publishLidar(self.rosRanges,
+                                self,
+                                stamp,
+                                self.interval)
+
+#Sensor classes by the type key of the model data
+SENSOR_TYPES = {
+    "lidar": Lidar,
+    "ultrasonic": Ultrasonic,
+    "bumper": Bumper,
+}
+
+def createSensors(vehicle):
+    """
+    Create the sensors of a vehicle model: the entries of its sensors list,
+    each with a type key, and its lidar section. Names are made unique per
+    vehicle, they name the topics and frames of the sensors: a second
+    unnamed lidar becomes lidar_1.
+
+    Returns:
+        list: the sensors
+    """
+    entries = list(getattr(vehicle, "sensorData", None) or [])
+    lidarData = getattr(vehicle, "lidarData", None)
+    if lidarData is not None:
+        entries.append(dict(lidarData, type="lidar"))
+
+    sensors = []
+    names = set()
+    for entry in entries:
+        sensorClass = SENSOR_TYPES.get(entry.get("type"))
+        if sensorClass is None:
+            SENSORS.error("Unknown sensor type {type}", type=entry.get("type"))
+            continue
+        data = {key: value for key, value in entry.items() if key != "type"}
+        name = data.get("name", sensorClass.DEFAULTS["name"])
+        unique = name
+        suffix = 0
+        while unique in names:
+            suffix += 1
+            unique = f"{name}_{suffix}"
+        if unique != name and "name" in data:
+            SENSORS.warning("Sensor name {name} is used twice, renamed to {unique}",
+                            name=name, unique=unique)
+        names.add(unique)
+        data["name"] = unique
+        sensors.append(sensorClass(vehicle, data))
+    return sensors
+
+class SensorManager:
+    """
+    Samples every sensor from a single thread. After each physics tick the
+    due rays of all wanted sensors are cast by one RayCaster pass and the
+    results handed back to the sensors.
+    """
+    def __init__(self, simEngine):
+        self.simEngine = simEngine
+        self.caster = RayCaster(simEngine)
+        #Replaced as a whole when changed, the thread iterates it unlocked
+        self.sensors = ()
 
         self.thread = None
-        self.interval = interval
         self.running = False
 
-    def scan(self, x, y, angle, objects, ignoreObjects=[]):
-        scanData = [0] * int(self.numRays / self.rayAngleIncrement)
-        for i in range(self.numRays):
-            rayAngleRad = math.radians(angle + i * self.rayAngleIncrement)
-
-            #Ray Direction
-            #1000 is the maximum length of the lidar
-            dirX = math.cos(rayAngleRad) * 1000
-            dirY = math.sin(rayAngleRad) * 1000
-
-            closestDist = float('inf')
-            #closestObject = None
-
-            for obj in objects:
-                if obj in ignoreObjects:
-                    continue
-
-                dist = calculateIntersection(x, y, dirX, dirY, obj)
-                if dist is None:
-                    dist = float('inf')
-                if dist < closestDist:
-                    closestDist = dist
-                    #closestObject = obj
-            scanData[int(i/self.rayAngleIncrement)] = closestDist
-            #scanData[i/self.rayAngleIncrement] = (closestDist, closestObject)
-        return scanData
+    def addSensor(self, sensor):
+        self.sensors = self.sensors + (sensor,)
+
+    def addSensors(self, sensors):
+        self.sensors = self.sensors + tuple(sensors)
+
+    def getSensors(self, vehicle=None):
+        return [sensor for sensor in self.sensors
+                if vehicle is None or sensor.vehicle is vehicle]
+
+    def sample(self, simTime):
+        """
+        Cast the due rays of all sensors with demand and update them
+        """
+        requests = []
+        for sensor in self.sensors:
+            if not sensor.isDemanded():
+                sensor.idle()
+                continue
+            sectors = sensor.getSectors(simTime)
+            if sectors:
+                requests.append((sensor, sensor.getSensorPose(), sectors))
+        if not requests:
+            return
+
+        self.caster.cast(requests)
+        for sensor, pose, _ in requests:
+            sensor.update(simTime, pose)
 
     def run(self):
+        nextTime = self.simEngine.simTime
         while self.running:
-            scanData = self.scan(self.vehicle.pos.x,
-                                   self.vehicle.pos.y,
-                                   self.vehicle.getAngle(),
-                                   self.simEngine.getAllObjects(),
-                                   [self.vehicle])
-
-            if self.rosNode:
-                scaledData = [x / 100 for x in scanData]
-                self.rosNode.node.publishLidar(scaledData,
-                                               self,
-                                               self.vehicle.getAngle(),
-                                               self.interval)
-            time.sleep(self.interval)
+            if not self.simEngine.waitUntil(nextTime, timeout=0.1):
+                continue
+            simTime = self.simEngine.simTime
+            self.sample(simTime)
+            #Half a tick ahead, immune to rounding of the sim time
+            nextTime = simTime + self.simEngine.interval / 2
 
     def stop(self):
         self.running = False
@@ -3,27 +3,113 @@ Module running all the physics of the simulation
 """
 import threading
 import time
+import itertools
 
 from Utils import Vector2D
+from Commands import CommandQueue
+from SceneObjects import Pose
+from OccupancyGrid import OccupancyGrid
+from SpatialIndex import (SpatialIndex, boundsIntersect, boundsCorners,
+                          pointInPolygon, polygonsIntersect)
+
+def interpolatePose(a, b, alpha):
+    """
+    Pose between a (alpha 0) and b (alpha 1), angles take the shortest arc
+    """
+    dAngle = (b.angle - a.angle + 180.0) % 360.0 - 180.0
+    return Pose(a.x + (b.x - a.x) * alpha,
+                a.y + (b.y - a.y) * alpha,
+                a.angle + dAngle * alpha,
+                a.steeringAngle + (b.steeringAngle - a.steeringAngle) * alpha)
 
 class SimEngine:
     """
-    The physics engine
+    The physics engine, ticking at a fixed rate. After every tick the poses
+    of the dynamic objects are published with the wall time they belong to,
+    so renderers can interpolate between the last two states.
     """
-    def __init__(self, interval=1.0/60):
+    def __init__(self, interval=1.0/60, gridResolution=10.0, gridMaxDistance=500.0,
+                 realTimeFactor=1.0):
         self.staticObjects = []
         self.dynamicObjects = []
 
+        #Built on first request, then kept in sync with the static objects
+        self.occupancyGrid = None
+        self.staticIndex = None
+        self.gridResolution = gridResolution
+        self.gridMaxDistance = gridMaxDistance
+        #Incremented on every change of the static objects, for caches
+        #built from them on other threads
+        self.staticVersion = 0
+
         self.thread = None
         self.interval = interval
         self.running = False
+        #Ticks may fall this far behind wall time before they are dropped
+        self.maxLag = 0.25
+        #Simulated seconds per wall second, 0 runs as fast as possible
+        self.realTimeFactor = realTimeFactor
+
+        self.simTime = 0.0
+        self.tickCount = 0
+        #Called with the sim time after every tick, from the physics thread.
+        #Replaced as a whole when changed, like the snapshots
+        self.tickListeners = ()
+        #Vehicle commands from other threads, applied at the start of a tick
+        self.commands = CommandQueue()
+        self.tickCondition = threading.Condition()
+        #(previous, current) states as (wall time, {id(obj): Pose}), replaced
+        #as a whole after every tick so readers never take a lock
+        self.snapshots = (None, None)
 
     def registerStaticObject(self, obj):
         self.staticObjects.append(obj)
+        self.staticVersion += 1
+        if self.occupancyGrid:
+            self.occupancyGrid.addObject(obj)
+        if self.staticIndex is not None:
+            self.staticIndex.insert(obj, obj.getBounds())
 
     def registerDynamicObject(self, obj):
         self.dynamicObjects.append(obj)
 
+    def registerStaticObjects(self, objs):
+        self.staticObjects.extend(objs)
+        self.staticVersion += 1
+        if self.occupancyGrid:
+            self.occupancyGrid.addObjects(objs)
+        if self.staticIndex is not None:
+            for obj in objs:
+                self.staticIndex.insert(obj, obj.getBounds())
+
+    def unregisterStaticObjects(self, objs):
+        """
+        Remove static objects, the index and grid are updated once for all
+        of them
+        """
+        ids = {id(obj) for obj in objs}
+        self.staticObjects = [obj for obj in self.staticObjects if id(obj) not in ids]
+        self.staticVersion += 1
+        if self.occupancyGrid:
+            self.occupancyGrid.removeObjects(objs)
+        if self.staticIndex is not None:
+            for obj in objs:
+                self.staticIndex.remove(obj)
+
+    def moveStaticObjects(self, objs):
+        """
+        Update the index and grid after static objects changed pose or size
+        """
+        self.staticVersion += 1
+        if self.occupancyGrid:
+            self.occupancyGrid.moveObjects(objs)
+        if self.staticIndex is not None:
+            for obj in objs:
+                self.staticIndex.update(obj, obj.getBounds())
+
+    def registerDynamicObjects(self, objs):
+        self.dynamicObjects.extend(objs)
+
     def tickEngine(self, dt):
         """
         Main tick that updates all objects in the scenario
@@ -47,16 +133,134 @@ class SimEngine:
     def getStaticObjects(self):
         return self.staticObjects
 
+    def getStaticIndex(self):
+        """
+        Spatial index over the bounding boxes of the static objects, built on
+        first use
+        """
+        if self.staticIndex is None:
+            self.staticIndex = SpatialIndex()
+            for obj in self.staticObjects:
+                self.staticIndex.insert(obj, obj.getBounds())
+        return self.staticIndex
+
+    def pickStatic(self, x, y):
+        """
+        Static objects whose rectangle contains the point
+        """
+        return [obj for obj in self.getStaticIndex().queryPoint(x, y)
+                if pointInPolygon(x, y, obj.getCorners())]
+
+    def queryStatic(self, rect):
+        """
+        Static objects whose rectangle intersects rect (minX, minY, maxX, maxY)
+        """
+        corners = boundsCorners(rect)
+        return [obj for obj in self.getStaticIndex().query(rect)
+                if polygonsIntersect(obj.getCorners(), corners)]
+
+    def getOccupancyGrid(self):
+        """
+        Occupancy grid and distance map of the static objects, computed once
+        and updated incrementally on edits.
+        """
+        if self.occupancyGrid is None:
+            self.occupancyGrid = OccupancyGrid.fromObjects(self.staticObjects,
+                                                           self.gridResolution,
+                                                           self.gridMaxDistance)
+        return self.occupancyGrid
+
     def getDynamicObjects(self):
         return self.dynamicObjects
 
     def getAllObjects(self):
         return self.staticObjects + self.dynamicObjects
 
+    def getSnapshots(self):
+        return self.snapshots
+
+    def ticksPerPeriod(self, rate):
+        """
+        Ticks between two events happening rate times per simulated second,
+        at least one.
+
+        Args:
+            rate (float): events per second, None for every tick
+        """
+        if not rate:
+            return 1
+        return max(1, round(1.0 / (self.interval * rate)))
+
+    def addTickListener(self, callback):
+        """
+        Args:
+            callback (callable): callback(simTime) run after every tick on
+                the physics thread, it has to return quickly
+        """
+        self.tickListeners = self.tickListeners + (callback,)
+
+    def removeTickListener(self, callback):
+        self.tickListeners = tuple(listener for listener in self.tickListeners
+                                   if listener != callback)
+
+    def waitUntil(self, simTime, timeout=None):
+        """
+        Block until the simulation clock reaches simTime.
+
+        Args:
+            simTime (float): simulation time in seconds
+            timeout (float): maximum wall time to wait in seconds
+
+        Returns:
+            bool: False if the timeout expired first
+        """
+        with self.tickCondition:
+            return self.tickCondition.wait_for(lambda: self.simTime >= simTime, timeout)
+
+    def takeSnapshot(self, stamp):
+        poses = {id(obj): obj.getPose() for obj in self.dynamicObjects}
+        self.snapshots = (self.snapshots[1], (stamp, poses))
+
+    def step(self, stamp=None):
+        """
+        Advance the simulation by one fixed interval and publish the state.
+
+        Args:
+            stamp (float): wall time (time.perf_counter) the state belongs to
+        """
+        self.commands.drain()
+        self.tickEngine(self.interval)
+        self.simTime += self.interval
+        self.tickCount += 1
+        self.takeSnapshot(time.perf_counter() if stamp is None else stamp)
+
+        with self.tickCondition:
+            self.tickCondition.notify_all()
+        for listener in self.tickListeners:
+            listener(self.simTime)
+
     def run(self):
+        """
+        Fixed timestep loop. Each tick is computed one interval ahead and
+        stamped with the deadline it sleeps until, rendering at wall time t
+        then always finds two states around t. A tick takes
+        interval / realTimeFactor of wall time.
+        """
+        nextTick = time.perf_counter()
+        self.takeSnapshot(nextTick)
         while self.running:
-            self.tickEngine(self.interval)
-            time.sleep(self.interval)
+            if self.realTimeFactor > 0:
+                nextTick += self.interval / self.realTimeFactor
+            else:
+                nextTick = time.perf_counter()
+            self.step(nextTick)
+
+            delay = nextTick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            elif -delay > self.maxLag:
+                #Can not keep up, continue from now instead of bursting
+                nextTick = time.perf_counter()
 
     def stop(self):
         self.running = False
@@ -74,14 +278,284 @@ class RenderEngine:
     Render Engine that contains all the drawable objects
     """
     def __init__(self):
-        self.objects = []
+        self.staticObjects = []
+        self.dynamicObjects = []
 
-    def registerObject(self, obj):
-        self.objects.append(obj)
+        #Static renderers never move, they are indexed once for culling. The
+        #detail index holds the ones the batch only draws when zoomed out
+        self.staticIndex = SpatialIndex()
+        self.detailIndex = SpatialIndex()
+        self.order = {}
+        self.nextOrder = 0
+        #Static renderer of every static object and its bounds when added
+        self.renders = {}
+        self.staticBounds = {}
 
-    def draw(self, painter):
+        #Optional cache of pre-rendered static objects (e.g. StaticTileCache)
+        self.staticLayer = None
+        #Optional batch drawing the static objects it accepts (e.g. RectangleBatch)
+        self.staticBatch = None
+
+        #Objects drawn and skipped by culling during the last frame. Static
+        #objects blitted from the staticLayer are not counted, staticCounted
+        #tells whether they were
+        self.drawnCount = 0
+        self.culledCount = 0
+        self.staticCounted = True
+
+        #Render state and bounds of the dynamic objects at the last repaint
+        self.lastStates = {}
+        self.pendingDirty = []
+
+        #Area covered by the static objects, None while there are none
+        self.sceneBounds = None
+
+        #Drawn on top of everything, e.g. sensor data
+        self.overlays = []
+
+    def updatePoses(self, snapshots, now):
         """
-        Method that will draw all the object on the canvas
+        Set the pose every dynamic renderer draws: its parent's state
+        interpolated between the two physics snapshots at the given time.
+        Without snapshots (physics not running) renderers draw the live state.
+
+        Args:
+            snapshots (tuple): (previous, current) see SimEngine.getSnapshots
+            now (float): display time, time.perf_counter
         """
-        for obj in self.objects:
-            obj.drawMain(painter)
+        previous, current = snapshots
+        if current is None:
+            for obj in self.dynamicObjects:
+                obj.pose = None
+            return
+
+        alpha = 1.0
+        if previous is not None and current[0] > previous[0]:
+            alpha = min(1.0, max(0.0, (now - previous[0]) / (current[0] - previous[0])))
+
+        for obj in self.dynamicObjects:
+            key = id(obj.parent)
+            end = current[1].get(key)
+            if end is None:
+                obj.pose = None
+                continue
+            start = previous[1].get(key, end) if previous else end
+            obj.pose = interpolatePose(start, end, alpha)
+
+    def registerObject(self, obj, static=False):
+        self.registerObjects([obj], static)
+
+    def registerObjects(self, objs, static=False):
+        if static:
+            for obj in objs:
+                self.staticObjects.append(obj)
+                self.addStatic(obj)
+                self.invalidateStatic(self.staticBounds[id(obj)])
+        else:
+            self.dynamicObjects.extend(objs)
+
+    def unregisterObjects(self, objs, static=False):
+        """
+        Stop drawing the renderers, their areas are repainted
+        """
+        ids = {id(obj) for obj in objs}
+        if static:
+            self.staticObjects = [obj for obj in self.staticObjects if id(obj) not in ids]
+            for obj in objs:
+                self.invalidateStatic(self.removeStatic(obj))
+        else:
+            self.dynamicObjects = [obj for obj in self.dynamicObjects if id(obj) not in ids]
+            for obj in objs:
+                last = self.lastStates.pop(id(obj), None)
+                if last is not None:
+                    self.pendingDirty.append(last[1])
+
+    def moveStaticObjects(self, objs):
+        """
+        Update the batch, indexes and cached tiles after the parents of
+        static renderers changed pose or size
+        """
+        for obj in objs:
+            bounds = self.removeStatic(obj)
+            self.addStatic(obj)
+            self.invalidateStatic(bounds)
+            self.invalidateStatic(self.staticBounds[id(obj)])
+
+    def invalidateStatic(self, bounds):
+        if self.staticLayer:
+            self.staticLayer.invalidate(bounds)
+        self.pendingDirty.append(bounds)
+
+    def getRender(self, parent):
+        """
+        The static renderer of a scene object, None if it has none
+        """
+        return self.renders.get(id(parent))
+
+    def registerOverlay(self, overlay):
+        self.overlays.append(overlay)
+
+    def unregisterOverlay(self, overlay):
+        """
+        Stop drawing the overlay, its area is repainted
+        """
+        self.overlays.remove(overlay)
+        last = self.lastStates.pop(id(overlay), None)
+        if last is not None:
+            self.pendingDirty.append(last[1])
+
+    def addStatic(self, obj):
+        """
+        Hand the static renderer to the batch, or index it for drawing it on
+        its own
+        """
+        bounds = obj.getBounds()
+        self.renders[id(obj.parent)] = obj
+        self.staticBounds[id(obj)] = bounds
+        if self.sceneBounds is None:
+            self.sceneBounds = bounds
+        else:
+            self.sceneBounds = (min(self.sceneBounds[0], bounds[0]),
+                                min(self.sceneBounds[1], bounds[1]),
+                                max(self.sceneBounds[2], bounds[2]),
+                                max(self.sceneBounds[3], bounds[3]))
+
+        index = self.staticIndex
+        if self.staticBatch is not None and self.staticBatch.add(obj):
+            if not self.staticBatch.isDetailed(obj):
+                return
+            index = self.detailIndex
+        self.order[id(obj)] = self.nextOrder
+        self.nextOrder += 1
+        index.insert(obj, bounds)
+
+    def removeStatic(self, obj):
+        """
+        Inverse of addStatic
+
+        Returns:
+            tuple: the bounds the renderer had when added
+        """
+        if self.staticBatch is not None:
+            self.staticBatch.remove(obj)
+        self.staticIndex.remove(obj)
+        self.detailIndex.remove(obj)
+        self.order.pop(id(obj), None)
+        self.renders.pop(id(obj.parent), None)
+        return self.staticBounds.pop(id(obj))
+
+    def getObjects(self):
+        return self.staticObjects + self.dynamicObjects
+
+    def setStaticLayer(self, staticLayer):
+        """
+        Use a cache for drawing the static objects, None draws them directly
+        """
+        self.staticLayer = staticLayer
+
+    def setStaticBatch(self, staticBatch):
+        """
+        Draw the static objects accepted by the batch together
+        """
+        self.staticBatch = staticBatch
+        self.staticIndex = SpatialIndex()
+        self.detailIndex = SpatialIndex()
+        self.order = {}
+        self.renders = {}
+        self.staticBounds = {}
+        for obj in self.staticObjects:
+            self.addStatic(obj)
+        if self.staticLayer:
+            self.staticLayer.clear()
+
+    def collectDirtyRects(self):
+        """
+        Areas that changed since the last call: the old and new bounds of
+        every dynamic object and overlay whose render state changed and the
+        bounds of newly registered static objects.
+
+        Returns:
+            list: (minX, minY, maxX, maxY) rectangles, empty when idle
+        """
+        rects = self.pendingDirty
+        self.pendingDirty = []
+
+        lastStates = self.lastStates
+        for obj in itertools.chain(self.dynamicObjects, self.overlays):
+            state = obj.getRenderState()
+            last = lastStates.get(id(obj))
+            if last is not None and last[0] == state:
+                continue
+
+            bounds = obj.getBounds()
+            if last is not None:
+                rects.append(last[1])
+            rects.append(bounds)
+            lastStates[id(obj)] = (state, bounds)
+
+        return rects
+
+    def drawStatic(self, painter, rect, scale=1.0):
+        """
+        Draw the static objects intersecting the rectangle. The batched
+        plain rectangles are drawn first, below the other static objects
+        whatever their registration order.
+
+        Returns:
+            tuple: (drawn, culled) number of objects
+        """
+        drawn = 0
+        culled = 0
+        visible = self.staticIndex.query(rect)
+        indexed = len(self.staticIndex)
+        if self.staticBatch is not None:
+            drawn, culled = self.staticBatch.draw(painter, rect, scale)
+            if not self.staticBatch.simplifies(scale):
+                visible += self.detailIndex.query(rect)
+                indexed += len(self.detailIndex)
+
+        visible.sort(key=lambda obj: self.order[id(obj)])
+        for obj in visible:
+            obj.drawMain(painter, scale)
+
+        return drawn + len(visible), culled + indexed - len(visible)
+
+    def draw(self, painter, rect=None, scale=1.0):
+        """
+        Method that will draw all the object on the canvas. Objects outside
+        of the rectangle are culled.
+
+        Args:
+            painter (QPainter): the painter to draw with
+            rect (tuple): (minX, minY, maxX, maxY) area that has to be drawn,
+                None draws everything
+            scale (float): screen pixels per world unit
+        """
+        drawn = 0
+        culled = 0
+        staticCounted = True
+
+        if rect is None:
+            for obj in self.staticObjects:
+                obj.drawMain(painter, scale)
+            drawn += len(self.staticObjects)
+        elif self.staticLayer:
+            self.staticLayer.draw(painter, rect, scale)
+            staticCounted = False
+        else:
+            drawn, culled = self.drawStatic(painter, rect, scale)
+
+        for obj in self.dynamicObjects:
+            if rect is None or boundsIntersect(obj.getBounds(), rect):
+                obj.drawMain(painter, scale)
+                drawn += 1
+            else:
+                culled += 1
+
+        for overlay in self.overlays:
+            if rect is None or boundsIntersect(overlay.getBounds(), rect):
+                overlay.drawMain(painter, scale)
+
+        self.drawnCount = drawn
+        self.culledCount = culled
+        self.staticCounted = staticCounted
@@ -0,0 +1,123 @@
+"""
+Uniform grid spatial index over axis aligned bounding boxes. Used to find the
+objects inside a region (viewport culling, picking, sensor candidates)
+without walking every object of the scene.
+"""
+import math
+
+def boundsIntersect(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+def boundsCorners(bounds):
+    minX, minY, maxX, maxY = bounds
+    return [(minX, minY), (maxX, minY), (maxX, maxY), (minX, maxY)]
+
+def pointInPolygon(x, y, corners):
+    """
+    True if the point lies inside (or on) the convex polygon
+    """
+    sign = 0
+    count = len(corners)
+    for i in range(count):
+        ax, ay = corners[i]
+        bx, by = corners[(i + 1) % count]
+        cross = (bx - ax) * (y - ay) - (by - ay) * (x - ax)
+        if cross == 0:
+            continue
+        if sign == 0:
+            sign = 1 if cross > 0 else -1
+        elif (cross > 0) != (sign > 0):
+            return False
+    return True
+
+def polygonsIntersect(a, b):
+    """
+    Separating axis test of two convex polygons given by their corners
+    """
+    for corners in (a, b):
+        count = len(corners)
+        for i in range(count):
+            ax, ay = corners[i]
+            bx, by = corners[(i + 1) % count]
+            axisX, axisY = ay - by, bx - ax
+            projA = [x * axisX + y * axisY for x, y in a]
+            projB = [x * axisX + y * axisY for x, y in b]
+            if max(projA) < min(projB) or max(projB) < min(projA):
+                return False
+    return True
+
+class SpatialIndex:
+    """
+    Items are stored in every grid cell their bounds overlap. The cell size
+    should be in the order of the typical object (or query) size.
+    """
+    def __init__(self, cellSize=256.0):
+        self.cellSize = float(cellSize)
+        self.cells = {}
+        #id(item) -> (item, bounds, cell keys)
+        self.entries = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, item):
+        return id(item) in self.entries
+
+    def cellKeys(self, bounds):
+        size = self.cellSize
+        cx0 = int(math.floor(bounds[0] / size))
+        cy0 = int(math.floor(bounds[1] / size))
+        cx1 = int(math.floor(bounds[2] / size))
+        cy1 = int(math.floor(bounds[3] / size))
+        return [(cx, cy) for cx in range(cx0, cx1 + 1) for cy in range(cy0, cy1 + 1)]
+
+    def insert(self, item, bounds):
+        """
+        Add an item with its bounds (minX, minY, maxX, maxY)
+        """
+        if id(item) in self.entries:
+            self.remove(item)
+        keys = self.cellKeys(bounds)
+        for key in keys:
+            self.cells.setdefault(key, {})[id(item)] = item
+        self.entries[id(item)] = (item, bounds, keys)
+
+    def remove(self, item):
+        entry = self.entries.pop(id(item), None)
+        if entry is None:
+            return
+        for key in entry[2]:
+            cell = self.cells.get(key)
+            if cell is None:
+                continue
+            cell.pop(id(item), None)
+            if not cell:
+                del self.cells[key]
+
+    def update(self, item, bounds):
+        self.insert(item, bounds)
+
+    def getBounds(self, item):
+        return self.entries[id(item)][1]
+
+    def query(self, rect):
+        """
+        Items whose bounds intersect the rectangle (minX, minY, maxX, maxY)
+        """
+        result = []
+        seen = set()
+        entries = self.entries
+        for key in self.cellKeys(rect):
+            cell = self.cells.get(key)
+            if not cell:
+                continue
+            for itemId, item in cell.items():
+                if itemId in seen:
+                    continue
+                seen.add(itemId)
+                if boundsIntersect(entries[itemId][1], rect):
+                    result.append(item)
+        return result
+
+    def queryPoint(self, x, y):
+        return self.query((x, y, x, y))
@@ -4,9 +4,12 @@ Module containing a more complex scene object and thus seperated from the rest
 
 import math
 
-from SceneObjects import SceneObject
+from SceneObjects import SceneObject, Pose
 from InertialModels import InertialModel1D
 from Utils import Vector2D
+from Diagnostics import getChannel
+
+PHYSICS = getChannel("physics")
 
 class Vehicle(SceneObject):
     """
@@ -18,7 +21,7 @@ class Vehicle(SceneObject):
         self.inModel = InertialModel1D(mass=data["mass"],
                                        friction=data["friction"])
 
-        print(data)
+        PHYSICS.debug("Vehicle model {data}", data=data)
         self.width = data['width']
         self.length = data['length']
 
@@ -43,6 +46,10 @@ class Vehicle(SceneObject):
         #self.boundOffset = [self.wheelBase/2, 0]
         self.boundOffset = Vector2D(self.wheelBase/2, 0)
 
+        #Sensors of the model, see Sensors.createSensors
+        self.lidarData = data.get("lidar")
+        self.sensorData = data.get("sensors")
+
     def setSteering(self, steering):
         steering = min(steering, 1)
         steering = max(steering, -1)
@@ -52,6 +59,9 @@ class Vehicle(SceneObject):
     def getSteering(self):
         return self.steeringAngle / self.maxSteeringAngle
 
+    def getPose(self):
+        return Pose(self.pos.x, self.pos.y, self.angle, self.steeringAngle)
+
     def tick(self, dt):
         """
         Updates the state of vehicle (step) given a certain time difference.
@@ -67,7 +77,8 @@ class Vehicle(SceneObject):
             #no steering
             radSteering = math.radians(self.steeringAngle)
             icrY = self.wheelBase / math.tan(radSteering)
-            print("icrY", icrY)
+            if PHYSICS.debugOn:
+                PHYSICS.debug("icrY {icrY}", icrY=icrY)
 
             # Arc length formula
             deltaTheta = (self.inModel.getSpeed() * 100 * dt) / icrY
@@ -84,7 +95,8 @@ class Vehicle(SceneObject):
             rads = math.radians(math.pi /2 - self.angle)
             pIcrX = 0 * math.cos(rads) - icrY * math.sin(rads)
             pIcrY = 0 * math.sin(rads) + icrY * math.cos(rads)
-            print(f"ICR: {pIcrX}, {pIcrY}")
+            if PHYSICS.debugOn:
+                PHYSICS.debug("ICR: {x}, {y}", x=pIcrX, y=pIcrY)
 
         else:
             rx = self.inModel.getSpeed() * 100 * dt
@@ -98,5 +110,31 @@ class Vehicle(SceneObject):
     def getSpeed(self):
         return self.inModel.getSpeed()
 
+    def getYawRate(self):
+        """
+        Returns:
+            float: turning rate in radians per second, positive to the left
+        """
+        radSteering = math.radians(self.steeringAngle)
+        if radSteering == 0:
+            return 0.0
+        return self.inModel.getSpeed() * 100 * math.tan(radSteering) / self.wheelBase
+
+    def getIcr(self):
+        """
+        Instantaneous center of rotation in world coordinates.
+
+        Returns:
+            tuple: (x, y), None while driving straight
+        """
+        radSteering = math.radians(self.steeringAngle)
+        if radSteering == 0:
+            return None
+        icrY = self.wheelBase / math.tan(radSteering)
+
+        rads = math.radians(self.angle)
+        return (self.pos.x - icrY * math.sin(rads),
+                self.pos.y + icrY * math.cos(rads))
+
     def setThrottle(self, throttle):
         self.throttle = throttle
@@ -1,8 +1,156 @@
 """
 Module containing the different types of renderers for scene objects
 """
-from PyQt5.QtGui import QColor, QImage
-from PyQt5.QtCore import Qt
+import math
+from collections import OrderedDict
+
+from PyQt5.QtGui import (QColor, QImage, QPixmap, QTransform, QPainterPath,
+                         QPolygonF, QPen)
+from PyQt5.QtCore import Qt, QPoint, QPointF, QRectF
+
+#Level of detail: below DETAIL_SCALE (screen pixels per world unit) objects
+#are drawn as a plain polygon without image, wheels and axles, objects
+#smaller than DOT_PIXELS on screen become a dot and static rectangles
+#smaller than MERGE_PIXELS are merged into blocks
+DETAIL_SCALE = 0.5
+DOT_PIXELS = 4.0
+MERGE_PIXELS = 2.0
+
+#Fill of the simplified drawing of objects that only have an image
+LOD_COLOR = QColor(128, 128, 128)
+
+def drawSimplified(painter, parent, pose, color, scale):
+    """
+    Low detail drawing of an object: its body polygon, or a dot when it
+    would only be a few pixels large.
+    """
+    corners = parent.getCornersAt(pose.x, pose.y, pose.angle)
+
+    painter.save()
+    painter.setPen(Qt.NoPen)
+    painter.setBrush(color)
+    if max(parent.width, parent.length) * scale < DOT_PIXELS:
+        size = DOT_PIXELS / scale
+        centerX = sum(corner[0] for corner in corners) / 4
+        centerY = sum(corner[1] for corner in corners) / 4
+        painter.drawRect(QRectF(centerX - size / 2, centerY - size / 2, size, size))
+    else:
+        painter.drawPolygon(QPolygonF([QPointF(x, y) for x, y in corners]))
+    painter.restore()
+
+class SpriteCache:
+    """
+    Cache of vehicle images pre-rotated at quantized angles. Drawing a sprite
+    is a plain blit instead of resampling the image through a rotated painter
+    every frame. Sprites are created lazily and evicted least recently used
+    first.
+    """
+    def __init__(self, angleStep=1.0, maxEntries=1024, smooth=True, usePixmaps=True):
+        """
+        Args:
+            angleStep (float): rotation quantization in degrees
+            maxEntries (int): maximum number of cached sprites
+            smooth (bool): bilinear filtering when rotating
+            usePixmaps (bool): store QPixmaps, QImages can be painted outside
+                of the GUI thread
+        """
+        self.angleStep = angleStep
+        self.maxEntries = maxEntries
+        self.smooth = smooth
+        self.usePixmaps = usePixmaps
+
+        self.images = {}
+        self.sprites = OrderedDict()
+
+    def getImage(self, path, width, height):
+        """
+        The image scaled to the size, loaded once and shared by all renderers
+        """
+        key = (path, width, height)
+        image = self.images.get(key)
+        if image is None:
+            image = QImage(path).scaled(width, height)
+            self.images[key] = image
+        return image
+
+    def quantize(self, angle):
+        """
+        Angle of the sprite drawn for an object at angle, at most half a step
+        off also when the step does not divide 360
+        """
+        return (round(angle / self.angleStep) * self.angleStep) % 360
+
+    def getSprite(self, path, width, height, angle):
+        """
+        Returns:
+            tuple: (sprite, half width, half height) the sprite is centered on
+                the image center
+        """
+        spriteAngle = self.quantize(angle)
+        key = (path, width, height, spriteAngle)
+        sprite = self.sprites.get(key)
+        if sprite is not None:
+            self.sprites.move_to_end(key)
+            return sprite
+
+        mode = Qt.SmoothTransformation if self.smooth else Qt.FastTransformation
+        rotated = self.getImage(path, width, height).transformed(
+            QTransform().rotate(spriteAngle), mode)
+        if self.usePixmaps:
+            rotated = QPixmap.fromImage(rotated)
+        sprite = (rotated, rotated.width() / 2, rotated.height() / 2)
+
+        self.sprites[key] = sprite
+        while len(self.sprites) > self.maxEntries:
+            self.sprites.popitem(last=False)
+        return sprite
+
+    def getMargin(self, length):
+        """
+        How far the quantized sprite of an object may stick out of its exact
+        bounds
+        """
+        return length / 2 * math.radians(self.angleStep / 2) + 1
+
+    def drawSprite(self, painter, path, parent, pose):
+        """
+        Draw the image of the object at the pose, centered like the rotated
+        painter drawing does: wheelBase/2 in front of the position.
+        """
+        rad = math.radians(pose.angle)
+        offset = int(parent.wheelBase / 2)
+        centerX = int(pose.x) + offset * math.cos(rad)
+        centerY = int(pose.y) + offset * math.sin(rad)
+
+        sprite, halfWidth, halfHeight = self.getSprite(path, int(parent.length),
+                                                       int(parent.width), pose.angle)
+        point = QPoint(int(round(centerX - halfWidth)), int(round(centerY - halfHeight)))
+        if self.usePixmaps:
+            painter.drawPixmap(point, sprite)
+        else:
+            painter.drawImage(point, sprite)
+
+SPRITE_CACHE = SpriteCache()
+
+def configureSpriteCache(angleStep=None, maxEntries=None, smooth=None, enabled=True):
+    """
+    Change the quality and memory budget of the shared sprite cache, a
+    disabled cache falls back to drawing through a rotated painter.
+    """
+    # pylint: disable=global-statement
+    global SPRITE_CACHE
+    if not enabled:
+        SPRITE_CACHE = None
+        return
+    if SPRITE_CACHE is None:
+        SPRITE_CACHE = SpriteCache()
+    if angleStep is not None:
+        SPRITE_CACHE.angleStep = angleStep
+    if maxEntries is not None:
+        SPRITE_CACHE.maxEntries = maxEntries
+    if smooth is not None:
+        SPRITE_CACHE.smooth = smooth
+    SPRITE_CACHE.sprites.clear()
 
 class RectangleRender:
     """
@@ -10,16 +158,46 @@ class RectangleRender:
     """
     def __init__(self, parent, data=None):
         self.parent = parent
+        #Pose to draw, None draws the current state of the parent
+        self.pose = None
 
         if 'color' in data:
             self.color = QColor(*data['color'])
+        else:
+            self.color = LOD_COLOR
 
+        self.spriteCache = SPRITE_CACHE
         if data and 'image' in data:
-            self.image = QImage(data["image"]).scaled(int(self.parent.length),
-                                                      int(self.parent.width))
+            self.imagePath = data["image"]
+            self.image = self.loadImage()
         else:
+            self.imagePath = None
             self.image = None
 
+    def loadImage(self):
+        width = int(self.parent.length)
+        height = int(self.parent.width)
+        if self.spriteCache:
+            return self.spriteCache.getImage(self.imagePath, width, height)
+        return QImage(self.imagePath).scaled(width, height)
+
+    def setSpriteCache(self, spriteCache):
+        """
+        Draw through another sprite cache, None rotates the image every frame
+        """
+        self.spriteCache = spriteCache
+        if self.imagePath:
+            self.image = self.loadImage()
+
+    def getPose(self):
+        """
+        The interpolated pose set by the render engine, or the live state of
+        the parent
+        """
+        if self.pose is not None:
+            return self.pose
+        return self.parent.getPose()
+
     def drawRect(self, painter):
         """
         Draw a rectangle representing the object.
@@ -27,13 +205,14 @@ class RectangleRender:
         Args:
             painter (QPainter): the painter to draw with
         """
+        pose = self.getPose()
         painter.save()
 
         painter.setPen(Qt.black)
         painter.setBrush(self.color)
 
-        painter.translate(int(self.parent.pos.x), int(self.parent.pos.y))
-        painter.rotate(self.parent.angle)
+        painter.translate(int(pose.x), int(pose.y))
+        painter.rotate(pose.angle)
 
         # Draw rectangle centered at origin
         painter.drawRect(int(-self.parent.length/2),
@@ -50,11 +229,16 @@ class RectangleRender:
         Args:
             painter (QPainter): the painter to draw with
         """
+        pose = self.getPose()
+        if self.spriteCache:
+            self.spriteCache.drawSprite(painter, self.imagePath, self.parent, pose)
+            return
+
         # Set the color and draw the rectangle
         painter.save()
 
-        painter.translate(int(self.parent.pos.x), int(self.parent.pos.y))
-        painter.rotate(self.parent.angle)
+        painter.translate(int(pose.x), int(pose.y))
+        painter.rotate(pose.angle)
         # Draw rectangle centered at origin
         painter.translate(int(self.parent.wheelBase/2),0)
         painter.drawImage(int(-self.parent.length/2),
@@ -63,22 +247,233 @@ class RectangleRender:
 
         painter.restore()
 
-    def drawMain(self, painter):
-        if self.image:
+    def drawMain(self, painter, scale=1.0):
+        if scale < DETAIL_SCALE:
+            drawSimplified(painter, self.parent, self.getPose(), self.color, scale)
+        elif self.image:
             self.drawImage(painter)
         else:
             self.drawRect(painter)
 
+    def getRenderState(self):
+        """
+        Everything the drawing depends on, a change means a repaint
+        """
+        return (self.getPose(), self.parent.width, self.parent.length)
+
+    def getBounds(self):
+        """
+        Area covered on the canvas, including the outline pen
+        """
+        margin = 1
+        if self.image and self.spriteCache:
+            margin = self.spriteCache.getMargin(self.parent.length)
+        minX, minY, maxX, maxY = self.parent.getBounds(self.pose)
+        return minX - margin, minY - margin, maxX + margin, maxY + margin
+
+class RectangleBatch:
+    """
+    Draws the plain colored static rectangles with one path per color and
+    grid cell, instead of a save/translate/rotate/drawRect/restore sequence
+    per object. The paths are built from the world space corners and only
+    rebuilt when the rectangles of their cell change.
+
+    When zoomed out, rectangles with an image are simplified into the paths
+    as well, and the ones below MERGE_PIXELS are merged into blocks of a power
+    of two size. One set of paths is kept per cell and block size.
+    """
+    def __init__(self, cellSize=512.0):
+        self.cellSize = cellSize
+        #cell -> {rgba: [renders]}
+        self.cells = {}
+        #id(render) -> (cell, rgba)
+        self.locations = {}
+        #Renderers with an image, only batched when zoomed out
+        self.detailed = set()
+        #cell -> {block size: [(color, path, bounds, count)]}, missing when outdated
+        self.paths = {}
+        #How far a rectangle may reach out of the cell of its center
+        self.reach = 0.0
+
+    def __len__(self):
+        return len(self.locations)
+
+    @staticmethod
+    def accepts(render):
+        return isinstance(render, RectangleRender)
+
+    def isDetailed(self, render):
+        """
+        True if the batch only draws the renderer when zoomed out, it has to
+        be drawn on its own at full detail
+        """
+        return id(render) in self.detailed
+
+    @staticmethod
+    def simplifies(scale):
+        return scale < DETAIL_SCALE
+
+    def cellOf(self, bounds):
+        minX, minY, maxX, maxY = bounds
+        return (int(math.floor((minX + maxX) / 2 / self.cellSize)),
+                int(math.floor((minY + maxY) / 2 / self.cellSize)))
+
+    def add(self, render):
+        """
+        Take over drawing the renderer.
+
+        Returns:
+            bool: False if the renderer can not be batched
+        """
+        if not self.accepts(render):
+            return False
+        bounds = render.getBounds()
+        cell = self.cellOf(bounds)
+        minX, minY, maxX, maxY = bounds
+        self.reach = max(self.reach, (maxX - minX) / 2, (maxY - minY) / 2)
+        rgba = render.color.rgba()
+        self.cells.setdefault(cell, {}).setdefault(rgba, []).append(render)
+        self.locations[id(render)] = (cell, rgba)
+        if render.image is not None:
+            self.detailed.add(id(render))
+        self.paths.pop(cell, None)
+        return True
+
+    def remove(self, render):
+        location = self.locations.pop(id(render), None)
+        if location is None:
+            return False
+        cell, rgba = location
+        self.detailed.discard(id(render))
+        self.cells[cell][rgba].remove(render)
+        self.paths.pop(cell, None)
+        return True
+
+    def update(self, render):
+        """
+        Rebuild after the geometry of the renderer changed
+        """
+        if self.remove(render):
+            self.add(render)
+
+    @staticmethod
+    def blockSize(scale):
+        """
+        World size of the blocks tiny rectangles are merged into at the
+        scale, None at full detail
+        """
+        if scale >= DETAIL_SCALE:
+            return None
+        return 2.0 ** math.ceil(math.log2(MERGE_PIXELS / scale))
+
+    def buildCell(self, cell, blockSize=None):
+        paths = []
+        for renders in self.cells.get(cell, {}).values():
+            if blockSize is None:
+                renders = [render for render in renders if render.image is None]
+            if not renders:
+                continue
+            path = QPainterPath()
+            path.setFillRule(Qt.WindingFill)
+            bounds = [render.getBounds() for render in renders]
+            blocks = set()
+            for render, (minX, minY, maxX, maxY) in zip(renders, bounds):
+                if blockSize and max(maxX - minX, maxY - minY) <= blockSize:
+                    blocks.add((math.floor((minX + maxX) / 2 / blockSize),
+                                math.floor((minY + maxY) / 2 / blockSize)))
+                    continue
+                path.addPolygon(QPolygonF([QPointF(x, y)
+                                           for x, y in render.parent.getCorners()]))
+                path.closeSubpath()
+            for bx, by in blocks:
+                path.addRect(QRectF(bx * blockSize, by * blockSize, blockSize, blockSize))
+            paths.append((renders[0].color, path,
+                          (min(b[0] for b in bounds), min(b[1] for b in bounds),
+                           max(b[2] for b in bounds), max(b[3] for b in bounds)),
+                          len(renders)))
+        self.paths.setdefault(cell, {})[blockSize] = paths
+        return paths
+
+    def draw(self, painter, rect=None, scale=1.0):
+        """
+        Draw the paths of the cells whose content intersects the rectangle,
+        with the detail of the scale.
+
+        Returns:
+            tuple: (drawn, culled) number of rectangles
+        """
+        drawn = 0
+
+        cells = self.cells.keys()
+        if rect:
+            size = self.cellSize
+            cx0 = int(math.floor((rect[0] - self.reach) / size))
+            cy0 = int(math.floor((rect[1] - self.reach) / size))
+            cx1 = int(math.floor((rect[2] + self.reach) / size))
+            cy1 = int(math.floor((rect[3] + self.reach) / size))
+            if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) < len(self.cells):
+                cells = [(cx, cy) for cx in range(cx0, cx1 + 1)
+                         for cy in range(cy0, cy1 + 1) if (cx, cy) in self.cells]
+
+        blockSize = self.blockSize(scale)
+        painter.save()
+        #Outlines would be thinner than a pixel when zoomed out
+        painter.setPen(Qt.black if blockSize is None else Qt.NoPen)
+        for cell in cells:
+            paths = self.paths.get(cell, {}).get(blockSize)
+            if paths is None:
+                paths = self.buildCell(cell, blockSize)
+            for color, path, bounds, count in paths:
+                if rect and not (bounds[0] <= rect[2] and rect[0] <= bounds[2] and
+                                 bounds[1] <= rect[3] and rect[1] <= bounds[3]):
+                    continue
+                painter.setBrush(color)
+                painter.drawPath(path)
+                drawn += count
+        painter.restore()
+
+        total = len(self.locations)
+        if blockSize is None:
+            total -= len(self.detailed)
+        return drawn, total - drawn
+
 class SimpleVehicleRender:
     """
     A class representing a vehicle.
     """
     def __init__(self, parent, data=None):
         self.parent = parent
+        #Pose to draw, None draws the current state of the parent
+        self.pose = None
         self.color = QColor(255, 0, 0)
         self.axleWidth = data["axleWidth"]
-        self.image = QImage(data["image"]).scaled(int(self.parent.length),
-                                                  int(self.parent.width))
+        self.spriteCache = SPRITE_CACHE
+        self.imagePath = data["image"]
+        self.image = self.loadImage()
+
+    def loadImage(self):
+        width = int(self.parent.length)
+        height = int(self.parent.width)
+        if self.spriteCache:
+            return self.spriteCache.getImage(self.imagePath, width, height)
+        return QImage(self.imagePath).scaled(width, height)
+
+    def setSpriteCache(self, spriteCache):
+        """
+        Draw through another sprite cache, None rotates the image every frame
+        """
+        self.spriteCache = spriteCache
+        if self.imagePath:
+            self.image = self.loadImage()
+
+    def getPose(self):
+        """
+        The interpolated pose set by the render engine, or the live state of
+        the parent
+        """
+        if self.pose is not None:
+            return self.pose
+        return self.parent.getPose()
 
     def drawSquareVehicle(self, painter):
         """
@@ -87,14 +482,15 @@ class SimpleVehicleRender:
         Args:
             painter (QPainter): the painter to draw with
         """
+        pose = self.getPose()
         # Set the color and draw the rectangle
         painter.save()
 
         painter.setPen(Qt.black)
         painter.setBrush(self.color)
 
-        painter.translate(int(self.parent.pos.x), int(self.parent.pos.y))
-        painter.rotate(self.parent.angle)
+        painter.translate(int(pose.x), int(pose.y))
+        painter.rotate(pose.angle)
         # Draw rectangle centered at origin
         painter.translate(int(self.parent.wheelBase/2),0)
         painter.drawRect(int(-self.parent.length/2),
@@ -111,14 +507,19 @@ class SimpleVehicleRender:
         Args:
             painter (QPainter): the painter to draw with
         """
+        pose = self.getPose()
+        if self.spriteCache:
+            self.spriteCache.drawSprite(painter, self.imagePath, self.parent, pose)
+            return
+
         # Set the color and draw the rectangle
         painter.save()
 
         painter.setPen(Qt.black)
         painter.setBrush(self.color)
 
-        painter.translate(int(self.parent.pos.x), int(self.parent.pos.y))
-        painter.rotate(self.parent.angle)
+        painter.translate(int(pose.x), int(pose.y))
+        painter.rotate(pose.angle)
         # Draw rectangle centered at origin
         painter.translate(int(self.parent.wheelBase/2),0)
         painter.drawImage(int(-self.parent.length/2),
@@ -135,10 +536,30 @@ class SimpleVehicleRender:
         else:
             self.drawSquareVehicle(painter)
 
-    def drawMain(self, painter):
+    def drawMain(self, painter, scale=1.0):
+        if scale < DETAIL_SCALE:
+            drawSimplified(painter, self.parent, self.getPose(), self.color, scale)
+            return
         self.drawVehicle(painter)
         self.drawAxles(painter)
 
+    def getRenderState(self):
+        """
+        Everything the drawing depends on, a change means a repaint
+        """
+        return self.getPose()
+
+    def getBounds(self):
+        """
+        Area covered on the canvas, the steered wheels may stick out of the
+        body so they are added as margin
+        """
+        margin = self.parent.wheelDiameter + 1
+        if self.spriteCache:
+            margin += self.spriteCache.getMargin(self.parent.length)
+        minX, minY, maxX, maxY = self.parent.getBounds(self.pose)
+        return minX - margin, minY - margin, maxX + margin, maxY + margin
+
     def drawAxles(self, painter, color=Qt.black):
         """
         Draws the axles and wheels on the vehicle, this is considered a helper
@@ -148,13 +569,14 @@ class SimpleVehicleRender:
             painter (QPainter): the painter to draw with
             color (QColor): color of the axles
         """
+        pose = self.getPose()
         painter.save()
 
         painter.setPen(Qt.black)
         painter.setBrush(color)
 
-        painter.translate(int(self.parent.pos.x), int(self.parent.pos.y))
-        painter.rotate(self.parent.angle)
+        painter.translate(int(pose.x), int(pose.y))
+        painter.rotate(pose.angle)
         painter.translate(int(self.parent.wheelBase/2),0)
 
         painter.drawRect(int(self.parent.wheelBaseOffset-(self.parent.wheelBase/2)),
@@ -193,9 +615,11 @@ class SimpleVehicleRender:
         #painter.drawLine(0,-1000,0,1000)
         #painter.restore()
 
+        steeringAngle = self.getPose().steeringAngle
+
         painter.save()
         painter.translate(0, -self.parent.wheelTread/2+self.axleWidth/2)
-        painter.rotate(self.parent.steeringAngle)
+        painter.rotate(steeringAngle)
 
         painter.drawRect(int(-self.parent.wheelDiameter/2),
                          int(-self.axleWidth/2),
@@ -205,7 +629,7 @@ class SimpleVehicleRender:
 
         painter.save()
         painter.translate(0, self.parent.wheelTread/2-self.axleWidth/2)
-        painter.rotate(self.parent.steeringAngle)
+        painter.rotate(steeringAngle)
 
         painter.drawRect(int(-self.parent.wheelDiameter/2),
                          int(-self.axleWidth/2),
@@ -232,3 +656,64 @@ class SimpleVehicleRender:
                          int(self.parent.wheelTread/2-self.axleWidth),
                          int(self.parent.wheelDiameter),
                          int(self.axleWidth))
+
+class LidarOverlayRender:
+    """
+    Draws the hits of the latest completed scan of a ScanBuffer as points.
+    The point list is only rebuilt when a new scan was published and drawn
+    with a single drawPoints call.
+    """
+    def __init__(self, scanBuffer, color=QColor(0, 200, 0), pointSize=3):
+        self.scanBuffer = scanBuffer
+        self.pen = QPen(color, pointSize)
+        self.pen.setCosmetic(True)
+
+        self.scan = None
+        self.points = QPolygonF()
+        self.bounds = None
+        #Scale of the last drawing, the point size is in screen pixels
+        self.scale = 1.0
+
+    def update(self):
+        """
+        Take the latest scan from the buffer, if there is a new one
+        """
+        scan = self.scanBuffer.getLatest()
+        if scan is None or scan is self.scan:
+            return
+        self.scan = scan
+
+        points = []
+        for i, distance in enumerate(scan.ranges):
+            if math.isinf(distance):
+                continue
+            rad = math.radians(scan.angle + i * scan.angleIncrement)
+            points.append((scan.x + distance * math.cos(rad),
+                           scan.y + distance * math.sin(rad)))
+
+        #The sensor position keeps the bounds valid without hits
+        xs = [point[0] for point in points] + [scan.x]
+        ys = [point[1] for point in points] + [scan.y]
+        self.bounds = (min(xs), min(ys), max(xs), max(ys))
+        self.points = QPolygonF([QPointF(x, y) for x, y in points])
+
+    def getRenderState(self):
+        self.update()
+        return self.scan.sequence if self.scan else None
+
+    def getBounds(self):
+        self.update()
+        if self.bounds is None:
+            return (0.0, 0.0, 0.0, 0.0)
+        margin = (self.pen.widthF() + 1) / self.scale
+        minX, minY, maxX, maxY = self.bounds
+        return minX - margin, minY - margin, maxX + margin, maxY + margin
+
+    def drawMain(self, painter, scale=1.0):
+        self.scale = scale
+        if self.points.isEmpty():
+            return
+        painter.save()
+        painter.setPen(self.pen)
+        painter.drawPoints(self.points)
+        painter.restore()
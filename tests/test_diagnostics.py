@@ -0,0 +1,39 @@
+import pytest
+
+from Diagnostics import Diagnostics, DEBUG, INFO, OFF
+
+def test_diagnostics_levels():
+    diag = Diagnostics()
+    diag.setConsole(False)
+    physics = diag.getChannel("physics")
+
+    physics.debug("hidden {x}", x=1)
+    assert not physics.debugOn
+    assert diag.memory.snapshot() == []
+
+    diag.configure("physics=debug")
+    assert physics.debugOn and physics.level == DEBUG
+    physics.debug("shown {x}", x=2)
+    records = diag.memory.snapshot()
+    assert len(records) == 1
+    assert records[0].channel == "physics"
+    assert records[0].fields == {"x": 2}
+
+    diag.configure("*=off")
+    assert all(channel.level == OFF for channel in diag.channels.values())
+
+def test_diagnostics_rate_limit():
+    diag = Diagnostics()
+    diag.setConsole(False)
+    diag.configure("sensors=info@0.001")
+    sensors = diag.getChannel("sensors")
+    for i in range(100):
+        sensors.info("scan {i}", i=i)
+    sensors.info("other")
+    assert len(diag.memory.snapshot()) == 2
+    assert sensors.suppressed == 99
+    assert sensors.level == INFO
+
+def test_diagnostics_bad_level():
+    with pytest.raises(ValueError):
+        Diagnostics().configure("physics=loud")
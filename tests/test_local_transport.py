@@ -0,0 +1,99 @@
+import math
+import time
+from array import array
+from types import SimpleNamespace
+
+import pytest
+
+from SimEngine import SimEngine
+from Vehicle import Vehicle
+from Utils import Vector2D
+import LocalTransport
+from LocalTransport import LocalClient
+
+CAR = {"width": 80.0, "length": 150.0, "mass": 20.0, "friction": 25.0,
+       "steeringAngle": 30.0, "wheelDiameter": 20.0}
+
+@pytest.fixture
+def transport(tmp_path):
+    simEngine = SimEngine(interval=0.01)
+    cars = [Vehicle((100, 200), 90, CAR), Vehicle((0, 0), 0, CAR)]
+    server = LocalTransport.LocalTransport(simEngine, str(tmp_path / "sim.sock"))
+    server.addVehicle(cars[0], "truck1")
+    server.addVehicle(cars[1], "truck2")
+    server.start()
+    yield simEngine, cars, server
+    server.stop()
+
+def waitFor(condition):
+    for _ in range(100):
+        if condition():
+            return
+        time.sleep(0.01)
+    raise AssertionError("Timed out")
+
+def receiveTopic(client, topic):
+    while True:
+        message = client.receive(timeout=1.0)
+        assert message is not None
+        if message.topic == topic:
+            return message
+
+def test_state_and_commands(transport):
+    simEngine, cars, server = transport
+    with LocalClient(server.path) as client, LocalClient(server.path) as other:
+        assert client.getVehicles() == ["truck1", "truck2"]
+        client.subscribe([LocalTransport.ODOM], "truck1")
+        other.subscribe([LocalTransport.POSE, LocalTransport.LIDAR])
+        waitFor(lambda: server.mask == LocalTransport.topicMask(
+            [LocalTransport.ODOM, LocalTransport.POSE, LocalTransport.LIDAR]))
+
+        simEngine.step()
+        message = receiveTopic(client, LocalTransport.ODOM)
+        assert message.vehicle == 0
+        assert message.stamp == pytest.approx(0.01)
+        assert (message.data.x, message.data.y) == pytest.approx((1.0, 2.0))
+        assert message.data.yaw == pytest.approx(math.pi / 2)
+        #Both vehicles go to the subscriber of all of them
+        assert {receiveTopic(other, LocalTransport.POSE).vehicle for _ in range(2)} == {0, 1}
+
+        lidar = SimpleNamespace(vehicle=cars[1], angleMin=-45.0, rayAngleIncrement=1,
+                                mountAngle=180.0, offset=Vector2D(-350.0, 20.0))
+        assert server.wantsLidar(lidar)
+        assert not server.wantsLidar(SimpleNamespace(vehicle=object()))
+        server.publishLidar(array('f', [1.5, math.inf]), lidar, 0.5, 0.1)
+        scan = receiveTopic(other, LocalTransport.LIDAR)
+        assert scan.vehicle == 1 and scan.stamp == 0.5
+        assert scan.data.ranges[0] == 1.5 and math.isinf(scan.data.ranges[1])
+        assert scan.data.angleIncrement == pytest.approx(math.radians(1))
+        #In the vehicle frame, a rear lidar looks backwards from the rear
+        assert (scan.data.x, scan.data.y) == pytest.approx((-3.5, 0.2))
+        assert scan.data.angleMin == pytest.approx(math.radians(135))
+
+        #Commands wait for the next tick, the first odometry after it
+        #completes the latency measurement
+        client.sendCmdVel("truck1", 0.5, 0.25)
+        waitFor(lambda: simEngine.commands.pending)
+        assert cars[0].throttle == 0
+        simEngine.step()
+        assert cars[0].throttle == 0.5
+        assert cars[0].getSteering() == pytest.approx(0.5)
+        receiveTopic(client, LocalTransport.ODOM)
+        metrics = simEngine.commands.getMetrics()
+        assert metrics["apply"]["count"] == 1 and metrics["odometry"]["count"] == 1
+        assert metrics["odometry"]["max"] >= metrics["apply"]["max"]
+
+def test_malformed_frames_are_dropped(transport):
+    simEngine, cars, server = transport
+    with LocalClient(server.path) as client:
+        for topic in (LocalTransport.SUBSCRIBE, LocalTransport.CMD_VEL):
+            client.sock.sendall(LocalTransport.HEADER.pack(topic, 0, 0.0) + b"\x01")
+        client.sock.sendall(b"\x07")
+        #The server keeps serving the same and new clients
+        client.sendCmdVel("truck1", 0.5, 0.0)
+        waitFor(lambda: simEngine.commands.pending)
+        with LocalClient(server.path) as other:
+            assert other.getVehicles() == ["truck1", "truck2"]
+    assert server.thread.is_alive()
+    simEngine.step()
+    assert cars[0].throttle == 0.5
@@ -0,0 +1,89 @@
+import math
+
+from OccupancyGrid import OccupancyGrid
+from SceneObjects import SceneObject
+
+def wall(x, y, angle, length, width=10.0):
+    return SceneObject([x, y], angle, {"width": width, "length": length})
+
+def test_grid_clearance():
+    walls = [wall(500, 500, 0, 400)]
+    grid = OccupancyGrid.fromObjects(walls, resolution=5.0, maxDistance=300.0, margin=200)
+
+    assert grid.isOccupied(500, 500)
+    assert not grid.isOccupied(500, 600)
+    assert grid.clearance(500, 500) == 0.0
+    #Wall spans y 495..505, the cell centers are at most one cell off
+    assert abs(grid.clearance(500, 600) - 95) <= 5
+    assert abs(grid.clearance(200, 500) - 100) <= 5
+    assert grid.clearance(500, 10000) == 0.0
+    assert grid.clearances([(500, 500), (500, 600)]) == [grid.clearance(500, 500),
+                                                        grid.clearance(500, 600)]
+
+def test_grid_saturation():
+    grid = OccupancyGrid.fromObjects([wall(0, 0, 0, 10)], resolution=10.0,
+                                     maxDistance=50.0, margin=500)
+    assert grid.clearance(400, 400) == 50.0
+
+def test_grid_incremental_matches_rebuild():
+    walls = [wall(300, 300, 30, 300), wall(600, 500, 90, 400)]
+    extra = wall(450, 350, -45, 200)
+    area = (0, 0, 1000, 1000)
+
+    grid = OccupancyGrid(area, resolution=10.0, maxDistance=150.0)
+    for obj in walls:
+        grid.rasterize(obj)
+    grid.computeRegion(0, 0, grid.cols, grid.rows)
+
+    grid.addObject(extra)
+    full = OccupancyGrid(area, resolution=10.0, maxDistance=150.0)
+    for obj in walls + [extra]:
+        full.rasterize(obj)
+    full.computeRegion(0, 0, full.cols, full.rows)
+    assert grid.counts == full.counts
+    assert all(math.isclose(a, b, abs_tol=1e-3) for a, b in zip(grid.distances, full.distances))
+
+    grid.removeObject(extra)
+    base = OccupancyGrid(area, resolution=10.0, maxDistance=150.0)
+    for obj in walls:
+        base.rasterize(obj)
+    base.computeRegion(0, 0, base.cols, base.rows)
+    assert grid.counts == base.counts
+    assert all(math.isclose(a, b, abs_tol=1e-3) for a, b in zip(grid.distances, base.distances))
+
+def test_grid_pgm_export(tmp_path):
+    grid = OccupancyGrid.fromObjects([wall(100, 100, 0, 100)], resolution=10.0)
+    base = str(tmp_path / "map")
+    grid.savePgm(base)
+
+    with open(base + ".pgm", "rb") as file:
+        data = file.read()
+    header = f"P5\n{grid.cols} {grid.rows}\n255\n".encode("ascii")
+    assert data.startswith(header)
+    pixels = data[len(header):]
+    assert len(pixels) == grid.cols * grid.rows
+    assert 0 in pixels and 254 in pixels
+
+    with open(base + ".yaml", "r", encoding="utf-8") as file:
+        text = file.read()
+    assert "image: map.pgm" in text
+    assert "resolution: 0.1" in text
+
+def test_grid_grows_for_objects_outside():
+    walls = [wall(300, 300, 30, 300)]
+    outside = wall(1500, -400, 0, 200)
+    grid = OccupancyGrid.fromObjects(walls, resolution=10.0, maxDistance=150.0)
+    grid.addObject(outside)
+    assert grid.isOccupied(1500, -400)
+
+    full = OccupancyGrid((grid.originX, grid.originY,
+                          grid.originX + grid.cols * 10.0, grid.originY + grid.rows * 10.0),
+                         resolution=10.0, maxDistance=150.0)
+    for obj in walls + [outside]:
+        full.rasterize(obj)
+    full.computeRegion(0, 0, full.cols, full.rows)
+    assert grid.counts == full.counts
+    assert all(math.isclose(a, b, abs_tol=1e-3) for a, b in zip(grid.distances, full.distances))
+
+    grid.removeObject(walls[0])
+    assert not grid.isOccupied(300, 300)
@@ -0,0 +1,59 @@
+import os
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+QtGui = pytest.importorskip("PyQt5.QtGui")
+
+# pylint: disable=wrong-import-position
+from SimEngine import SimEngine
+from SceneObjects import SceneObject
+from VehicleRender import RectangleRender
+from OffscreenRenderer import OffscreenRenderer, FrameWriter
+
+APP = QtGui.QGuiApplication.instance() or QtGui.QGuiApplication([])
+
+def makeScene():
+    simEngine = SimEngine()
+    wall = SceneObject((100, 100), 0, {"width": 20, "length": 200})
+    simEngine.registerStaticObject(wall)
+    return simEngine, [RectangleRender(wall, {"color": [0, 0, 255]})]
+
+def test_render_frame_fits_scene(tmp_path):
+    simEngine, renders = makeScene()
+    renderer = OffscreenRenderer(simEngine, FrameWriter(str(tmp_path)), size=(64, 48))
+    renderer.addRenders(renders, static=True)
+
+    image = renderer.renderFrame()
+    assert (image.width(), image.height()) == (64, 48)
+    #The wall fills the frame width, its center is blue
+    assert QtGui.QColor(image.pixel(32, 5)).blue() == 255
+    assert QtGui.QColor(image.pixel(32, 5)).red() == 0
+
+def test_frame_writer_outputs(tmp_path):
+    simEngine, renders = makeScene()
+    for path in (str(tmp_path / "png"), str(tmp_path / "video.raw")):
+        writer = FrameWriter(path)
+        renderer = OffscreenRenderer(simEngine, writer, size=(32, 16))
+        renderer.addRenders(renders, static=True)
+        for _ in range(3):
+            renderer.capture()
+        writer.close()
+        assert writer.written + writer.dropped == 3
+
+    assert sorted(os.listdir(tmp_path / "png"))[0] == "frame_000000.png"
+    assert os.path.getsize(tmp_path / "video.raw") % (32 * 16 * 4) == 0
+
+def test_dropped_frames_leave_no_gaps(tmp_path):
+    simEngine, renders = makeScene()
+    writer = FrameWriter(str(tmp_path), maxPending=0)
+    renderer = OffscreenRenderer(simEngine, writer, size=(32, 16))
+    renderer.addRenders(renders, static=True)
+    renderer.capture()
+    assert writer.dropped == 1 and renderer.frameIndex == 0
+
+    writer.maxPending = 8
+    for _ in range(3):
+        renderer.capture()
+    writer.close()
+    assert sorted(os.listdir(tmp_path)) == [f"frame_{i:06d}.png" for i in range(3)]
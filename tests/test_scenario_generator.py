@@ -0,0 +1,42 @@
+import pytest
+import yaml
+
+from ScenarioGenerator import LAYOUTS, generateScenario, writeScenario
+
+@pytest.mark.parametrize("layout", sorted(LAYOUTS))
+def test_generator_schema(layout):
+    data = generateScenario(layout, 200, vehicles=3, seed=1)
+    assert {alias["name"] for alias in data["aliases"]} >= {"Wall", "DrivableCar"}
+    for alias in data["aliases"]:
+        assert {"name", "type", "render", "model"} <= set(alias)
+
+    static = data["objects"]["static"]
+    dynamic = data["objects"]["dynamic"]
+    assert len(static) >= 150
+    assert len(dynamic) == 3
+    assert dynamic[0]["name"] == "MainVehicle"
+    for obj in static + dynamic:
+        assert set(obj) >= {"alias", "loc", "angle", "dim"}
+        assert len(obj["loc"]) == 2
+        assert len(obj["dim"]) == 2
+
+@pytest.mark.parametrize("layout", sorted(LAYOUTS))
+def test_generator_seeded(layout):
+    assert generateScenario(layout, 100, 2, seed=5) == generateScenario(layout, 100, 2, seed=5)
+    assert generateScenario(layout, 100, 2, seed=5) != generateScenario(layout, 100, 2, seed=6)
+
+def test_generator_clutter_count():
+    data = generateScenario("clutter", 5000, vehicles=10, seed=2)
+    #Clutter plus the four boundary walls
+    assert len(data["objects"]["static"]) == 5004
+
+def test_generator_unknown_layout():
+    with pytest.raises(ValueError):
+        generateScenario("spiral", 10)
+
+def test_generator_roundtrip(tmp_path):
+    data = generateScenario("maze", 50, vehicles=1, seed=3)
+    path = tmp_path / "maze.yaml"
+    writeScenario(data, path)
+    with open(path, "r", encoding="utf-8") as file:
+        assert yaml.safe_load(file) == data
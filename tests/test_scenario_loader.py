@@ -0,0 +1,50 @@
+import os
+
+import pytest
+
+import ScenarioLoader
+from ScenarioLoader import ScenarioLoader as Loader, registerObjectType, resolveType
+from ScenarioGenerator import generateScenario, writeScenario
+from SceneObjects import SceneObject
+from SimEngine import SimEngine
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WALL_MODEL = os.path.join(ROOT, "models", "wall.yaml")
+
+class Bollard(SceneObject):
+    pass
+
+def writeWalls(tmp_path, count, aliasType="SceneObject"):
+    data = generateScenario("clutter", count, vehicles=0, seed=4)
+    data["aliases"] = [{"name": "Wall", "type": aliasType,
+                        "render": "RectangleRender", "model": WALL_MODEL}]
+    path = tmp_path / "walls.yaml"
+    writeScenario(data, path)
+    return str(path), data
+
+def test_loader_bulk_static(tmp_path):
+    path, data = writeWalls(tmp_path, 500)
+    calls = []
+    engine = SimEngine()
+    Loader(path).instantiateScenario(engine, None,
+                                     progress=lambda *args: calls.append(args))
+
+    static = engine.getStaticObjects()
+    assert len(static) == len(data["objects"]["static"])
+    assert calls == [("static", len(static), len(static))]
+    for obj, entry in zip(static, data["objects"]["static"]):
+        assert obj.pos.extract() == tuple(entry["loc"])
+        assert (obj.width, obj.length) == tuple(entry["dim"])
+        assert obj.getAlias().getName() == "Wall"
+
+def test_loader_plugin_type(tmp_path):
+    registerObjectType("Bollard", Bollard)
+    path, _ = writeWalls(tmp_path, 10, aliasType="Bollard")
+    engine = SimEngine()
+    Loader(path).instantiateScenario(engine, None, progress=None)
+    assert all(isinstance(obj, Bollard) for obj in engine.getStaticObjects())
+
+def test_resolve_type_import_path():
+    assert resolveType(ScenarioLoader.OBJECT_TYPES, "SceneObjects:SceneObject") is SceneObject
+    with pytest.raises(ValueError):
+        resolveType(ScenarioLoader.OBJECT_TYPES, "NoSuchType")
@@ -0,0 +1,176 @@
+import math
+from types import SimpleNamespace
+
+import pytest
+
+from Sensors import Lidar, ScanBuffer, Ultrasonic, Bumper, SensorManager, createSensors
+from SimEngine import SimEngine
+from SceneObjects import SceneObject
+
+def test_scan_buffer_publishes_immutable_scans():
+    buffer = ScanBuffer()
+    assert buffer.getLatest() is None
+
+    ranges = [1.0, 2.0]
+    buffer.publish(0.5, 10.0, 20.0, 90.0, 1.0, ranges)
+    scan = buffer.getLatest()
+    ranges[0] = 5.0
+    assert scan.sequence == 1
+    assert scan.ranges == (1.0, 2.0)
+
+    buffer.publish(0.6, 10.0, 20.0, 90.0, 1.0, ranges)
+    assert buffer.getLatest().sequence == 2
+    #Readers holding the old scan keep a consistent copy
+    assert scan.ranges == (1.0, 2.0)
+
+def test_lidar_scan_hits_wall():
+    simEngine = SimEngine()
+    wall = SceneObject((100, 0), 90, {"width": 10, "length": 200})
+    simEngine.registerStaticObject(wall)
+    lidar = Lidar(None)
+
+    ranges = lidar.scan(0, 0, 0, simEngine.getAllObjects())
+    assert ranges[0] == pytest.approx(95.0)
+    assert math.isinf(ranges[180])
+    #Meters for ROS are filled by the same pass, into the same buffers
+    assert lidar.rosRanges[0] == pytest.approx(0.95)
+    assert lidar.scan(0, 0, 0, simEngine.getAllObjects()) is ranges
+
+def test_lidar_config_and_rotating_sweep():
+    simEngine = SimEngine(interval=0.01)
+    wall = SceneObject((100, 0), 90, {"width": 10, "length": 200})
+    simEngine.registerStaticObject(wall)
+    carrier = SceneObject((0, 0), 0, {"width": 10, "length": 10})
+    lidar = Lidar(carrier, data={"fov": 90.0, "resolution": 0.5, "range": 80.0,
+                                 "offset": [20.0, 0.0], "rate": 10.0, "mode": "rotating"})
+    assert lidar.numRays == 181 and lidar.angleMin == -45.0
+
+    x, y, angle = lidar.getSensorPose()
+    assert (x, y, angle) == (20.0, 0.0, 0.0)
+    #The center ray hits at 75, the edge rays are out of range
+    ranges = lidar.scan(x, y, angle, simEngine.getAllObjects())
+    assert ranges[90] == pytest.approx(75.0)
+    assert math.isinf(ranges[0])
+
+    #A revolution takes 10 ticks, the scan is published when it completes
+    manager = SensorManager(simEngine)
+    manager.addSensor(lidar)
+    lidar.addConsumer("test")
+    manager.sample(simEngine.simTime)
+    for ticks in range(1, 20):
+        simEngine.step()
+        manager.sample(simEngine.simTime)
+        if lidar.getScanBuffer().getLatest():
+            break
+    assert ticks in (10, 11)
+    scan = lidar.getScanBuffer().getLatest()
+    assert scan.stamp == 0.0
+    assert scan.angle == -45.0
+    assert scan.ranges[90] == pytest.approx(75.0)
+
+def test_sensor_manager_batches_vehicles():
+    simEngine = SimEngine(interval=0.01)
+    walls = [SceneObject((i * 300, 0), 90, {"width": 10, "length": 200}) for i in range(3)]
+    simEngine.registerStaticObjects(walls)
+    cars = [SceneObject((i * 300 - 100, 0), 0, {"width": 20, "length": 40}) for i in range(3)]
+    simEngine.registerDynamicObjects(cars)
+
+    manager = SensorManager(simEngine)
+    lidars = [Lidar(car, {"range": 500.0}) for car in cars]
+    ultrasonic = Ultrasonic(cars[0], {"offset": [20.0, 0.0]})
+    bumper = Bumper(cars[1], {"offset": [20.0, 0.0], "range": 100.0})
+    manager.addSensors(lidars + [ultrasonic, bumper])
+    for sensor in manager.getSensors():
+        sensor.addConsumer("test")
+    manager.sample(0.0)
+
+    #Same result as scanning each lidar against every object on its own
+    for car, lidar in zip(cars, lidars):
+        batched = list(lidar.ranges)
+        expected = lidar.scan(*lidar.getSensorPose(), simEngine.getAllObjects(), [car])
+        assert batched == list(expected)
+    assert ultrasonic.getLatest().value == pytest.approx(75.0)
+    assert bumper.getLatest().value is True
+
+    #Not due again until their interval passed
+    assert not manager.getSensors(cars[0])[0].getSectors(0.001)
+    walls[1].pos.x += 1000
+    simEngine.moveStaticObjects([walls[1]])
+    manager.sample(0.1)
+    assert bumper.getLatest().value is False
+
+def test_incremental_scans_recast_only_changed_rays():
+    simEngine = SimEngine(interval=0.01)
+    simEngine.registerStaticObject(SceneObject((300, 0), 90, {"width": 10, "length": 600}))
+    car = SceneObject((0, 0), 0, {"width": 20, "length": 40})
+    other = SceneObject((0, 200), 0, {"width": 20, "length": 40})
+    simEngine.registerDynamicObjects([car, other])
+
+    manager = SensorManager(simEngine)
+    lidar = Lidar(car, {"range": 500.0})
+    manager.addSensor(lidar)
+    lidar.addConsumer("test")
+    manager.sample(0.0)
+    assert manager.caster.fullScans == 1
+
+    #Nothing moved, the previous scan is kept
+    manager.sample(1.0)
+    assert manager.caster.reusedScans == 1
+
+    #Only the rays around the old and new place of the other car are cast
+    other.pos.x += 30
+    manager.sample(2.0)
+    assert manager.caster.partialScans == 1
+    assert 0 < manager.caster.recastRays < 90
+    incremental = list(lidar.ranges)
+    expected = lidar.scan(*lidar.getSensorPose(), simEngine.getAllObjects(), [car])
+    assert incremental == list(expected)
+
+    car.pos.x += 10
+    manager.sample(3.0)
+    assert manager.caster.fullScans == 2
+
+def test_sensors_are_sampled_on_demand():
+    simEngine = SimEngine(interval=0.01)
+    simEngine.registerStaticObject(SceneObject((100, 0), 90, {"width": 10, "length": 200}))
+    car = SceneObject((0, 0), 0, {"width": 20, "length": 40})
+    manager = SensorManager(simEngine)
+    lidar = Lidar(car)
+    ultrasonic = Ultrasonic(car, {"offset": [20.0, 0.0]})
+    manager.addSensors([lidar, ultrasonic])
+
+    #Without consumers nothing is cast
+    manager.sample(0.0)
+    assert lidar.getScanBuffer().getLatest() is None
+    assert ultrasonic.getLatest() is None
+
+    #A request is answered once
+    ultrasonic.request()
+    manager.sample(1.0)
+    manager.sample(2.0)
+    assert ultrasonic.getLatest().sequence == 1
+    assert ultrasonic.getLatest().value == pytest.approx(75.0)
+
+    #Consumers are asked every tick, e.g. for subscribers of a topic
+    subscribers = []
+    lidar.addConsumer("topic", lambda: bool(subscribers))
+    manager.sample(3.0)
+    assert lidar.getScanBuffer().getLatest() is None
+    subscribers.append("node")
+    lidar.addConsumer("overlay")
+    manager.sample(4.0)
+    assert lidar.getScanBuffer().getLatest().sequence == 1
+    lidar.removeConsumer("overlay")
+    subscribers.clear()
+    manager.sample(5.0)
+    assert lidar.getScanBuffer().getLatest().sequence == 1
+
+def test_sensor_names_are_unique_per_vehicle():
+    vehicle = SimpleNamespace(
+        sensorData=[{"type": "lidar", "angle": 180.0}, {"type": "lidar", "name": "lidar"},
+                    {"type": "ultrasonic"}, {"type": "ultrasonic"}, {"type": "radar"}],
+        lidarData={"fov": 270.0})
+    sensors = createSensors(vehicle)
+    assert [sensor.name for sensor in sensors] == ["lidar", "lidar_1", "ultrasonic",
+                                                   "ultrasonic_1", "lidar_2"]
+    assert sensors[-1].fov == 270.0
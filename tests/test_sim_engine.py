@@ -0,0 +1,132 @@
+from types import SimpleNamespace
+
+import pytest
+
+from SimEngine import SimEngine, RenderEngine, interpolatePose
+from SceneObjects import SceneObject, Pose
+
+def test_interpolate_pose_shortest_arc():
+    a = Pose(0.0, 0.0, 350.0, 0.0)
+    b = Pose(10.0, 20.0, 10.0, 30.0)
+    pose = interpolatePose(a, b, 0.5)
+    assert pose.x == pytest.approx(5.0)
+    assert pose.y == pytest.approx(10.0)
+    assert pose.angle % 360 == pytest.approx(0.0)
+    assert pose.steeringAngle == pytest.approx(15.0)
+    assert interpolatePose(a, b, 1.0).angle % 360 == pytest.approx(10.0)
+
+def test_render_engine_interpolates_snapshots():
+    obj = SceneObject((0, 0), 0, {"width": 10, "length": 20})
+    engine = SimEngine(interval=0.1)
+    engine.registerDynamicObject(obj)
+
+    engine.takeSnapshot(1.0)
+    obj.pos.x = 100.0
+    engine.takeSnapshot(1.1)
+
+    render = SimpleNamespace(parent=obj, pose=None)
+    renderEngine = RenderEngine()
+    renderEngine.registerObject(render)
+
+    renderEngine.updatePoses(engine.getSnapshots(), 1.05)
+    assert render.pose.x == pytest.approx(50.0)
+    #No extrapolation past the latest state
+    renderEngine.updatePoses(engine.getSnapshots(), 2.0)
+    assert render.pose.x == pytest.approx(100.0)
+    assert obj.getBounds(render.pose) == obj.getBounds()
+
+    renderEngine.updatePoses((None, None), 2.0)
+    assert render.pose is None
+
+def test_sim_engine_step_counts_sim_time():
+    engine = SimEngine(interval=1.0 / 30)
+    for _ in range(30):
+        engine.step()
+    assert engine.tickCount == 30
+    assert engine.simTime == pytest.approx(1.0)
+
+class FakeRender:
+    def __init__(self, parent):
+        self.parent = parent
+
+    def getBounds(self):
+        return self.parent.getBounds()
+
+def test_static_picking_and_editing():
+    simEngine = SimEngine()
+    renderEngine = RenderEngine()
+    walls = [SceneObject((i * 100, 0), 45, {"width": 10, "length": 50}) for i in range(5)]
+    simEngine.registerStaticObjects(walls)
+    renderEngine.registerObjects([FakeRender(obj) for obj in walls], static=True)
+    grid = simEngine.getOccupancyGrid()
+
+    assert simEngine.pickStatic(100, 0) == [walls[1]]
+    #Inside the bounding box but outside the rotated rectangle
+    assert simEngine.pickStatic(115, -15) == []
+    assert len(simEngine.queryStatic((-10, -10, 210, 10))) == 3
+
+    walls[0].pos.x += 1000
+    simEngine.moveStaticObjects(walls[:1])
+    renderEngine.moveStaticObjects([renderEngine.getRender(walls[0])])
+    assert simEngine.pickStatic(1000, 0) == [walls[0]]
+    assert renderEngine.staticIndex.queryPoint(1000, 0)[0].parent is walls[0]
+    #The grid grows to the new place, the old footprint is cleared
+    assert not grid.isOccupied(0, 0) and grid.isOccupied(100, 0)
+    assert grid.isOccupied(1000, 0)
+
+    renderEngine.unregisterObjects([renderEngine.getRender(obj) for obj in walls[:2]], static=True)
+    simEngine.unregisterStaticObjects(walls[:2])
+    assert simEngine.staticObjects == walls[2:]
+    assert len(renderEngine.staticObjects) == 3
+    assert simEngine.pickStatic(100, 0) == []
+    assert renderEngine.collectDirtyRects()
+
+def test_tick_listeners_and_real_time_factor():
+    engine = SimEngine(interval=0.01, realTimeFactor=0)
+    ticks = []
+    engine.addTickListener(ticks.append)
+    engine.step()
+    assert ticks == [pytest.approx(0.01)]
+    engine.removeTickListener(ticks.append)
+    engine.step()
+    assert len(ticks) == 1
+
+    #Unthrottled, a second of simulation takes far less wall time
+    engine.startThreaded()
+    assert engine.waitUntil(1.0, timeout=5.0)
+    engine.stop()
+    engine.wait()
+    assert not engine.waitUntil(engine.simTime + 1.0, timeout=0.01)
+
+def test_commands_apply_at_tick_start():
+    engine = SimEngine(interval=0.01)
+    vehicle = SimpleNamespace(throttle=0.0, steering=0.0)
+    vehicle.setThrottle = lambda value: setattr(vehicle, "throttle", value)
+    vehicle.setSteering = lambda value: setattr(vehicle, "steering", value)
+    vehicle.getSteering = lambda: vehicle.steering
+
+    engine.commands.submit(vehicle, throttle=1.0, steering=0.5)
+    engine.commands.submit(vehicle, steering=-0.5)
+    assert vehicle.throttle == 0.0
+    engine.step()
+    assert (vehicle.throttle, vehicle.steering) == (1.0, -0.5)
+
+    #Key presses queued within one tick all count
+    for _ in range(3):
+        engine.commands.submit(vehicle, steeringDelta=0.25)
+    engine.step()
+    assert vehicle.steering == 0.25
+
+    engine.commands.odometryPublished(vehicle)
+    engine.commands.odometryPublished(vehicle)
+    metrics = engine.commands.getMetrics()
+    assert metrics["apply"]["count"] == 5
+    #Only the first odometry after the tick reflects the commands
+    assert metrics["odometry"]["count"] == 1
+
+def test_ticks_per_period():
+    engine = SimEngine(interval=1.0 / 60)
+    assert engine.ticksPerPeriod(20.0) == 3
+    assert engine.ticksPerPeriod(None) == 1
+    #Faster than the physics still publishes once per tick
+    assert engine.ticksPerPeriod(200.0) == 1
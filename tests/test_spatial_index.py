@@ -0,0 +1,49 @@
+from SpatialIndex import (SpatialIndex, boundsIntersect, boundsCorners,
+                          pointInPolygon, polygonsIntersect)
+
+def test_spatial_index_query():
+    index = SpatialIndex(cellSize=100)
+    items = {name: object() for name in "abc"}
+    index.insert(items["a"], (0, 0, 50, 50))
+    index.insert(items["b"], (90, 90, 310, 120))
+    index.insert(items["c"], (1000, 1000, 1010, 1010))
+
+    assert len(index) == 3
+    assert index.query((0, 0, 10, 10)) == [items["a"]]
+    assert index.query((200, 100, 205, 105)) == [items["b"]]
+    assert {id(item) for item in index.query((0, 0, 400, 400))} == {id(items["a"]), id(items["b"])}
+    #Same cell as "a" but outside its bounds
+    assert index.query((60, 60, 70, 70)) == []
+    assert index.queryPoint(1005, 1005) == [items["c"]]
+
+def test_spatial_index_update_remove():
+    index = SpatialIndex(cellSize=100)
+    item = object()
+    index.insert(item, (0, 0, 10, 10))
+    index.update(item, (500, 500, 510, 510))
+    assert index.query((0, 0, 10, 10)) == []
+    assert index.query((505, 505, 506, 506)) == [item]
+    assert index.getBounds(item) == (500, 500, 510, 510)
+
+    index.remove(item)
+    assert item not in index
+    assert index.query((0, 0, 1000, 1000)) == []
+    assert not index.cells
+
+def test_bounds_intersect():
+    assert boundsIntersect((0, 0, 10, 10), (10, 10, 20, 20))
+    assert not boundsIntersect((0, 0, 10, 10), (11, 0, 20, 10))
+
+def test_polygon_helpers():
+    square = [(0, 0), (10, 0), (10, 10), (0, 10)]
+    assert pointInPolygon(5, 5, square)
+    assert pointInPolygon(10, 5, square)
+    assert not pointInPolygon(11, 5, square)
+
+    diamond = [(15, 5), (20, 0), (25, 5), (20, 10)]
+    assert not polygonsIntersect(square, diamond)
+    #The bounding boxes overlap, the rotated square does not reach the corner
+    rotated = [(14, 8), (17, 11), (14, 14), (11, 11)]
+    assert not polygonsIntersect(square, rotated)
+    assert polygonsIntersect(square, [(8, 8), (12, 8), (12, 12), (8, 12)])
+    assert boundsCorners((0, 0, 10, 10)) == square
@@ -0,0 +1,21 @@
+import math
+
+import pytest
+
+from Vehicle import Vehicle
+
+CAR = {"width": 80.0, "length": 150.0, "mass": 20.0, "friction": 25.0,
+       "steeringAngle": 30.0, "wheelDiameter": 20.0}
+
+@pytest.mark.parametrize("steering", [0.5, -1.0, 0.0])
+def test_yaw_rate_matches_heading_change(steering):
+    vehicle = Vehicle((0, 0), 45, CAR)
+    vehicle.setThrottle(1.0)
+    vehicle.setSteering(steering)
+    dt = 0.01
+    for _ in range(5):
+        angle = vehicle.getAngle()
+        vehicle.tick(dt)
+        rate = math.radians(vehicle.getAngle() - angle) / dt
+        assert vehicle.getYawRate() == pytest.approx(rate)
+    assert (vehicle.getYawRate() > 0) == (steering > 0)
@@ -0,0 +1,86 @@
+import os
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+QtGui = pytest.importorskip("PyQt5.QtGui")
+
+# pylint: disable=wrong-import-position
+from SimEngine import RenderEngine
+from SceneObjects import SceneObject
+from VehicleRender import RectangleRender, RectangleBatch, SpriteCache
+from RenderCache import StaticTileCache
+
+APP = QtGui.QGuiApplication.instance() or QtGui.QGuiApplication([])
+
+def makeWalls(count, spacing=20):
+    return [RectangleRender(SceneObject((i * spacing, 0), 0, {"width": 4, "length": 8}),
+                            {"color": [0, 0, 255]}) for i in range(count)]
+
+def test_batch_block_size():
+    assert RectangleBatch.blockSize(1.0) is None
+    assert RectangleBatch.blockSize(0.25) == 8.0
+    assert RectangleBatch.blockSize(1.0 / 32) == 64.0
+
+def test_render_engine_batches_static_rectangles():
+    renderEngine = RenderEngine()
+    renderEngine.setStaticBatch(RectangleBatch())
+    renderEngine.registerObjects(makeWalls(100), static=True)
+    assert len(renderEngine.staticBatch) == 100
+    assert len(renderEngine.staticIndex) == 0
+    assert renderEngine.sceneBounds[0] < 0 < renderEngine.sceneBounds[2]
+
+    image = QtGui.QImage(64, 64, QtGui.QImage.Format_ARGB32_Premultiplied)
+    for scale in (1.0, 1.0 / 32):
+        painter = QtGui.QPainter(image)
+        painter.scale(scale, scale)
+        drawn, culled = renderEngine.drawStatic(painter, (0, -32, 64 / scale, 32 / scale), scale)
+        painter.end()
+        assert drawn + culled == 100
+        #Zoomed out the whole row is inside the frame, at 1:1 only the
+        #first batch cell is
+        assert (drawn == 100) == (scale < 1)
+
+def test_static_batch_takes_registered_rectangles():
+    renderEngine = RenderEngine()
+    imageWall = RectangleRender(SceneObject((0, 0), 0, {"width": 4, "length": 8}),
+                                {"color": [0, 0, 255], "image": "models/white-truck.png"})
+    walls = makeWalls(3)
+    renderEngine.registerObjects([imageWall] + walls, static=True)
+    assert len(renderEngine.staticIndex) == 4
+
+    #Registered before and after the batch is set
+    renderEngine.setStaticBatch(RectangleBatch())
+    renderEngine.registerObjects(makeWalls(2), static=True)
+    assert len(renderEngine.staticBatch) == 6
+    assert len(renderEngine.staticIndex) == 0
+    #The image is only batched when zoomed out, at full detail it is drawn
+    #on its own, above the plain rectangles
+    assert renderEngine.staticBatch.isDetailed(imageWall)
+    assert renderEngine.detailIndex.query((-10, -10, 10, 10)) == [imageWall]
+
+def test_render_engine_counts_static_objects_unless_cached():
+    renderEngine = RenderEngine()
+    renderEngine.registerObjects(makeWalls(10), static=True)
+    image = QtGui.QImage(64, 64, QtGui.QImage.Format_ARGB32_Premultiplied)
+
+    painter = QtGui.QPainter(image)
+    renderEngine.draw(painter, (0, -32, 64, 32))
+    painter.end()
+    assert renderEngine.staticCounted
+    assert renderEngine.drawnCount + renderEngine.culledCount == 10
+
+    renderEngine.setStaticLayer(StaticTileCache(renderEngine.drawStatic))
+    painter = QtGui.QPainter(image)
+    renderEngine.draw(painter, (0, -32, 64, 32))
+    painter.end()
+    assert not renderEngine.staticCounted
+    assert renderEngine.drawnCount + renderEngine.culledCount == 0
+
+def test_sprite_angles_stay_within_half_a_step():
+    cache = SpriteCache(angleStep=50.0)
+    assert cache.quantize(340.0) == 350.0
+    assert cache.quantize(-10.0) == 0.0
+    for angle in range(-720, 720, 7):
+        error = (cache.quantize(angle) - angle + 180) % 360 - 180
+        assert abs(error) <= 25.0